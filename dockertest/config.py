@@ -10,16 +10,20 @@ unit-tested but not intended for wide-spread general use.
 # pylint: disable=W0403
 
 from ConfigParser import SafeConfigParser, NoSectionError
+from StringIO import StringIO
 from collections import MutableMapping
 import logging
+import marshal
+import os
 import os.path
 import sys
+import tempfile
 
 import xceptions
 
 
 #: Absolute path to directory containing this module
-MYDIR = os.path.dirname(sys.modules[__name__].__file__)
+MYDIR = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))
 
 #: Parent directory of directory containing this module
 PARENTDIR = os.path.dirname(MYDIR)
@@ -36,6 +40,93 @@ DEFAULTSUBDIR = 'defaults'
 #: Name of file holding special DEFAULTS section and options
 DEFAULTSFILE = 'defaults.ini'
 
+#: File path of compiled (parsed and type-converted) configuration cache
+CONFIGCACHE = os.path.join(PARENTDIR, '.config_cache')
+
+
+def config_files():
+    """
+    Return list of all config file paths, in loading order
+
+    Files under CONFIGCUSTOMS come last, so their sections take precedence.
+    """
+    filenames = []
+    for configdir in (CONFIGDEFAULT, CONFIGCUSTOMS):
+        for dirpath, dirnames, dirfiles in os.walk(configdir):
+            del dirnames  # not needed
+            for filename in dirfiles:
+                fullpath = os.path.join(dirpath, filename)
+                if filename.startswith('.') or not filename.endswith('.ini'):
+                    logging.warning("Skipping unknown config file '%s'",
+                                    fullpath)
+                    continue
+                filenames.append(fullpath)
+    return filenames
+
+
+def config_stamp(filenames=None):
+    """
+    Return sorted list of path, mtime, and size for every config file
+
+    :param filenames: List of config file paths, None for ``config_files()``
+    """
+    if filenames is None:
+        filenames = config_files()
+    stamp = []
+    for fullpath in filenames:
+        try:
+            stat = os.stat(fullpath)
+        except OSError:
+            continue  # Removed while walking
+        stamp.append((fullpath, stat.st_mtime, stat.st_size))
+    stamp.sort()
+    return stamp
+
+
+def index_file(filename, index):
+    """
+    Update index with location of every section in filename, w/o parsing it
+
+    Only section header lines are recognized, as by ``SafeConfigParser``.
+    Sections already in index (from previously loaded files) are replaced.
+
+    :param filename: Path to ini file
+    :param index: Dict of section name to tuple of filename and list of
+                  (start, end) byte offsets of each part of that section.
+    :return: index
+    """
+    extents = {}
+    section = None
+    start = offset = 0
+    config_file = open(filename, 'rb')
+    for line in config_file:
+        match = SafeConfigParser.SECTCRE.match(line)
+        if match:
+            if section is not None:
+                extents.setdefault(section, []).append((start, offset))
+            section = match.group('header')
+            start = offset
+        offset += len(line)
+    config_file.close()
+    if section is not None:
+        extents.setdefault(section, []).append((start, offset))
+    for section, section_extents in extents.items():
+        index[section] = (filename, section_extents)
+    return index
+
+
+def read_extents(filename, extents):
+    """
+    Return content of filename between each (start, end) offset in extents
+    """
+    config_file = open(filename, 'rb')
+    parts = []
+    for start, end in extents:
+        config_file.seek(start)
+        parts.append(config_file.read(end - start))
+    config_file.close()
+    return ''.join(parts)
+
 
 class ConfigSection(object):
     """
@@ -208,22 +299,43 @@ class ConfigDict(MutableMapping):
         """
         self._config_section = ConfigSection(defaults=defaults,
                                              section=section)
+        #: Private cache of all option names, None after any change
+        self._keys = None
+        #: Private cache of option name to converted value
+        self._values = {}
         super(ConfigDict, self).__init__(*args, **dargs)
 
     # Private method doesn't need docstring
     def _keyset(self):  # pylint: disable=C0111
-        mine = set([val.lower()
-                    for val in self._config_section.options()])
-        default = set([val.lower()
-                       for val in self._config_section.defaults().keys()])
-        complete = mine | default
-        return complete
+        if self._keys is None:
+            mine = set([val.lower()
+                        for val in self._config_section.options()])
+            default = set([val.lower()
+                           for val in self._config_section.defaults().keys()])
+            self._keys = frozenset(mine | default)
+        return self._keys
+
+    # Private method doesn't need docstring
+    def _invalidate(self):  # pylint: disable=C0111
+        self._keys = None
+        self._values = {}
+
+    # Private method doesn't need docstring
+    def _convert(self, key):  # pylint: disable=C0111
+        # No suffix calls regular get(), boolean wants to gobble '0' and '1' :(
+        for suffix in ('int', 'boolean', 'float', ''):
+            method = getattr(self._config_section, 'get%s' % suffix)
+            try:
+                return method(key)
+            except (ValueError, AttributeError):
+                continue
+        raise xceptions.DockerConfigError('', '', key)
 
     def __len__(self):
         return len(self._keyset())
 
     def __iter__(self):
-        return (option for option in self._keyset())
+        return iter(self._keyset())
 
     def __contains__(self, item):
         return item.lower() in self._keyset()
@@ -231,27 +343,35 @@ class ConfigDict(MutableMapping):
     def __getitem__(self, key):
         # ConfigParser forces this, force it so any errors are clear
         key = key.lower()
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
         # Don't call more methods than necessary
         if not self.__contains__(key):
             raise xceptions.DockerKeyError(key)
-        # No suffix calls regular get(), boolean wants to gobble '0' and '1' :(
-        for suffix in ('int', 'boolean', 'float', ''):
-            method = getattr(self._config_section, 'get%s' % suffix)
-            try:
-                return method(key)
-            except (ValueError, AttributeError):
-                continue
-        raise xceptions.DockerConfigError('', '', key)
+        # Each option is converted only once, until something changes
+        value = self._values[key] = self._convert(key)
+        return value
 
     def __setitem__(self, key, value):
+        self._invalidate()
         return self._config_section.set(key, str(value))
 
     def __delitem__(self, key):
+        self._invalidate()
         return self._config_section.remove_option(key)
 
+    def snapshot(self):
+        """
+        Return regular dict of all options, with converted values
+        """
+        return dict((key, self[key]) for key in self._keyset())
+
     def read(self, filelike):
         """Load configuration from file-like object filelike"""
         filelike.seek(0)
+        self._invalidate()
         return self._config_section.readfp(filelike)
 
     @staticmethod
@@ -261,6 +381,195 @@ class ConfigDict(MutableMapping):
                                        % filelike.name)
 
 
+class ConfigView(MutableMapping):
+    """
+    Copy-on-write dict-like over a chain of dict-like layers
+
+    Lookups search a private overlay, then each layer in turn, so the most
+    specific layer comes first (e.g. subsubtest, subtest, then defaults).
+    Modifications only ever land in the overlay, layers are never changed.
+    Creating a view (or a ``snapshot()``) copies nothing, no matter how many
+    options it covers.
+    """
+
+    def __init__(self, *layers):
+        r"""
+        Initialize a new view with empty overlay over layers
+
+        :param \*layers: Dict-likes, searched in the given order
+        """
+        #: Private, options assigned through this view
+        self._overlay = {}
+        #: Private, option names deleted through this view
+        self._deleted = set()
+        #: Private, tuple of dict-likes searched after _overlay
+        self._layers = layers
+        #: Private, view sharing _overlay, _deleted, and _layers, handed
+        #: out by snapshot() since the last modification, or None.
+        self._frozen = None
+        super(ConfigView, self).__init__()
+
+    # Private method doesn't need docstring
+    def _thaw(self):  # pylint: disable=C0111
+        # Leave current state to the snapshot(s), continue on top of it
+        if self._frozen is not None:
+            self._layers = (self._frozen,)
+            self._overlay = {}
+            self._deleted = set()
+            self._frozen = None
+
+    def __getitem__(self, key):
+        try:
+            return self._overlay[key]
+        except KeyError:
+            if key in self._deleted:
+                raise
+        for layer in self._layers:
+            try:
+                return layer[key]
+            except KeyError:
+                continue
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._thaw()
+        self._overlay[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._thaw()
+        self._overlay.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        if key in self._overlay:
+            return True
+        if key in self._deleted:
+            return False
+        for layer in self._layers:
+            if key in layer:
+                return True
+        return False
+
+    # Private method doesn't need docstring
+    def _keyset(self):  # pylint: disable=C0111
+        keys = set(self._overlay)
+        for layer in self._layers:
+            keys.update(layer)
+        return keys - self._deleted
+
+    def __len__(self):
+        return len(self._keyset())
+
+    def __iter__(self):
+        return iter(self._keyset())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def copy(self):
+        """
+        Return new (copy-on-write) view over this one
+        """
+        return ConfigView(self)
+
+    def snapshot(self):
+        """
+        Return new (copy-on-write) view of options as they are right now
+
+        Unlike ``copy()``, later modifications of this view are not seen
+        through the returned view.  Nothing is copied, instead the first
+        modification afterwards moves the current state beneath a new
+        overlay, shared by every snapshot taken until then.
+        """
+        if self._frozen is None:
+            frozen = ConfigView(*self._layers)
+            # pylint: disable=W0212
+            frozen._overlay = self._overlay
+            frozen._deleted = self._deleted
+            self._frozen = frozen
+        return ConfigView(self._frozen)
+
+
+class ConfigSections(MutableMapping):
+    """
+    Dict-like of section name to ``ConfigView`` of options, loaded on demand
+
+    Each section is a view over the ``Config`` cache, created when first
+    accessed, so modifications only ever affect this instance.
+    """
+
+    def __init__(self, config, *args, **dargs):
+        r"""
+        Initialize a new dict-like of sections found by config
+
+        :param config: ``Config`` instance providing sections
+        :param \*args & \*\*dargs: Same as built-in python ``dict()`` params.
+        """
+        self._config = config
+        #: Private cache of sections accessed or assigned so far
+        self._sections = {}
+        #: Private set of section names removed from this instance
+        self._deleted = set()
+        super(ConfigSections, self).__init__()
+        self.update(dict(*args, **dargs))
+
+    # Private method doesn't need docstring
+    def _names(self):  # pylint: disable=C0111
+        return ((set(self._config.index()) | set(self._sections)) -
+                self._deleted)
+
+    def __len__(self):
+        return len(self._names())
+
+    def __iter__(self):
+        return iter(self._names())
+
+    def __contains__(self, name):
+        return name in self._sections or name in self._names()
+
+    def __getitem__(self, name):
+        try:
+            return self._sections[name]
+        except KeyError:
+            if name in self._deleted:
+                raise
+        compiled = self._config.compile_sections([name])
+        section = self._sections[name] = ConfigView(compiled[name])
+        return section
+
+    def __setitem__(self, name, value):
+        self._sections[name] = value
+        self._deleted.discard(name)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._sections.pop(name, None)
+        self._deleted.add(name)
+
+    # Private method doesn't need docstring
+    def _load_all(self):  # pylint: disable=C0111
+        # Compile all missing sections at once, caching them only once
+        self._config.compile_sections(self._names() - set(self._sections))
+
+    def items(self):
+        self._load_all()
+        return super(ConfigSections, self).items()
+
+    def values(self):
+        self._load_all()
+        return super(ConfigSections, self).values()
+
+    def copy(self):
+        """
+        Return deep-copy/export as a regular dict containing regular dicts
+        """
+        return dict((name, dict(section)) for name, section in self.items())
+
+
 class Config(dict):
     """
     Global dict-like of dict-like(s) per section with defaulting values.
@@ -271,21 +580,25 @@ class Config(dict):
     configs_ = None
     #: private class-attribute cache used to return copy as a dict in __new__()
     _singleton = None
+    #: private class-attribute cache of section locations, see index()
+    _index = None
+    #: private class-attribute cache of typed section dicts, see index()
+    _compiled = None
+    #: private class-attribute ``config_stamp()`` of _index and _compiled
+    _stamp = None
 
     def __new__(cls, *args, **dargs):
         r"""
-        Return copy of dict holding parsed defaults + custom configs
+        Return dict-like of sections holding parsed defaults + custom configs
 
         :param \*args & \*\*dargs: Same as built-in python ``dict()`` params.
-        :return: Regular 'ole python dictionary of global config dicts.
+        :return: ``ConfigSections`` of copy-on-write ``ConfigView``'s,
+                 one per section, only parsed when first accessed.
         """
         if cls._singleton is None:
-            # Apply *args, *dargs _after_ making deep-copy
             cls._singleton = dict.__new__(cls)
-        copy = cls._singleton.copy()  # deep-copy cache into regular dict
-        copy.update(dict(*args, **dargs))
         # Prevent any modifications from affecting cache and/or other tests
-        return copy
+        return ConfigSections(cls._singleton, *args, **dargs)
 
     @property
     def defaults(self):
@@ -306,29 +619,17 @@ class Config(dict):
         # Return CACHED defaults dictionary
         return self.__class__.defaults_
 
-    @staticmethod
-    def load_config_dir(dirpath, filenames, configs_dict, defaults_dict):
+    def section_dict(self, section):
         """
-        Populate configs_dict with ConfigDict() for sections found in filenames
+        Return new ConfigDict() for section, parsing only where it's defined
+
+        :param section: Name of a section in ``index()``
         """
-        for filename in filenames:
-            fullpath = os.path.join(dirpath, filename)
-            if (filename.startswith('.') or
-                not filename.endswith('.ini')):
-                logging.warning("Skipping unknown config file '%s'",
-                                fullpath)
-                continue
-            config_file = open(fullpath, 'r')
-            # Temp use sections variable for reading sections list
-            sections = SafeConfigParser()
-            sections.readfp(config_file)
-            # Dump SafeConfigParser(), reassign as a list of strings
-            sections = sections.sections()
-            for section in sections:
-                # First call to defaults_dict will cache result
-                configs_dict[section] = ConfigDict(section, defaults_dict)
-                # Will seek(0), incorporate defaults & overwrite any dupes.
-                configs_dict[section].read(config_file)
+        filename, extents = self.index()[section]
+        # First call to defaults will cache result
+        config_dict = ConfigDict(section, self.defaults)
+        config_dict.read(StringIO(read_extents(filename, extents)))
+        return config_dict
 
     @property
     def configs(self):
@@ -336,31 +637,111 @@ class Config(dict):
         Read-only cached dict of ConfigDict's by section, aggregating all ini's
         """
         if self.__class__.configs_ is None:
-            self.__class__.configs_ = {}
-            # Overwrite section-by-section from customs after loading defaults
-            for dirpath, dirnames, filenames in os.walk(CONFIGDEFAULT):
-                del dirnames  # not needed
-                self.load_config_dir(dirpath, filenames,
-                                     self.__class__.configs_, self.defaults)
-            for dirpath, dirnames, filenames in os.walk(CONFIGCUSTOMS):
-                del dirnames  # not needed
-                self.load_config_dir(dirpath, filenames,
-                                     self.__class__.configs_, self.defaults)
+            self.__class__.configs_ = dict([(section,
+                                             self.section_dict(section))
+                                            for section in self.index()])
         return self.__class__.configs_
 
+    @staticmethod
+    def load_compiled(stamp):
+        """
+        Return index and typed section dicts from CONFIGCACHE, or None
+
+        :param stamp: Current value of ``config_stamp()``, cache is only
+                      used when made from the same stamp.
+        """
+        try:
+            cache_file = open(CONFIGCACHE, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                cached = marshal.load(cache_file)
+            except (EOFError, ValueError, TypeError):
+                return None  # Corrupt or from a different python version
+        finally:
+            cache_file.close()
+        if not isinstance(cached, dict) or cached.get('stamp') != stamp:
+            return None
+        return cached.get('index'), cached.get('sections')
+
+    @staticmethod
+    def save_compiled(stamp, index, sections):
+        """
+        Replace CONFIGCACHE with index and sections, ignoring failures
+
+        :param stamp: Value of ``config_stamp()`` before indexing
+        :param index: Dict of section locations, see ``index_file()``
+        :param sections: Dict of typed section dicts compiled so far
+        """
+        try:
+            osfd, tmpname = tempfile.mkstemp(prefix='.config_cache',
+                                             dir=os.path.dirname(CONFIGCACHE))
+        except (IOError, OSError):
+            return  # Read-only tree, simply parse every time
+        try:
+            cache_file = os.fdopen(osfd, 'wb')
+            marshal.dump({'stamp': stamp, 'index': index,
+                          'sections': sections}, cache_file)
+            cache_file.close()
+            os.chmod(tmpname, 0644)
+            # Atomic, concurrent readers never see a partial cache
+            os.rename(tmpname, CONFIGCACHE)
+        except (IOError, OSError, ValueError):
+            logging.warning("Unable to write config cache '%s'", CONFIGCACHE)
+            if os.path.isfile(tmpname):
+                os.unlink(tmpname)
+
+    def index(self):
+        """
+        Read-only cached dict of section name to location(s) in ini file
+
+        Parsing and converting every ini file is slow, and happens again for
+        each subtest (since control reloads all modules).  Instead, only
+        section header lines are scanned, to find where each section is
+        defined.  Sections are then compiled individually when first needed
+        (see ``compile_sections()``).  Both the index and compiled sections
+        are kept in CONFIGCACHE, along with the path, mtime and size of every
+        ini file.  When none of those changed, a single read of that file
+        replaces all scanning and parsing.
+        """
+        if self.__class__._index is None:
+            filenames = config_files()
+            stamp = config_stamp(filenames)
+            cached = self.load_compiled(stamp)
+            if cached is None:
+                index = {}
+                for filename in filenames:
+                    index_file(filename, index)
+                cached = (index, {})
+                self.save_compiled(stamp, index, {})
+            self.__class__._stamp = stamp
+            self.__class__._index, self.__class__._compiled = cached
+        return self.__class__._index
+
+    def compile_sections(self, sections):
+        """
+        Return cached dict of typed section dicts, including all sections
+
+        :param sections: Iterable of section names to parse if not cached
+        :raises KeyError: If any of sections is not defined in any ini file
+        """
+        index = self.index()
+        compiled = self.__class__._compiled
+        missing = [section for section in sections if section not in compiled]
+        for section in missing:
+            if section not in index:
+                raise KeyError(section)
+            compiled[section] = self.section_dict(section).snapshot()
+        if missing:
+            self.save_compiled(self.__class__._stamp, index, compiled)
+        return compiled
+
     def copy(self):
         """
         Return deep-copy/export as a regular dict containing regular dicts
         """
-        the_copy = {}
-        # self.configs holds dict of ConfigDict()s
-        for sec_key, sec_value in self.configs.items():
-            # convert each section from ConfigDict to regular dict.
-            sec_copy = {}
-            for cfg_key, cfg_value in sec_value.items():
-                sec_copy[cfg_key] = cfg_value
-            the_copy[sec_key] = sec_copy
-        return the_copy
+        return ConfigSections(self).copy()
 
 
 def none_if_empty(dict_like, key_name=None):
@@ -56,10 +56,13 @@ class ConfigTestBase(unittest.TestCase):
         self.config = config
         self.config.CONFIGDEFAULT = tempfile.mkdtemp(self.__class__.__name__)
         self.config.CONFIGCUSTOMS = tempfile.mkdtemp(self.__class__.__name__)
+        self.cachedir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config.CONFIGCACHE = os.path.join(self.cachedir, '.config_cache')
 
     def tearDown(self):
         shutil.rmtree(self.config.CONFIGDEFAULT, ignore_errors=True)
         shutil.rmtree(self.config.CONFIGCUSTOMS, ignore_errors=True)
+        shutil.rmtree(self.cachedir, ignore_errors=True)
         self.assertFalse(os.path.isdir(self.config.CONFIGDEFAULT))
         self.assertFalse(os.path.isdir(self.config.CONFIGCUSTOMS))
         if 'dockertest.config' in sys.modules:  # running from outer directory
@@ -134,6 +137,38 @@ class TestConfigDict(ConfigTestBase):
         self.assertEqual(foobar['aaa'], "AAA")
         del(foobar['aaa'])
 
+    def test_memoized(self):
+        foobar = self.config.ConfigDict('TestSection')
+        foobar.read(open(self.testfile.name, 'rb'))
+        self.assertEqual(foobar['testoptioni'], 2)
+        # Converted values come from cache, not from the parser
+        foobar._config_section = None
+        self.assertEqual(foobar['TestOptionI'], 2)
+        self.assertTrue('testoptionf' in foobar)
+
+    def test_invalidated(self):
+        foobar = self.config.ConfigDict('TestSection')
+        foobar.read(open(self.testfile.name, 'rb'))
+        self.assertEqual(foobar['testoptioni'], 2)
+        foobar['testoptioni'] = 'yes'
+        self.assertEqual(foobar['testoptioni'], True)
+        foobar['newoption'] = 1.5
+        self.assertEqual(len(foobar), 5)
+        self.assertAlmostEqual(foobar['newoption'], 1.5)
+        del foobar['newoption']
+        self.assertFalse('newoption' in foobar)
+        self.assertRaises(DockerKeyError, foobar.__getitem__, 'newoption')
+
+    def test_snapshot(self):
+        foobar = self.config.ConfigDict('TestSection')
+        foobar.read(open(self.testfile.name, 'rb'))
+        snapshot = foobar.snapshot()
+        self.assertEqual(snapshot, {'testoptionb': True, 'testoptioni': 2,
+                                    'testoptionf': 3.14,
+                                    'testoptions': 'foobarbaz'})
+        snapshot['testoptioni'] = 3
+        self.assertEqual(foobar['testoptioni'], 2)
+
 
 class TestConfig(ConfigTestBase):
 
@@ -221,6 +256,145 @@ class TestConfig(ConfigTestBase):
         self.assertEqual(atestsection['testoptions'], "foobarbaz")  # default
         self.assertEqual(yatestsection['testoptionx'], False)  # overridden
 
+    def test_compiled_cache(self):
+        self.assertEqual(self.config.Config()['TestSection']['testoptioni'], 2)
+        self.assertTrue(os.path.isfile(self.config.CONFIGCACHE))
+        # Simulate a fresh module load, which must not parse any ini file
+        self.config.Config._compiled = None
+        self.config.Config._index = None
+        self.config.Config.configs_ = None
+        self.config.Config.section_dict = None
+        self.config.index_file = None
+        foo = self.config.Config()
+        self.assertEqual(foo['TestSection']['testoptioni'], 2)
+        self.assertEqual(foo['TestSection']['testoptionx'], True)
+        self.assertAlmostEqual(foo['TestSection']['testoptionf'], 3.14)
+        # Copies must not share section dicts
+        foo['TestSection']['testoptioni'] = 3
+        self.assertEqual(self.config.Config()['TestSection']['testoptioni'], 2)
+
+    def test_compiled_cache_stale(self):
+        self.assertEqual(len(self.config.Config()), 2)
+        bar = self.config.ConfigSection(None, 'TestSection')
+        bar.set('TestOptionI', 42)
+        bar.merge_write(self.cfgfile)
+        # mtime resolution may be coarse, size alone changed
+        self.config.Config._index = None
+        self.config.Config.configs_ = None
+        self.assertEqual(self.config.Config()['TestSection']['testoptioni'],
+                         42)
+
+
+    def test_lazy_sections(self):
+        osfd, filename = tempfile.mkstemp(suffix='.ini',
+                                          dir=self.config.CONFIGCUSTOMS)
+        os.close(osfd)
+        cfgfile = open(filename, 'wb')
+        cfgfile.write("[AnotherTestSection]\ntestoptioni = 5\n"
+                      "[TestSection]\ntestoptions = custom\n"
+                      "[AnotherTestSection]\ntestoptionz = 6\n")
+        cfgfile.close()
+        config = self.config.Config()
+        self.assertEqual(len(config), 3)
+        self.assertEqual(self.config.Config._compiled, {})
+        atestsection = config['AnotherTestSection']
+        self.assertEqual(self.config.Config._compiled.keys(),
+                         ['AnotherTestSection'])
+        # Both parts of a split section are used
+        self.assertEqual(atestsection['testoptioni'], 5)
+        self.assertEqual(atestsection['testoptionz'], 6)
+        # Custom section replaces default section
+        self.assertEqual(config['TestSection']['testoptions'], "custom")
+        self.assertFalse('testoptionx' in config['TestSection'])
+        self.assertRaises(KeyError, config.__getitem__, 'NotExist')
+
+    def test_sections_copy(self):
+        foo = self.config.Config(NewSection={'foo': 'bar'})
+        self.assertEqual(len(foo), 3)
+        del foo['TestSection']
+        self.assertFalse('TestSection' in foo)
+        self.assertRaises(KeyError, foo.__getitem__, 'TestSection')
+        bar = foo.copy()
+        self.assertTrue(isinstance(bar, dict))
+        self.assertEqual(sorted(bar.keys()), ['DEFAULTS', 'NewSection'])
+        self.assertEqual(len(self.config.Config()), 2)
+
+
+class TestConfigView(unittest.TestCase):
+
+    def setUp(self):
+        import config
+        self.defaults = {'foo': 1, 'bar': 2}
+        self.parent = {'bar': 3, 'baz': 4}
+        self.view = config.ConfigView(self.parent, self.defaults)
+
+    def test_lookup(self):
+        self.assertEqual(self.view['foo'], 1)
+        self.assertEqual(self.view['bar'], 3)
+        self.assertEqual(len(self.view), 3)
+        self.assertEqual(sorted(self.view), ['bar', 'baz', 'foo'])
+        self.assertRaises(KeyError, self.view.__getitem__, 'NotExist')
+        self.assertEqual(self.view.get('NotExist'), None)
+
+    def test_copy_on_write(self):
+        self.view['foo'] = 10
+        self.view['new'] = 5
+        del self.view['bar']
+        self.assertEqual(dict(self.view), {'foo': 10, 'baz': 4, 'new': 5})
+        self.assertFalse('bar' in self.view)
+        self.assertRaises(KeyError, self.view.__delitem__, 'bar')
+        self.assertEqual(self.defaults, {'foo': 1, 'bar': 2})
+        self.assertEqual(self.parent, {'bar': 3, 'baz': 4})
+        self.view['bar'] = 30
+        self.assertEqual(self.view['bar'], 30)
+
+    def test_copy(self):
+        copy = self.view.copy()
+        copy['foo'] = 10
+        self.assertEqual(copy.pop('baz'), 4)
+        self.assertEqual(self.view['foo'], 1)
+        self.assertEqual(self.view['baz'], 4)
+        self.assertEqual(dict(copy), {'foo': 10, 'bar': 3})
+
+    def test_snapshot(self):
+        self.view['foo'] = 10
+        first = self.view.snapshot()
+        second = self.view.snapshot()
+        # Shares state until the view changes
+        self.assertTrue(first._layers[0] is second._layers[0])
+        self.assertTrue(first._layers[0]._overlay is self.view._overlay)
+        self.view['foo'] = 100
+        del self.view['baz']
+        self.view['new'] = 5
+        first['bar'] = 30
+        self.assertEqual(dict(first), {'foo': 10, 'bar': 30, 'baz': 4})
+        self.assertEqual(dict(second), {'foo': 10, 'bar': 3, 'baz': 4})
+        self.assertEqual(dict(self.view), {'foo': 100, 'bar': 3, 'new': 5})
+        third = self.view.snapshot()
+        self.view['foo'] = 1000
+        self.assertEqual(dict(third), {'foo': 100, 'bar': 3, 'new': 5})
+        self.assertEqual(self.view['foo'], 1000)
+        self.assertRaises(KeyError, self.view.__getitem__, 'baz')
+
+
+class TestIndexFile(unittest.TestCase):
+
+    def test_index_file(self):
+        import config
+        osfd, filename = tempfile.mkstemp(suffix='.ini')
+        os.write(osfd, "# comment\n[foo]\na = 1\n\n[bar]\n b = [x]\n"
+                       "[foo]\nc = 2\n")
+        os.close(osfd)
+        try:
+            index = config.index_file(filename, {'foo': None, 'baz': None})
+            self.assertEqual(index['baz'], None)
+            self.assertEqual(index['bar'], (filename, [(23, 38)]))
+            self.assertEqual(index['foo'], (filename, [(10, 23), (38, 50)]))
+            self.assertEqual(config.read_extents(*index['foo']),
+                             "[foo]\na = 1\n\n[foo]\nc = 2\n")
+        finally:
+            os.unlink(filename)
+
 
 class TestUtilities(ConfigTestBase):
 
@@ -30,6 +30,7 @@ import signal
 from autotest.client import utils
 from autotest.client.shared import error
 from images import DockerImages
+from names import NameReservations
 
 # Many attributes simply required here
 class DockerContainer(object):  # pylint: disable=R0902
@@ -74,6 +75,22 @@ class DockerContainer(object):  # pylint: disable=R0902
                 return False
         return True
 
+    def __ne__(self, other):
+        """
+        Return True if this instance differs from other, see __eq__()
+
+        :param other: An instance of this class (or subclass) for comparison.
+        """
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        """
+        Hash by long_id, equal instances always share it
+
+        :note: Don't modify long_id while instance is in a set or dict
+        """
+        return hash(self.long_id)
+
     def __str__(self):
         """
         Break down full_name components into a human-readable string
@@ -251,12 +268,10 @@ class DockerContainersBase(object):
         :param prefix: Name prefix
         :param suffix: Name suffix
         :param length: Length of random string (greater than 1)
-        :return: Container name guaranteed to not be in-use.
+        :return: Container name not seen in-use, nor reserved before.
         """
         assert length > 1
-        all_containers = [_.container_name for _ in self.get_container_list()]
-        check = lambda name: name not in all_containers
-        return utils.get_unique_name(check, prefix, suffix, length)
+        return NameReservations.reserve('container', prefix, suffix, length)
 
     def kill_container_by_long_id(self, long_id):
         """
@@ -428,7 +443,10 @@ class DockerContainersCLI(DockerContainersBase):
 
     def get_container_list(self):
         stdout = self._get_container_list().stdout
-        return self._parse_lines(stdout)
+        clist = self._parse_lines(stdout)
+        NameReservations.seen('container',
+                              [_.container_name for _ in clist])
+        return clist
 
     def get_container_metadata(self, long_id):
         try:
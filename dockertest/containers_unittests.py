@@ -62,6 +62,11 @@ class DockerContainerTest(ContainersTestBase):
         self.assertEqual(dc3, dc3)
         self.assertFalse(dc3 == dc1)
         self.assertFalse(dc3 == dc2)
+        self.assertTrue(dc3 != dc1)
+        self.assertFalse(dc1 != dc2)
+        dc1.long_id = dc2.long_id = dc3.long_id = 'a' * 64
+        self.assertEqual(hash(dc1), hash(dc2))
+        self.assertEqual(len(set([dc1, dc2, dc3])), 2)
 
     def test_output(self):
         foo = object()
@@ -214,6 +219,8 @@ class DockerContainersTestBase(ContainersTestBase):
         self.subtest = subtest
         self.config.CONFIGDEFAULT = tempfile.mkdtemp(self.__class__.__name__)
         self.config.CONFIGCUSTOMS = tempfile.mkdtemp(self.__class__.__name__)
+        self.cachedir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config.CONFIGCACHE = os.path.join(self.cachedir, '.config_cache')
         self._setup_defaults()
         self._setup_customs()
         self.fake_subtest = self._make_fake_subtest()
@@ -222,6 +229,7 @@ class DockerContainersTestBase(ContainersTestBase):
         super(DockerContainersTestBase, self).tearDown()
         shutil.rmtree(self.config.CONFIGDEFAULT, ignore_errors=True)
         shutil.rmtree(self.config.CONFIGCUSTOMS, ignore_errors=True)
+        shutil.rmtree(self.cachedir, ignore_errors=True)
         self.assertFalse(os.path.isdir(self.config.CONFIGDEFAULT))
         self.assertFalse(os.path.isdir(self.config.CONFIGCUSTOMS))
         del self.config
@@ -6,6 +6,42 @@ import httplib
 import socket
 import json
 
+#: Default location of file holding docker daemon's process ID
+PIDFILE = "/var/run/docker.pid"
+
+
+def pid(pidfile=PIDFILE):
+    """
+    Return docker daemon process ID integer read from pidfile, or None
+
+    :param pidfile: Path to file holding docker daemon's process ID
+    """
+    try:
+        return int(open(pidfile, 'rb').read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def generation(pidfile=PIDFILE):
+    """
+    Return token that only changes when the docker daemon restarts, or None
+
+    :param pidfile: Path to file holding docker daemon's process ID
+    :return: Tuple of daemon pid and process start time (jiffies since boot)
+    """
+    daemon_pid = pid(pidfile)
+    if daemon_pid is None:
+        return None
+    try:
+        stat = open('/proc/%d/stat' % daemon_pid, 'rb').read()
+    except (IOError, OSError):
+        return None
+    # Command name (2nd field) may contain spaces, skip past it
+    fields = stat[stat.rfind(')') + 2:].split()
+    # starttime is field 22 overall, 20th after pid and comm
+    return (daemon_pid, int(fields[19]))
+
+
 class ClientBase(object):
     """
     Represents a connection with a single interface to Docker Daemon
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
 import json
+import os
+import tempfile
 import unittest
 
 class DDTestBase(unittest.TestCase):
@@ -30,5 +32,19 @@ class DDTest(DDTestBase):
         self.assertEqual(i.get_json('bar'), [{u'foo':u'bar'}])
         self.assertEqual(i.interface, None)
 
+    def test_generation(self):
+        osfd, pidfile = tempfile.mkstemp()
+        os.write(osfd, "%d\n" % os.getpid())
+        os.close(osfd)
+        try:
+            self.assertEqual(self.dd.pid(pidfile), os.getpid())
+            token = self.dd.generation(pidfile)
+            self.assertEqual(token[0], os.getpid())
+            self.assertEqual(token, self.dd.generation(pidfile))
+        finally:
+            os.unlink(pidfile)
+        self.assertEqual(self.dd.pid(pidfile), None)
+        self.assertEqual(self.dd.generation(pidfile), None)
+
 if __name__ == '__main__':
     unittest.main()
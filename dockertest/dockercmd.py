@@ -5,13 +5,346 @@ Frequently used docker CLI operations/data
 # Pylint runs from a different directory, it's fine to import this way
 # pylint: disable=W0403
 
+import errno
+import fcntl
+import json
+import os
+import re
+import shlex
+import signal
+import subprocess
+import tempfile
+import threading
+import time
 from autotest.client import utils
 from autotest.client.shared import error
-from subtest import Subtest
+from subtest import Subtest, SubSubtest
+import docker_daemon
+import profiling
+from config import PARENTDIR
+from execserver import ExecServer
 from xceptions import (DockerNotImplementedError, DockerCommandError,
                        DockerExecError, DockerRuntimeError, DockerTestError)
 
 
+class StdinFeeder(object):
+    """
+    Adapt a stdin source so it's contents reach a command w/o python copies
+
+    Strings and ``None`` are passed through unmodified.  File-like objects
+    with a ``fileno()`` and integer file descriptors are handed directly
+    to the child process.  Generators (or any other iterable of strings)
+    are written into an ``os.pipe()`` by a background thread, one chunk at
+    a time.  A not-yet executed ``DockerCmdBase`` instance is started with
+    its stdout connected to a pipe, which then becomes the stdin.  Its
+    result is recorded by ``close()``, and ``check_source()`` raises if it
+    exited non-zero.
+    """
+
+    #: Value to pass as ``stdin`` parameter to ``utils.run()``/``AsyncJob``
+    stdin = None
+
+    #: Popen instance when source is a docker command, otherwise None
+    source_process = None
+
+    #: CmdResult of source docker command, set by close(), otherwise None
+    source_result = None
+
+    #: Private, background thread writing generator chunks into pipe
+    _thread = None
+
+    #: Private, file descriptors owned by this instance, closed in close()
+    _fds = None
+
+    #: Private, temporary file collecting source docker command's stderr
+    _source_stderr = None
+
+    #: Private, time source docker command was started
+    _source_start = None
+
+    def __init__(self, source):
+        """
+        Prepare source for use as standard input of a command.
+
+        :param source: None, string, file-like, fd integer, iterable of
+                       strings, or un-executed DockerCmdBase instance.
+        :raises DockerTestError: on unsupported or already executed source
+        """
+        self._fds = []
+        self.source = source
+        if source is None or isinstance(source, basestring):
+            self.stdin = source
+        elif isinstance(source, (int, long)):
+            self.stdin = source
+        elif hasattr(source, 'fileno'):
+            self.stdin = source
+        elif isinstance(source, DockerCmdBase):
+            self._init_command(source)
+        elif hasattr(source, '__iter__'):
+            self._init_iterable(source)
+        else:
+            raise DockerTestError("Unsupported stdin source %s"
+                                  % source.__class__.__name__)
+
+    # Private method doesn't need docstring
+    def _init_command(self, dockercmd):  # pylint: disable=C0111
+        if dockercmd.executed:
+            raise DockerTestError("Can't splice stdout of already executed "
+                                  "command '%s'" % dockercmd)
+        # A file can't fill up and block the source, like a pipe could
+        self._source_stderr = tempfile.TemporaryFile()
+        self._source_start = time.time()
+        self.source_process = subprocess.Popen(dockercmd.command, shell=True,
+                                               stdout=subprocess.PIPE,
+                                               stderr=self._source_stderr,
+                                               close_fds=True)
+        self.stdin = self.source_process.stdout
+
+    # Private method doesn't need docstring
+    def _init_iterable(self, iterable):  # pylint: disable=C0111
+        read_fd, write_fd = os.pipe()
+        # Child processes (this command's or any other started concurrently)
+        # must not inherit the write end, or the reader never sees EOF.
+        for pipe_fd in (read_fd, write_fd):
+            fcntl.fcntl(pipe_fd, fcntl.F_SETFD,
+                        fcntl.fcntl(pipe_fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+        self._fds.append(read_fd)
+        self.stdin = read_fd
+        self._thread = threading.Thread(target=self._write_chunks,
+                                        args=(iterable, write_fd))
+        self._thread.daemon = True
+        self._thread.start()
+
+    # Private method doesn't need docstring
+    @staticmethod
+    def _write_chunks(iterable, write_fd):  # pylint: disable=C0111
+        try:
+            for chunk in iterable:
+                while chunk:
+                    written = os.write(write_fd, chunk)
+                    chunk = chunk[written:]
+        except OSError, detail:
+            # Reader went away, nothing left to feed
+            if detail.errno != errno.EPIPE:
+                raise
+        finally:
+            os.close(write_fd)
+
+    def close(self, timeout=None):
+        """
+        Release pipes, feeder thread, and source process (if any)
+
+        Also records ``source_result`` once source process has ended.
+
+        :param timeout: Max seconds to wait for source process exit,
+                        kill it afterwards.  None means don't wait at all.
+        """
+        # Any remaining writes will fail with EPIPE, ending the thread
+        while self._fds:
+            os.close(self._fds.pop())
+        if self._thread is not None:
+            self._thread.join()
+        if self.source_process is not None:
+            self.source_process.stdout.close()
+            if timeout is not None:
+                end_time = time.time() + timeout
+                while (self.source_process.poll() is None and
+                       time.time() < end_time):
+                    time.sleep(0.1)
+            if self.source_process.poll() is None:
+                self.source_process.kill()
+                self.source_process.wait()
+            if self.source_result is None:
+                self._record_source()
+
+    # Private method doesn't need docstring
+    def _record_source(self):  # pylint: disable=C0111
+        self._source_stderr.seek(0)
+        stderr = self._source_stderr.read()
+        self._source_stderr.close()
+        duration = time.time() - self._source_start
+        self.source_result = utils.CmdResult(
+            command=self.source.command, stderr=stderr,
+            exit_status=self.source_process.returncode, duration=duration)
+
+    def check_source(self):
+        """
+        Raise if source docker command (if any) exited non-zero
+
+        :raises DockerCommandError: with source's CmdResult, on failure
+        """
+        if self.source_result is None:
+            return
+        if self.source_result.exit_status != 0:
+            raise DockerCommandError(self.source_result.command,
+                                     self.source_result)
+
+
+class LatencyHistory(object):
+    """
+    Persistent, per-subcommand histogram of docker command run times
+
+    Buckets are logarithmic, each one doubling the upper-bound of the
+    previous.  Contents are stored as JSON in a single file, shared by
+    all processes (and runs) through an exclusive ``flock()``.  Each
+    process reads the file once, and updates its copy whenever it writes
+    the file.  New counts are buffered in memory (per file), and merged
+    into the file once ``flush_every`` are pending, or by ``flush()``.
+    Subtests flush all files during cleanup.
+    """
+
+    #: Upper-bound (seconds) of each histogram bucket, the last is unbounded
+    buckets = tuple([0.05 * 2 ** exp for exp in xrange(16)]) + (None,)
+
+    #: Number of pending counts which triggers writing them to the file
+    flush_every = 25
+
+    #: Private, mapping of filename to subcommand to pending count lists
+    _pending = {}
+
+    #: Private, mapping of filename to histogram last read or written
+    _loaded = {}
+
+    #: Private, serializes access to _pending
+    _lock = threading.Lock()
+
+    #: Private, process ID which recorded the counts in _pending
+    _owner = None
+
+    def __init__(self, filename):
+        """
+        Initialize a new history backed by filename
+
+        :param filename: Path to file holding histogram data (may not exist)
+        """
+        self.filename = filename
+
+    # Private method doesn't need docstring
+    @classmethod
+    def _pending_counts(cls, filename):  # pylint: disable=C0111
+        # Caller holds _lock.  Don't also flush a parent's counts after fork.
+        if cls._owner != os.getpid():
+            cls._pending = {}
+            cls._owner = os.getpid()
+        return cls._pending.setdefault(filename, {})
+
+    def load(self):
+        """
+        Return dictionary of subcommand to bucket-count lists, incl. pending
+        """
+        self._lock.acquire()
+        try:
+            if self.filename not in self._loaded:
+                try:
+                    self._loaded[self.filename] = json.load(
+                        open(self.filename, 'rb'))
+                except (IOError, OSError, ValueError):
+                    self._loaded[self.filename] = {}
+            histogram = dict([(subcmd, list(counts)) for subcmd, counts
+                              in self._loaded[self.filename].items()])
+            for subcmd, pending in self._pending_counts(
+                    self.filename).items():
+                counts = histogram.get(subcmd, [0] * len(self.buckets))
+                histogram[subcmd] = [count + more for count, more
+                                     in zip(counts, pending)]
+        finally:
+            self._lock.release()
+        return histogram
+
+    def record(self, subcmd, seconds):
+        """
+        Count one execution of subcmd taking seconds
+
+        :param subcmd: Docker subcommand name
+        :param seconds: Wall-clock duration of execution
+        """
+        index = len(self.buckets) - 1
+        for index, upper in enumerate(self.buckets):
+            if upper is None or seconds <= upper:
+                break
+        self._lock.acquire()
+        try:
+            pending = self._pending_counts(self.filename)
+            counts = pending.setdefault(subcmd, [0] * len(self.buckets))
+            counts[index] += 1
+            full = sum([sum(_) for _ in pending.values()]) >= self.flush_every
+        finally:
+            self._lock.release()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        Merge pending counts into the file
+        """
+        self._lock.acquire()
+        try:
+            pending = self._pending_counts(self.filename)
+            del self._pending[self.filename]
+        finally:
+            self._lock.release()
+        if not pending:
+            return
+        history_file = open(self.filename, 'a+b')
+        try:
+            fcntl.flock(history_file, fcntl.LOCK_EX)
+            history_file.seek(0)
+            try:
+                histogram = json.loads(history_file.read())
+            except ValueError:
+                histogram = {}
+            for subcmd, more in pending.items():
+                counts = histogram.get(subcmd, [0] * len(self.buckets))
+                histogram[subcmd] = [count + _ for count, _
+                                     in zip(counts, more)]
+            history_file.seek(0)
+            history_file.truncate()
+            history_file.write(json.dumps(histogram))
+        finally:
+            history_file.close()  # Also releases lock
+        self._lock.acquire()
+        try:
+            # Includes counts other processes wrote meanwhile
+            self._loaded[self.filename] = histogram
+        finally:
+            self._lock.release()
+
+    @classmethod
+    def flush_all(cls):
+        """
+        Merge pending counts into all files
+        """
+        cls._lock.acquire()
+        try:
+            filenames = cls._pending.keys()
+        finally:
+            cls._lock.release()
+        for filename in filenames:
+            try:
+                cls(filename).flush()
+            except (IOError, OSError):
+                pass  # Nowhere to report, history is only an optimization
+
+    def percentile(self, subcmd, percent, min_samples=1):
+        """
+        Return bucket upper-bound holding percent of subcmd run times, or None
+
+        :param subcmd: Docker subcommand name
+        :param percent: Floating-point percentile (0-100)
+        :param min_samples: Return None if fewer executions recorded
+        """
+        counts = self.load().get(subcmd)
+        if counts is None or sum(counts) < max(min_samples, 1):
+            return None
+        needed = sum(counts) * percent / 100.0
+        total = 0
+        for upper, count in zip(self.buckets, counts):
+            total += count
+            if total >= needed:
+                return upper
+        return None
+
+
 class DockerCmdBase(object):
     """
     Setup a call docker subcommand as if by CLI w/ subtest config integration
@@ -20,11 +353,15 @@ class DockerCmdBase(object):
     #: Evaluates ``True`` after first time ``execute()`` method is called
     executed = 0
 
+    #: Subtest whose cleanup reaps background processes, the parent
+    #: subtest when ``subtest`` is a SubSubtest.  Read-only / set in __init__
+    owner_subtest = None
+
     def __init__(self, subtest, subcmd, subargs=None, timeout=None):
         """
         Execute docker subcommand with arguments and a timeout.
 
-        :param subtest: A subtest.Subtest subclass instance
+        :param subtest: A subtest.Subtest or SubSubtest subclass instance
         :param subcomd: A Subcommand or single option string
         :param subargs: (optional) Iterable of additional args to subcommand
         :param timeout: Seconds to wait before terminating docker command
@@ -32,11 +369,12 @@ class DockerCmdBase(object):
         :raises DockerTestError: on incorrect usage
         """
         # Prevent accidental test.test instance passing
-        if not isinstance(subtest, Subtest):
-            raise DockerTestError("Subtest is not a Subtest instance or "
-                                  "subclass.")
+        if not isinstance(subtest, (Subtest, SubSubtest)):
+            raise DockerTestError("Subtest is not a Subtest or SubSubtest "
+                                  "instance or subclass.")
         else:
             self.subtest = subtest
+        self.owner_subtest = getattr(subtest, 'parent_subtest', subtest)
         self.subcmd = str(subcmd)
         if subargs is None:
             # Allow consecutive runs with modifications
@@ -46,7 +384,8 @@ class DockerCmdBase(object):
             self.subargs = list(subargs)
         if timeout is None:
             # Defined in [DEFAULTS] guaranteed to exist
-            self.timeout = subtest.config['docker_timeout']
+            self.timeout = self.adaptive_timeout(
+                                            subtest.config['docker_timeout'])
         else:
             # config() autoconverts otherwise catch non-float convertable
             self.timeout = float(timeout)
@@ -61,7 +400,8 @@ class DockerCmdBase(object):
         """
         Execute docker subcommand
 
-        :param stdin: String or file-like containing standard input contents
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
         :raise DockerCommandError: on incorrect usage
         :raise DockerExecError: on command failure
         :return: A CmdResult instance
@@ -80,6 +420,107 @@ class DockerCmdBase(object):
         """
         raise DockerRuntimeError
 
+    #: Commands containing shell syntax must always run through a shell
+    shell_syntax_p = re.compile(r"[|&;<>$`\\(){}\[\]*?~#]")
+
+    def run(self, stdin=None, ignore_status=True):
+        """
+        Return CmdResult from ``utils.run()`` or the exec server if enabled
+
+        The exec server (``docker_exec_server`` option) is only used when
+        stdin is None or a string, and the command contains no shell syntax.
+
+        :param stdin: Same as for ``utils.run()``
+        :param ignore_status: When False, raise CmdError on non-zero exit
+        :raises CmdError: on timeout or non-zero exit with ignore_status False
+        :raises DockerCommandError: if an exec server helper process died
+        """
+        profiling.count_command()
+        if (not self.subtest.config.get('docker_exec_server', False) or
+                not (stdin is None or isinstance(stdin, basestring)) or
+                self.shell_syntax_p.search(self.command)):
+            return utils.run(self.command, timeout=self.timeout,
+                             stdin=stdin, verbose=False,
+                             ignore_status=ignore_status)
+        try:
+            response = ExecServer.run(shlex.split(self.command), stdin,
+                                      self.timeout)
+        except IOError, detail:
+            cmdresult = utils.CmdResult(self.command, '', str(detail), None,
+                                        0.0)
+            raise DockerCommandError(self.command, cmdresult,
+                                     "Exec server failure")
+        cmdresult = utils.CmdResult(self.command, response['stdout'],
+                                    response['stderr'],
+                                    response['exit_status'],
+                                    response['duration'])
+        if response['timed_out']:
+            raise error.CmdError(self.command, cmdresult,
+                                 "Command did not complete within %s "
+                                 "seconds" % self.timeout)
+        if not ignore_status and cmdresult.exit_status != 0:
+            raise error.CmdError(self.command, cmdresult,
+                                 "Command returned non-zero exit status")
+        return cmdresult
+
+    @property
+    def latency_history(self):
+        """
+        LatencyHistory instance from ``docker_timeout_history``, or None
+        """
+        filename = self.subtest.config.get('docker_timeout_history')
+        if filename is None or not str(filename).strip():
+            return None
+        return LatencyHistory(str(filename).strip())
+
+    #: Subcommands whose run time depends on what the container does, or on
+    #: the size of the image, so their history can't predict it.  Not
+    #: recorded, always use ceiling.
+    unpredictable_subcmds = ('attach', 'build', 'commit', 'events', 'exec',
+                             'export', 'import', 'load', 'pull', 'push',
+                             'run', 'save', 'start', 'wait')
+
+    @property
+    def latency_key(self):
+        """
+        Subcommand name used for recording/looking up latency history
+        """
+        words = self.subcmd.split()
+        if len(words) > 0:
+            return words[0]
+        return ''
+
+    def adaptive_timeout(self, ceiling):
+        """
+        Return multiple of subcommand's historical p99 latency, up to ceiling
+
+        :param ceiling: Static timeout, returned if no/insufficient history
+                        or for any of ``unpredictable_subcmds``
+        """
+        ceiling = float(ceiling)
+        history = self.latency_history
+        if history is None or self.latency_key in self.unpredictable_subcmds:
+            return ceiling
+        config = self.subtest.config
+        p99 = history.percentile(self.latency_key, 99.0,
+                                 config['docker_timeout_min_samples'])
+        if p99 is None:
+            return ceiling
+        timeout = p99 * config['docker_timeout_p99_multiplier']
+        timeout = max(timeout, float(config['docker_timeout_floor']))
+        return min(timeout, ceiling)
+
+    def record_latency(self, seconds):
+        """
+        Add seconds to latency history for this subcommand, if enabled
+
+        :param seconds: Wall-clock duration of this command's execution
+        """
+        history = self.latency_history
+        if (history is not None and
+                self.latency_key not in self.unpredictable_subcmds):
+            history.record(self.latency_key, seconds)
+
     @property
     def docker_options(self):
         """
@@ -121,19 +562,26 @@ class DockerCmd(DockerCmdBase):
         """
         Run docker command, ignore any non-zero exit code
 
-        :param stdin: String or file-like containing standard input contents
-        :raise DockerCommandError: on incorrect usage
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
+        :raise DockerCommandError: on incorrect usage or stdin source failure
         :raise DockerExecError: on command failure
         :return: A CmdResult instance
         """
         self.executed += 1
+        feeder = StdinFeeder(stdin)
+        start = time.time()
         try:
-            return utils.run(self.command, timeout=self.timeout,
-                             stdin=stdin, verbose=False, ignore_status=True)
+            cmdresult = self.run(feeder.stdin, ignore_status=True)
         # ignore_status=True : should not see CmdError
         except error.CmdError, detail:
             # Something internal must have gone wrong
             raise DockerCommandError(self.command, detail.result_obj)
+        finally:
+            self.record_latency(time.time() - start)
+            feeder.close(self.timeout)
+        feeder.check_source()
+        return cmdresult
 
     def execute_calls(self):
         return int(self.executed)
@@ -147,18 +595,25 @@ class NoFailDockerCmd(DockerCmd):
         """
         Execute docker command, raising DockerCommandError if non-zero exit
 
-        :param stdin: String or file-like containing standard input contents
-        :raises DockerCommandError: on incorrect usage
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
+        :raises DockerCommandError: on incorrect usage or stdin source failure
         :raises DockerExecError: on if command returns non-zero exit code
         :return: A CmdResult instance
         """
         self.executed += 1
+        feeder = StdinFeeder(stdin)
+        start = time.time()
         try:
-            return utils.run(self.command, timeout=self.timeout,
-                             stdin=stdin, verbose=False, ignore_status=False)
+            cmdresult = self.run(feeder.stdin, ignore_status=False)
         # Prevent caller from needing to import this exception class
         except error.CmdError, detail:
             raise DockerExecError(str(detail.result_obj))
+        finally:
+            self.record_latency(time.time() - start)
+            feeder.close(self.timeout)
+        feeder.check_source()
+        return cmdresult
 
 
 class MustFailDockerCmd(DockerCmd):
@@ -170,19 +625,24 @@ class MustFailDockerCmd(DockerCmd):
         """
         Execute docker command, raise DockerExecError if **zero** exit code
 
-        :param stdin: String or file-like containing standard input contents
-        :raises DockerCommandError: on incorrect usage
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
+        :raises DockerCommandError: on incorrect usage or stdin source failure
         :raises DockerExecError: on if command returns zero exit code
         :return: A CmdResult instance
         """
         self.executed += 1
+        feeder = StdinFeeder(stdin)
+        start = time.time()
         try:
-            cmdresult = utils.run(self.command, timeout=self.timeout,
-                                  stdin=stdin, verbose=False,
-                                  ignore_status=True)
+            cmdresult = self.run(feeder.stdin, ignore_status=True)
         # Prevent caller from needing to import this exception class
         except error.CmdError, detail:
             raise DockerCommandError(str(detail.result_obj))
+        finally:
+            self.record_latency(time.time() - start)
+            feeder.close(self.timeout)
+        feeder.check_source()
         if cmdresult.exit_status == 0:
             raise DockerExecError("Unexpected command success: %s"
                                   % str(cmdresult))
@@ -190,37 +650,479 @@ class MustFailDockerCmd(DockerCmd):
             return cmdresult
 
 
+class DockerCmdCache(object):
+    """
+    Cache of read-only docker command results, shared through a file
+
+    Results are keyed by docker path, options, subcommand, and arguments.
+    They are stored in ``filename``, so subtests (which reload dockertest)
+    and other processes reuse them.  The whole cache is dropped whenever
+    the daemon generation token (daemon pid plus process start time, plus
+    modification time of the docker client) changes.  When no token can
+    be determined, nothing is cached.
+    """
+
+    #: Subcommands whose output only changes when the daemon restarts
+    readonly_subcmds = ('version', 'help')
+
+    #: Path of JSON file holding cached results, None to only use memory
+    filename = os.path.join(PARENTDIR, '.docker_cmd_cache.json')
+
+    #: Number of lookups satisfied from cache (read-only)
+    hits = 0
+
+    #: Number of lookups not satisfied from cache (read-only)
+    misses = 0
+
+    #: Private, mapping of cache keys to CmdResult keyword dictionaries
+    _results = {}
+
+    #: Private, daemon generation token _results belong to
+    _generation = None
+
+    #: Private, serializes access from concurrent subsubtests
+    _lock = threading.Lock()
+
+    @classmethod
+    def key(cls, dockercmd):
+        """
+        Return hashable cache key for dockercmd, None if it's not read-only
+
+        :param dockercmd: A DockerCmdBase instance
+        """
+        if dockercmd.subcmd.strip() not in cls.readonly_subcmds:
+            return None
+        return (dockercmd.docker_command, dockercmd.docker_options,
+                dockercmd.subcmd.strip(), tuple(dockercmd.subargs))
+
+    @staticmethod
+    def generation(docker_path, pidfile):
+        """
+        Return JSON-able token changing with daemon restart or client update
+
+        :param docker_path: Path to docker client executable
+        :param pidfile: Path to file holding docker daemon's process ID
+        :return: List of daemon generation and client mtime, or None
+        """
+        token = docker_daemon.generation(pidfile)
+        if token is None:
+            return None
+        try:
+            return list(token) + [os.stat(docker_path).st_mtime]
+        except OSError:
+            return None
+
+    # Private method doesn't need docstring
+    @classmethod
+    def _load(cls, token):  # pylint: disable=C0111
+        # Caller holds _lock
+        if token != cls._generation:
+            cls._results = {}
+            cls._generation = token
+        if token is None or cls.filename is None:
+            return
+        try:
+            cache_file = open(cls.filename, 'rb')
+        except IOError:
+            return
+        try:
+            fcntl.flock(cache_file, fcntl.LOCK_SH)
+            stored = json.load(cache_file)
+        except ValueError:
+            return  # Corrupt or empty, start over
+        finally:
+            cache_file.close()
+        if stored.get('generation') == token:
+            for key, cmdresult in stored.get('results', []):
+                cls._results[tuple(key[:3]) + (tuple(key[3]),)] = cmdresult
+
+    # Private method doesn't need docstring
+    @classmethod
+    def _save(cls, key, cmdresult):  # pylint: disable=C0111
+        # Caller holds _lock
+        if cls.filename is None:
+            return
+        cache_file = os.fdopen(os.open(cls.filename,
+                                       os.O_RDWR | os.O_CREAT, 0644), 'r+b')
+        try:
+            fcntl.flock(cache_file, fcntl.LOCK_EX)
+            try:
+                stored = json.load(cache_file)
+            except ValueError:
+                stored = {}
+            if stored.get('generation') != cls._generation:
+                stored = {'generation': cls._generation, 'results': []}
+            stored['results'].append([key, cmdresult])
+            cache_file.seek(0)
+            cache_file.truncate()
+            json.dump(stored, cache_file)
+        finally:
+            cache_file.close()
+
+    @classmethod
+    def lookup_key(cls, key, pidfile):
+        """
+        Return CmdResult keyword dictionary cached for key, or None on miss
+
+        :param key: Cache key, as returned by ``key()``
+        :param pidfile: Path to file holding docker daemon's process ID
+        """
+        token = cls.generation(key[0], pidfile)
+        cls._lock.acquire()
+        try:
+            if token != cls._generation or key not in cls._results:
+                cls._load(token)
+            cmdresult = cls._results.get(key)
+            if token is None or cmdresult is None:
+                cls.misses += 1
+                return None
+            cls.hits += 1
+            return dict(cmdresult)
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def store_key(cls, key, cmdresult):
+        """
+        Remember successful CmdResult keyword dictionary of read-only key
+
+        :param key: Cache key, as returned by ``key()``
+        :param cmdresult: Dictionary of ``utils.CmdResult`` keyword arguments
+        """
+        if cmdresult['exit_status'] != 0:
+            return
+        cls._lock.acquire()
+        try:
+            # Generation unknown, results can't be validated later
+            if cls._generation is not None:
+                cls._results[key] = dict(cmdresult)
+                try:
+                    cls._save(key, cmdresult)
+                except (IOError, OSError):
+                    pass  # Still cached in memory
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def lookup(cls, dockercmd):
+        """
+        Return new CmdResult cached for dockercmd, or None on miss
+
+        :param dockercmd: A DockerCmdBase instance
+        """
+        key = cls.key(dockercmd)
+        if key is None:
+            return None
+        cmdresult = cls.lookup_key(key,
+                                   dockercmd.subtest.config['docker_pidfile'])
+        if cmdresult is None:
+            return None
+        return utils.CmdResult(**cmdresult)
+
+    @classmethod
+    def store(cls, dockercmd, cmdresult):
+        """
+        Remember successful cmdresult of read-only dockercmd
+
+        :param dockercmd: A DockerCmdBase instance
+        :param cmdresult: CmdResult instance from executing dockercmd
+        """
+        key = cls.key(dockercmd)
+        if key is None:
+            return
+        cls.store_key(key, {'command': cmdresult.command,
+                            'stdout': cmdresult.stdout,
+                            'stderr': cmdresult.stderr,
+                            'exit_status': cmdresult.exit_status,
+                            'duration': cmdresult.duration})
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget all results cached in memory, and hit/miss counts
+        """
+        cls._lock.acquire()
+        try:
+            cls._results = {}
+            cls._generation = None
+            cls.hits = 0
+            cls.misses = 0
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def stats(cls, reset=False):
+        """
+        Return dictionary of hit/miss counts, suitable for keyval output
+
+        :param reset: When True, also restart counting from zero
+        """
+        cls._lock.acquire()
+        try:
+            counts = {'docker_cmd_cache_hits': cls.hits,
+                      'docker_cmd_cache_misses': cls.misses}
+            if reset:
+                cls.hits = 0
+                cls.misses = 0
+            return counts
+        finally:
+            cls._lock.release()
+
+
+class ReadOnlyDockerCmd(NoFailDockerCmd):
+    """
+    NoFailDockerCmd returning cached results of read-only subcommands
+
+    Subcommands not listed in ``DockerCmdCache.readonly_subcmds``, or
+    any execution given stdin, bypass the cache entirely.
+    """
+
+    def execute(self, stdin=None):
+        """
+        Return cached result or execute, raise DockerExecError if non-zero exit
+
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
+        :raises DockerCommandError: on incorrect usage
+        :raises DockerExecError: on if command returns non-zero exit code
+        :return: A CmdResult instance
+        """
+        if stdin is not None:
+            return super(ReadOnlyDockerCmd, self).execute(stdin)
+        cmdresult = DockerCmdCache.lookup(self)
+        if cmdresult is not None:
+            self.executed += 1
+            self.subtest.logdebug("Using cached result of '%s'", self.command)
+            return cmdresult
+        cmdresult = super(ReadOnlyDockerCmd, self).execute(stdin)
+        DockerCmdCache.store(self, cmdresult)
+        return cmdresult
+
+
+class AsyncReaper(object):
+    """
+    Process-wide registry of AsyncDockerCmd instances, grouped by subtest
+
+    Commands started by a SubSubtest belong to its parent subtest, since
+    only the parent's cleanup reaps them.
+
+    Commands register themselves when started, and unregister once
+    ``wait()`` saw them finish or they were killed.  Liveness is checked
+    through ``/proc`` only, never by polling or waiting on a process,
+    since it's owner may do so concurrently (and a lost race reports an
+    exit status of 0).  Processes still running when their subtest cleans
+    up are killed along with their entire process group.
+    """
+
+    #: Seconds between liveness checks while waiting for a free slot
+    interval = 1.0
+
+    #: Private, mapping of id(subtest) to list of AsyncDockerCmd instances
+    _live = {}
+
+    #: Private, serializes registry access from concurrent subsubtests
+    _lock = threading.Lock()
+
+    @classmethod
+    def register(cls, dockercmd):
+        """
+        Track executed dockercmd until it ends or it's subtest cleans up
+
+        :param dockercmd: An executed AsyncDockerCmd instance
+        """
+        cls._lock.acquire()
+        try:
+            cls._live.setdefault(id(dockercmd.owner_subtest),
+                                 []).append(dockercmd)
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def unregister(cls, dockercmd):
+        """
+        Stop tracking dockercmd, handed back by it's owner once finished
+
+        :param dockercmd: A registered AsyncDockerCmd instance
+        """
+        cls._lock.acquire()
+        try:
+            dockercmds = cls._live.get(id(dockercmd.owner_subtest), [])
+            if dockercmd in dockercmds:
+                dockercmds.remove(dockercmd)
+            if not dockercmds:
+                cls._live.pop(id(dockercmd.owner_subtest), None)
+        finally:
+            cls._lock.release()
+
+    @staticmethod
+    def finished(dockercmd):
+        """
+        Return True if dockercmd's process exited, without reaping it
+
+        :param dockercmd: An executed AsyncDockerCmd instance
+        """
+        sp = dockercmd._async_job.sp  # pylint: disable=W0212
+        if sp.returncode is not None:
+            return True
+        try:
+            stat = open('/proc/%d/stat' % sp.pid, 'rb').read()
+        except IOError:
+            return True
+        # Command name (2nd field) may contain spaces, skip past it
+        return stat[stat.rfind(')') + 2:].split()[0] in ('Z', 'X')
+
+    @classmethod
+    def live(cls, subtest):
+        """
+        Return number of subtest's registered processes still running
+
+        :param subtest: A subtest.Subtest or subclass instance
+        """
+        cls._lock.acquire()
+        try:
+            dockercmds = list(cls._live.get(id(subtest), []))
+        finally:
+            cls._lock.release()
+        return len([dockercmd for dockercmd in dockercmds
+                    if not cls.finished(dockercmd)])
+
+    @classmethod
+    def kill_all(cls, subtest):
+        """
+        Kill and reap process groups of all subtest's remaining processes
+
+        Only call once the subtest (and subsubtests) stopped using them.
+
+        :param subtest: A subtest.Subtest or subclass instance
+        :return: Number of processes which were still running
+        """
+        cls._lock.acquire()
+        try:
+            dockercmds = cls._live.pop(id(subtest), [])
+        finally:
+            cls._lock.release()
+        running = 0
+        for dockercmd in dockercmds:
+            if not cls.finished(dockercmd):
+                running += 1
+            # Also reaps exited, but never waited for processes
+            dockercmd.kill()
+        return running
+
+
 class AsyncDockerCmd(DockerCmdBase):
     """
     Execute docker command as asynchronous background process on ``execute()``
     """
 
+    #: Start command as leader of a new session / process group, so it
+    #: and any children may be killed together.
+    process_group = True
+
     #: Used internally by execute()
     _async_job = None
 
+    #: Used internally by execute() and wait()
+    _stdin_feeder = None
+
+    #: Used internally by execute() and wait(), None once latency recorded
+    _start_time = None
+
     def execute(self, stdin=None):
         """
         Start execution of asynchronous docker command
 
-        :param stdin: String or file-like containing standard input contents
+        :param stdin: String, file-like, fd, iterable of strings, or
+                      DockerCmdBase instance (see StdinFeeder)
         :return: A partial CmdResult instance
         """
-        self._async_job = utils.AsyncJob(self.command, verbose=False,
-                                         stdin=stdin, close_fds=True)
+        self.wait_for_slot()
+        self._stdin_feeder = StdinFeeder(stdin)
+        if self.process_group:
+            # Executes in-place, process ID becomes process group ID
+            command = "setsid %s" % self.command
+        else:
+            command = self.command
+        profiling.count_command()
+        self._start_time = time.time()
+        self._async_job = utils.AsyncJob(command, verbose=False,
+                                         stdin=self._stdin_feeder.stdin,
+                                         close_fds=True)
+        AsyncReaper.register(self)
         return self._async_job.result
 
+    def wait_for_slot(self):
+        """
+        Block until subtest has < ``async_max_clients`` processes running
+
+        :raises DockerTestError: if no slot frees up within timeout
+        """
+        max_clients = self.subtest.config.get('async_max_clients', 0)
+        if max_clients < 1:
+            return
+        end_time = time.time() + self.timeout
+        while AsyncReaper.live(self.owner_subtest) >= max_clients:
+            if time.time() > end_time:
+                raise DockerTestError("More than %d docker client processes "
+                                      "still running after %s seconds"
+                                      % (max_clients, self.timeout))
+            time.sleep(AsyncReaper.interval)
+
+    def kill(self):
+        """
+        Send SIGKILL to process group (or just process), then reap it
+
+        :raises DockerTestError: on incorrect usage
+        """
+        if self._async_job is None:
+            raise DockerTestError("Attempted to kill before execute() called.")
+        # Once reaped, the process ID may belong to some other process
+        if self._async_job.sp.returncode is None:
+            self._signal_kill(self._async_job.sp.pid)
+        self._async_job.sp.wait()
+        self._stdin_feeder.close()
+        AsyncReaper.unregister(self)
+
+    # Private method doesn't need docstring
+    def _signal_kill(self, pid):  # pylint: disable=C0111
+        try:
+            if self.process_group:
+                os.killpg(pid, signal.SIGKILL)
+            else:
+                os.kill(pid, signal.SIGKILL)
+        except OSError, detail:
+            if detail.errno != errno.ESRCH:
+                raise
+            # No such group (e.g. shell did not exec), try just the process
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass  # Already gone
+
     def wait(self, timeout=None):
         """
         Return CmdResult after waiting for process to end or timeout
 
         :param timeout: Max time to wait, self.timeout if None
         :raises DockerTestError: on incorrect usage
+        :raises DockerCommandError: on stdin source failure
         :return: Complete CmdResult instance
         """
         if timeout is None:
             timeout = self.timeout
         if self._async_job is not None:
-            return self._async_job.wait_for(timeout)
+            try:
+                cmdresult = self._async_job.wait_for(timeout)
+            finally:
+                self._stdin_feeder.close(timeout)
+            if self.exit_status is not None:
+                AsyncReaper.unregister(self)
+                # Only record complete runs, and only once
+                if self._start_time is not None:
+                    self.record_latency(time.time() - self._start_time)
+                    self._start_time = None
+            self._stdin_feeder.check_source()
+            return cmdresult
         else:
             raise DockerTestError("Attempted to wait before execute() called.")
 
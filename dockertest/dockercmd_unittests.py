@@ -5,10 +5,14 @@
 # There is magic requiring attributes defined outside the __init__
 # pylint: disable=W0201
 
+import json
 import os
 import shutil
+import subprocess
 import sys
 import tempfile
+import threading
+import time
 import types
 import unittest
 
@@ -45,7 +49,8 @@ class FakeCmdResult(object):    # pylint: disable=R0903
 
 def run(command, *args, **dargs):
     """ Don't actually run anything! """
-    result = FakeCmdResult(command=command, args=args, dargs=dargs)
+    result = FakeCmdResult(command=command, args=args, dargs=dargs,
+                           stdout='', stderr='', duration=0.0)
     # store myself to allow special AsyncJob magic
     result.result = result
     if 'unittest_fail' in command:
@@ -62,6 +67,9 @@ def run(command, *args, **dargs):
 
 # Mock module and mock function run in one command
 setattr(mock('autotest.client.utils'), 'run', run)
+# Mock module and class in one stroke
+setattr(mock('autotest.client.utils'), 'CmdResult',
+        lambda *args, **dargs: FakeCmdResult(**dargs))
 # Similar enough to run
 setattr(mock('autotest.client.utils'), 'AsyncJob', run)
 # Mock module and class in one stroke
@@ -145,6 +153,8 @@ class DockerCmdTestBase(unittest.TestCase):
         self.subtest = subtest
         self.config.CONFIGDEFAULT = tempfile.mkdtemp(self.__class__.__name__)
         self.config.CONFIGCUSTOMS = tempfile.mkdtemp(self.__class__.__name__)
+        self.cachedir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config.CONFIGCACHE = os.path.join(self.cachedir, '.config_cache')
         self._setup_defaults()
         self._setup_customs()
         self.fake_subtest = self._make_fake_subtest()
@@ -152,6 +162,7 @@ class DockerCmdTestBase(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree(self.config.CONFIGDEFAULT, ignore_errors=True)
         shutil.rmtree(self.config.CONFIGCUSTOMS, ignore_errors=True)
+        shutil.rmtree(self.cachedir, ignore_errors=True)
         self.assertFalse(os.path.isdir(self.config.CONFIGDEFAULT))
         self.assertFalse(os.path.isdir(self.config.CONFIGCUSTOMS))
         del self.config
@@ -170,7 +181,7 @@ class DockerCmdTestBase(unittest.TestCase):
 class DockerCmdTestBasic(DockerCmdTestBase):
 
     defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
-                'docker_timeout': "42.0"}
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid'}
     customs = {}
     config_section = "Foo/Bar/Baz"
 
@@ -248,9 +259,31 @@ class DockerCmdTestBasic(DockerCmdTestBase):
         self.assertTrue(docker_command.execute())
 
 
+class ExecServerDockerCmd(DockerCmdTestBase):
+
+    defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid',
+                'docker_exec_server': 'yes'}
+    customs = {}
+    config_section = "Foo/Bar/Baz"
+
+    def test_dead_helper(self):
+        class DeadExecServer(object):
+            @classmethod
+            def run(cls, argv, stdin=None, timeout=None):
+                raise IOError("Exec server process 1 died")
+
+        # Module is re-imported by setUp() of every test
+        self.dockercmd.ExecServer = DeadExecServer
+        docker_command = self.dockercmd.DockerCmd(self.fake_subtest,
+                                                  'fake_subcommand')
+        self.assertRaises(self.dockercmd.DockerCommandError,
+                          docker_command.run)
+
+
 class AsyncDockerCmd(DockerCmdTestBase):
     defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
-                'docker_timeout': "42.0"}
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid'}
     customs = {}
     config_section = "Foo/Bar/Baz"
 
@@ -272,6 +305,7 @@ class AsyncDockerCmd(DockerCmdTestBase):
         async_job = docker_cmd.execute()
         async_job.sp = DummyClass()
 
+        async_job.sp.returncode = None
         async_job.wait_for = lambda x: x    # instead waiting return timeout
         self.assertEqual(docker_cmd.wait(), 123)
 
@@ -294,5 +328,354 @@ class AsyncDockerCmd(DockerCmdTestBase):
         self.assertRaises(self.xceptions.DockerRuntimeError,
                           docker_cmd.execute_calls)
 
+
+class LatencyHistory(DockerCmdTestBase):
+    defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
+                'docker_timeout': "300.0", 'docker_pidfile': '/foo/bar.pid',
+                'docker_timeout_p99_multiplier': "2.0",
+                'docker_timeout_floor': "1.0",
+                'docker_timeout_min_samples': "10"}
+    customs = {}
+    config_section = "Foo/Bar/Baz"
+
+    def setUp(self):
+        super(LatencyHistory, self).setUp()
+        osfd, self.history = tempfile.mkstemp()
+        os.close(osfd)
+
+    def tearDown(self):
+        os.unlink(self.history)
+        super(LatencyHistory, self).tearDown()
+
+    def test_percentile(self):
+        history = self.dockercmd.LatencyHistory(self.history)
+        self.assertEqual(history.percentile('kill', 99.0), None)
+        for _ in xrange(99):
+            history.record('kill', 0.3)
+        history.record('kill', 5000.0)
+        history.record('pull', 0.01)
+        self.assertAlmostEqual(history.percentile('kill', 99.0), 0.4)
+        self.assertEqual(history.percentile('kill', 100.0), None)
+        self.assertAlmostEqual(history.percentile('pull', 50.0), 0.05)
+        self.assertEqual(history.percentile('pull', 50.0, 2), None)
+
+    def test_batched_writes(self):
+        history = self.dockercmd.LatencyHistory(self.history)
+        for _ in xrange(history.flush_every - 1):
+            history.record('kill', 0.3)
+        # Pending counts are used, but not yet written
+        self.assertEqual(sum(history.load()['kill']), history.flush_every - 1)
+        self.assertEqual(open(self.history, 'rb').read(), '')
+        history.record('pull', 0.3)
+        self.assertEqual(sum(history.load()['pull']), 1)
+        stored = json.load(open(self.history, 'rb'))
+        self.assertEqual(sum(stored['kill']), history.flush_every - 1)
+        history.record('pull', 0.3)
+        self.dockercmd.LatencyHistory.flush_all()
+        stored = json.load(open(self.history, 'rb'))
+        self.assertEqual(sum(stored['pull']), 2)
+
+    def test_loaded_once(self):
+        history = self.dockercmd.LatencyHistory(self.history)
+        history.record('kill', 0.3)
+        history.flush()
+        self.assertEqual(sum(history.load()['kill']), 1)
+        # Not read again, only updated when written
+        open(self.history, 'wb').write(json.dumps({'kill': [5] * 17}))
+        self.assertEqual(sum(history.load()['kill']), 1)
+        history.record('kill', 0.3)
+        history.flush()
+        self.assertEqual(sum(history.load()['kill']), 86)
+
+    def test_adaptive_timeout(self):
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, 'kill')
+        self.assertEqual(docker_cmd.timeout, 300.0)
+        self.fake_subtest.config['docker_timeout_history'] = self.history
+        for _ in xrange(9):
+            self.dockercmd.DockerCmd(self.fake_subtest, 'kill').execute()
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, 'kill')
+        self.assertEqual(docker_cmd.timeout, 300.0)
+        docker_cmd.execute()
+        # All 10 mock executions are near-instant, floor applies
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, 'kill')
+        self.assertEqual(docker_cmd.timeout, 1.0)
+        # No history for this subcommand
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, 'stop')
+        self.assertEqual(docker_cmd.timeout, 300.0)
+        # Explicit timeout always wins
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, 'kill',
+                                              timeout=42)
+        self.assertEqual(docker_cmd.timeout, 42.0)
+
+    def test_unpredictable(self):
+        self.fake_subtest.config['docker_timeout_history'] = self.history
+        for subcmd in ('run', 'pull'):
+            for _ in xrange(10):
+                self.dockercmd.DockerCmd(self.fake_subtest, subcmd).execute()
+            docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest, subcmd)
+            self.assertEqual(docker_cmd.timeout, 300.0)
+            self.assertFalse(subcmd in docker_cmd.latency_history.load())
+
+    def test_async_recorded(self):
+        self.fake_subtest.config['docker_timeout_history'] = self.history
+        docker_cmd = self.dockercmd.AsyncDockerCmd(self.fake_subtest, 'logs')
+        async_job = docker_cmd.execute()
+        async_job.sp = subprocess.Popen(['true'], close_fds=True)
+        async_job.wait_for = lambda timeout: async_job.sp.wait()
+        docker_cmd.wait()
+        docker_cmd.wait()
+        self.assertEqual(sum(docker_cmd.latency_history.load()['logs']), 1)
+        self.dockercmd.AsyncReaper.kill_all(self.fake_subtest)
+
+
+class ReadOnlyDockerCmd(DockerCmdTestBase):
+    defaults = {'docker_path': '/bin/true', 'docker_options': '--not_exist',
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid'}
+    customs = {}
+    config_section = "Foo/Bar/Baz"
+
+    def setUp(self):
+        super(ReadOnlyDockerCmd, self).setUp()
+        osfd, self.pidfile = tempfile.mkstemp()
+        os.write(osfd, str(os.getpid()))
+        os.close(osfd)
+        self.fake_subtest.config['docker_pidfile'] = self.pidfile
+        # Removed along with cachedir
+        self.dockercmd.DockerCmdCache.filename = os.path.join(
+            self.cachedir, '.docker_cmd_cache.json')
+        self.dockercmd.DockerCmdCache.clear()
+
+    def tearDown(self):
+        os.unlink(self.pidfile)
+        super(ReadOnlyDockerCmd, self).tearDown()
+
+    def test_cached(self):
+        cache = self.dockercmd.DockerCmdCache
+        first = self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest, 'version')
+        second = self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                                  'version')
+        first_result = first.execute()
+        second_result = second.execute()
+        self.assertEqual(second_result.command, first_result.command)
+        self.assertEqual(second.execute_calls(), 1)
+        self.assertEqual(cache.stats(reset=True),
+                         {'docker_cmd_cache_hits': 1,
+                          'docker_cmd_cache_misses': 1})
+        self.assertEqual(cache.stats(), {'docker_cmd_cache_hits': 0,
+                                         'docker_cmd_cache_misses': 0})
+
+    def test_shared_file(self):
+        cache = self.dockercmd.DockerCmdCache
+        self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest, 'help').execute()
+        # As if dockertest was reloaded for the next subtest
+        cache.clear()
+        docker_cmd = self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                                      'help')
+        self.assertEqual(docker_cmd.execute().command, docker_cmd.command)
+        self.assertEqual(cache.stats(), {'docker_cmd_cache_hits': 1,
+                                         'docker_cmd_cache_misses': 0})
+
+    def test_bypass(self):
+        cache = self.dockercmd.DockerCmdCache
+        for subcmd in ('run', 'version', 'help'):
+            self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                             subcmd).execute('stdin')
+        for subcmd in ('rm', 'info'):
+            self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                             subcmd).execute()
+        self.assertEqual(cache.stats(), {'docker_cmd_cache_hits': 0,
+                                         'docker_cmd_cache_misses': 0})
+
+    def test_generation_change(self):
+        cache = self.dockercmd.DockerCmdCache
+        for _ in xrange(2):
+            self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                             'version').execute()
+        open(self.pidfile, 'wb').write('1')
+        self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                         'version').execute()
+        self.assertEqual(cache.stats(), {'docker_cmd_cache_hits': 1,
+                                         'docker_cmd_cache_misses': 2})
+        # Unknown generation disables caching
+        os.unlink(self.pidfile)
+        for _ in xrange(2):
+            self.dockercmd.ReadOnlyDockerCmd(self.fake_subtest,
+                                             'version').execute()
+        open(self.pidfile, 'wb').close()
+        self.assertEqual(cache.stats(), {'docker_cmd_cache_hits': 1,
+                                         'docker_cmd_cache_misses': 4})
+
+
+class AsyncReaper(DockerCmdTestBase):
+    defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid'}
+    customs = {}
+    config_section = "Foo/Bar/Baz"
+
+    def _fake_executed(self, args, subtest=None):
+        class DummyClass(object):   # pylint: disable=R0903
+            """ Clean class used for mocking """
+            pass
+        if subtest is None:
+            subtest = self.fake_subtest
+        docker_cmd = self.dockercmd.AsyncDockerCmd(subtest,
+                                                   'fake_subcommand')
+        docker_cmd._async_job = DummyClass()
+        docker_cmd._async_job.sp = subprocess.Popen(args, close_fds=True)
+        docker_cmd._stdin_feeder = self.dockercmd.StdinFeeder(None)
+        self.dockercmd.AsyncReaper.register(docker_cmd)
+        return docker_cmd
+
+    def test_reap_finished(self):
+        docker_cmd = self._fake_executed(['true'])
+        docker_cmd._async_job.sp.wait()
+        reaper = self.dockercmd.AsyncReaper
+        self.assertEqual(reaper.live(self.fake_subtest), 0)
+        self.assertEqual(reaper.kill_all(self.fake_subtest), 0)
+
+    def test_zombie_finished(self):
+        docker_cmd = self._fake_executed(['true'])
+        reaper = self.dockercmd.AsyncReaper
+        for _ in xrange(100):
+            if reaper.live(self.fake_subtest) == 0:
+                break
+            time.sleep(0.05)
+        # Exited, but nobody waited for it
+        self.assertEqual(reaper.live(self.fake_subtest), 0)
+        self.assertEqual(docker_cmd._async_job.sp.returncode, None)
+        self.assertEqual(reaper.kill_all(self.fake_subtest), 0)
+        self.assertEqual(docker_cmd._async_job.sp.returncode, 0)
+
+    def test_wait_unregisters(self):
+        docker_cmd = self._fake_executed(['sh', '-c', 'exit 3'])
+        docker_cmd._async_job.wait_for = (
+            lambda timeout: docker_cmd._async_job.sp.wait())
+        self.assertEqual(docker_cmd.wait(), 3)
+        self.assertEqual(self.dockercmd.AsyncReaper._live, {})
+
+    def test_kill_leftovers(self):
+        docker_cmd = self._fake_executed(['setsid', 'sleep', '60'])
+        reaper = self.dockercmd.AsyncReaper
+        self.assertEqual(reaper.live(self.fake_subtest), 1)
+        self.assertEqual(reaper.kill_all(self.fake_subtest), 1)
+        self.assertEqual(docker_cmd._async_job.sp.returncode, -9)
+        self.assertEqual(reaper.live(self.fake_subtest), 0)
+
+    def test_subsubtest_owned(self):
+        cls = self.subtest.SubSubtest
+        # Skip SubSubtest.__init__, it needs a real parent subtest
+        subsubtest = cls.__new__(cls)
+        subsubtest.parent_subtest = self.fake_subtest
+        subsubtest.config = self.fake_subtest.config
+        docker_cmd = self._fake_executed(['setsid', 'sleep', '60'],
+                                         subsubtest)
+        self.assertTrue(docker_cmd.owner_subtest is self.fake_subtest)
+        reaper = self.dockercmd.AsyncReaper
+        self.assertEqual(reaper.live(self.fake_subtest), 1)
+        self.assertEqual(reaper.kill_all(self.fake_subtest), 1)
+        self.assertEqual(docker_cmd._async_job.sp.returncode, -9)
+        self.assertEqual(reaper._live, {})
+
+    def test_max_clients(self):
+        self.fake_subtest.config['async_max_clients'] = 1
+        docker_cmd = self._fake_executed(['setsid', 'sleep', '60'])
+        docker_cmd.timeout = 0.1
+        self.assertRaises(self.dockercmd.DockerTestError, docker_cmd.execute)
+        self.dockercmd.AsyncReaper.kill_all(self.fake_subtest)
+
+
+class StdinFeeder(DockerCmdTestBase):
+    defaults = {'docker_path': '/foo/bar', 'docker_options': '--not_exist',
+                'docker_timeout': "42.0", 'docker_pidfile': '/foo/bar.pid'}
+    customs = {}
+    config_section = "Foo/Bar/Baz"
+
+    def test_passthrough(self):
+        for source in (None, "foobar", 42, sys.stdin):
+            feeder = self.dockercmd.StdinFeeder(source)
+            self.assertEqual(feeder.stdin, source)
+            feeder.close()
+
+    def test_iterable(self):
+        chunks = ("foo" * 10000, "", "bar", "baz" * 40000)
+        feeder = self.dockercmd.StdinFeeder(chunk for chunk in chunks)
+        data = ""
+        while True:
+            chunk = os.read(feeder.stdin, 4096)
+            if not chunk:
+                break
+            data += chunk
+        feeder.close()
+        self.assertEqual(data, "".join(chunks))
+
+    def test_subprocess_eof(self):
+        started = threading.Event()
+
+        def chunks():
+            yield "foo"
+            # Write end is still open while the child process starts
+            started.wait()
+            yield "bar"
+
+        feeder = self.dockercmd.StdinFeeder(chunks())
+        # Same as utils.run(), child inherits all non close-on-exec fds
+        cat = subprocess.Popen(['cat'], stdin=feeder.stdin,
+                               stdout=subprocess.PIPE, close_fds=False)
+        started.set()
+        # Kill cat instead of hanging forever, if it never sees EOF
+        timer = threading.Timer(10, cat.kill)
+        timer.start()
+        try:
+            stdout = cat.communicate()[0]
+        finally:
+            timer.cancel()
+            feeder.close()
+        self.assertEqual(cat.returncode, 0)
+        self.assertEqual(stdout, "foobar")
+
+    def test_early_close(self):
+        feeder = self.dockercmd.StdinFeeder("x" * 1024 for _ in xrange(1024))
+        os.read(feeder.stdin, 10)
+        # Must not block on un-read chunks
+        feeder.close()
+        self.assertFalse(feeder._thread.is_alive())
+
+    def _make_source(self, shell_command):
+        class ShellCmd(self.dockercmd.DockerCmd):
+            command = shell_command
+        return ShellCmd(self.fake_subtest, 'fake_subcommand')
+
+    def test_source_result(self):
+        source = self._make_source('echo foobar; echo bazbar >&2; true')
+        feeder = self.dockercmd.StdinFeeder(source)
+        self.assertEqual(feeder.stdin.read(), "foobar\n")
+        feeder.close(10)
+        self.assertEqual(feeder.source_result.exit_status, 0)
+        self.assertEqual(feeder.source_result.stderr, "bazbar\n")
+        feeder.check_source()
+
+    def test_source_failure(self):
+        source = self._make_source('exit 3')
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest,
+                                              'fake_subcommand')
+        try:
+            docker_cmd.execute(source)
+        except self.dockercmd.DockerCommandError, detail:
+            # CmdError is mocked, check its constructor arguments
+            command, result_obj = detail.args
+            self.assertEqual(command, source.command)
+            self.assertEqual(result_obj.exit_status, 3)
+        else:
+            self.fail("Failed source command did not raise")
+
+    def test_unsupported(self):
+        self.assertRaises(self.dockercmd.DockerTestError,
+                          self.dockercmd.StdinFeeder, 3.14)
+        docker_cmd = self.dockercmd.DockerCmd(self.fake_subtest,
+                                              'fake_subcommand')
+        docker_cmd.execute()
+        self.assertRaises(self.dockercmd.DockerTestError,
+                          self.dockercmd.StdinFeeder, docker_cmd)
+
 if __name__ == '__main__':
     unittest.main()
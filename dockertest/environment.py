@@ -7,9 +7,17 @@ Low-level/standalone host-environment handling/checking utilities/classes/data
        in autotest!
 """
 
+import hashlib
+import json
 import os
 import os.path
+import Queue
+import shlex
+import signal
 import subprocess
+import tempfile
+import threading
+import time
 
 class AllGoodBase(object):
 
@@ -121,6 +129,10 @@ class EnvCheck(AllGoodBase):
 
     """
     Represent aggregate result of calling all executables in envcheckdir
+
+    Up to ``envcheck_concurrency`` executables run at the same time, each
+    killed if still running after ``envcheck_timeout`` seconds (options
+    from config).  Details for each include its duration in seconds.
     """
 
     #: Dict-like containing configuration options
@@ -129,6 +141,12 @@ class EnvCheck(AllGoodBase):
     #: Skip configuration key for reference
     envcheck_skip_option = 'envcheck_skip'
 
+    #: Concurrency configuration key for reference
+    envcheck_concurrency_option = 'envcheck_concurrency'
+
+    #: Timeout configuration key for reference
+    envcheck_timeout_option = 'envcheck_timeout'
+
     #: Base path from which check scripts run
     envcheckdir = None
 
@@ -161,20 +179,246 @@ class EnvCheck(AllGoodBase):
                 self.callables[relpath] = subprocess.Popen
         self.call_callables()
 
+    # Private method doesn't need docstring
+    def _option(self, name, default):  # pylint: disable=C0111
+        value = str(self.config.get(name, '')).strip()
+        if not value:
+            return default
+        return float(value)
+
+    def call_callables(self):
+        names = [name for (name, call) in sorted(self.callables.items())
+                 if callable(call) and name not in self.skip]
+        # Parse once, any error raised here instead of inside workers
+        concurrency = int(self._option(self.envcheck_concurrency_option, 4))
+        timeout = self._option(self.envcheck_timeout_option, None)
+        work = Queue.Queue()
+        for name in names:
+            work.put(name)
+        _results = {}
+
+        def worker():  # private, no docstring pylint: disable=C0111
+            while True:
+                try:
+                    name = work.get_nowait()
+                except Queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    details = self.run_check(name, timeout)
+                except Exception, detail:
+                    # A missing result would count as passing
+                    details = {'exit': None, 'stdout': '', 'stderr': '',
+                               'duration': round(time.time() - start, 3),
+                               'timed_out': False,
+                               'error': "%s: %s" % (detail.__class__.__name__,
+                                                    detail)}
+                # dict item assignment is atomic
+                _results[name] = details
+
+        threads = [threading.Thread(target=worker)
+                   for _ in xrange(max(1, min(concurrency, len(names))))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.results.update(self.prepare_results(_results))
+
+    def run_check(self, name, timeout=None):
+
+        """
+        Run callable name to completion or timeout, return details dictionary
+
+        :param name: Name of executable relative to envcheckdir
+        :param timeout: Seconds before killing executable, None for no limit
+        :return: Dictionary with keys ``exit``, ``stdout``, ``stderr``,
+                 ``duration``, and ``timed_out``
+        """
+
+        start = time.time()
+        popen = self.callables[name](**self.callable_args(name))
+        timed_out = []
+
+        def kill():  # private, no docstring pylint: disable=C0111
+            timed_out.append(True)
+            try:
+                # Shell and everything it started
+                os.killpg(popen.pid, signal.SIGKILL)
+            except OSError:
+                pass  # Already exited
+
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, kill)
+            timer.start()
+        try:
+            (stdoutdata, stderrdata) = popen.communicate()
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return {'exit': popen.returncode,
+                'stdout': stdoutdata,
+                'stderr': stderrdata,
+                'duration': round(time.time() - start, 3),
+                'timed_out': bool(timed_out)}
+
     def prepare_results(self, results):
         dct = {}
-        # Wait for all subprocesses to finish
-        for relpath, popen in results.items():
-            (stdoutdata, stderrdata) = popen.communicate()
-            dct[relpath] = popen.returncode == 0
-            self.details[relpath] = {'exit':popen.returncode,
-                                     'stdout':stdoutdata,
-                                     'stderr':stderrdata}
+        for relpath, details in results.items():
+            dct[relpath] = details['exit'] == 0 and not details['timed_out']
+            self.details[relpath] = details
         return dct
 
     def callable_args(self, name):
         fullpath = os.path.join(self.envcheckdir, name)
-        # Arguments to subprocess.Popen for script "name"
-        return {'args':fullpath, 'bufsize':1, 'stdout':subprocess.PIPE,
-                'stderr':subprocess.PIPE, 'close_fds':True, 'shell':True,
-                'env':self.config}
+        # Arguments to subprocess.Popen for script "name".  Shell execs
+        # setsid in-place, so process ID becomes process group ID, without
+        # a (thread-unsafe) preexec_fn running between fork and exec.
+        return {'args':"exec setsid %s" % fullpath, 'bufsize':1,
+                'stdout':subprocess.PIPE, 'stderr':subprocess.PIPE,
+                'close_fds':True, 'shell':True, 'env':self.config}
+
+
+def docker_output(config, *args):
+
+    r"""
+    Return output lines of docker client with args, or None if it failed
+
+    :param config: Dict-like containing ``docker_path`` and
+                   ``docker_options`` options
+    :param \*args: Docker subcommand and it's arguments
+    """
+
+    if not config.get('docker_path'):
+        return None
+    argv = ([config['docker_path']] +
+            shlex.split(config.get('docker_options', '')) + list(args))
+    try:
+        popen = subprocess.Popen(argv, stdout=subprocess.PIPE,
+                                 stderr=open(os.devnull, 'wb'),
+                                 close_fds=True)
+    except OSError:
+        return None
+    stdout = popen.communicate()[0]
+    if popen.returncode != 0:
+        return None
+    return [line.strip() for line in stdout.splitlines() if line.strip()]
+
+
+def daemon_fingerprint(config, envcheckdir=None):
+
+    """
+    Return hex digest of state envchecks depend on, or None if unavailable
+
+    Covers all container, image, and volume IDs, ``envcheck_*`` options
+    in config, plus names, sizes, and mtimes of files in envcheckdir.
+
+    :param config: Same as for ``docker_output()``
+    :param envcheckdir: Absolute path to directory holding scripts, or None
+    """
+
+    cids = docker_output(config, 'ps', '--all', '--no-trunc', '--quiet')
+    iids = docker_output(config, 'images', '--all', '--no-trunc', '--quiet')
+    if cids is None or iids is None:
+        return None
+    # None when not supported by this docker version
+    vids = docker_output(config, 'volume', 'ls', '--quiet')
+    digest = hashlib.sha1()
+    digest.update("%d %s\0" % (len(cids), max(cids or [''])))
+    digest.update("%d %s\0" % (len(iids), ' '.join(sorted(iids))))
+    digest.update("%s\0" % (vids is not None and ' '.join(sorted(vids))))
+    for key in sorted(config.keys()):
+        if key.startswith('envcheck_'):
+            digest.update("%s=%s\0" % (key, config[key]))
+    if envcheckdir is not None:
+        for (dirpath, dirnames, filenames) in os.walk(envcheckdir,
+                                                      followlinks=True):
+            # os.walk() order depends on filesystem, make it stable
+            dirnames.sort()
+            for filename in sorted(filenames):
+                fullpath = os.path.join(dirpath, filename)
+                stat = os.stat(fullpath)
+                digest.update("%s %d %s\0"
+                              % (os.path.relpath(fullpath, envcheckdir),
+                                 stat.st_size, stat.st_mtime))
+    return digest.hexdigest()
+
+
+def events_between(config, since, until):
+
+    """
+    Return number of daemon events between two times, or None if unknown
+
+    :param config: Same as for ``docker_output()``
+    :param since: Start time, seconds since the epoch
+    :param until: End time, seconds since the epoch
+    """
+
+    events = docker_output(config, 'events', '--since=%d' % int(since),
+                           '--until=%d' % int(until))
+    if events is None:
+        return None
+    return len(events)
+
+
+class EnvCheckState(object):
+
+    """
+    Daemon state fingerprint from last clean ``EnvCheck``, in a JSON file
+
+    When the docker daemon's containers, images, and volumes, the envcheck
+    options and executables are unchanged, and no daemon events happened
+    since, envchecks would simply pass again.
+    """
+
+    def __init__(self, filename, config, envcheckdir=None):
+
+        """
+        Load last clean state from filename, take current fingerprint
+
+        :param filename: Path to JSON state file
+        :param config: Same as for ``docker_output()``
+        :param envcheckdir: Same as for ``daemon_fingerprint()``
+        """
+
+        self.filename = filename
+        self.config = config
+        #: Last clean state, with ``fingerprint`` and ``time`` keys
+        self.last = {}
+        try:
+            self.last = json.load(open(filename, 'rb'))
+        except (IOError, ValueError):
+            pass  # Missing or corrupt, checks will run
+        self.time = time.time()
+        self.fingerprint = daemon_fingerprint(config, envcheckdir)
+
+    def unchanged(self):
+
+        """
+        Return True if daemon state matches last clean state
+        """
+
+        if (self.fingerprint is None or
+                self.fingerprint != self.last.get('fingerprint')):
+            return False
+        # Containers may come and go, without changing the fingerprint
+        events = events_between(self.config, self.last.get('time', 0),
+                                self.time)
+        # Events not supported by this docker version, rely on fingerprint
+        return not events
+
+    def record(self):
+
+        """
+        Store current state as clean, if fingerprint is known
+        """
+
+        if self.fingerprint is None:
+            return
+        osfd, tmpname = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)))
+        state_file = os.fdopen(osfd, 'wb')
+        json.dump({'fingerprint': self.fingerprint, 'time': self.time},
+                  state_file)
+        state_file.close()
+        os.rename(tmpname, self.filename)
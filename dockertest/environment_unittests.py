@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class EnvCheckTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import environment
+        self.environment = environment
+        self.envcheckdir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config = {'envcheck_skip': '', 'envcheck_concurrency': '4',
+                       'envcheck_timeout': '10', 'PATH': os.environ['PATH']}
+
+    def tearDown(self):
+        shutil.rmtree(self.envcheckdir, ignore_errors=True)
+
+    def add_check(self, name, content):
+        fullpath = os.path.join(self.envcheckdir, name)
+        check = open(fullpath, 'wb')
+        check.write("#!/bin/sh\n%s\n" % content)
+        check.close()
+        os.chmod(fullpath, 0755)
+
+
+class EnvCheckTest(EnvCheckTestBase):
+
+    def test_results(self):
+        self.add_check('good.sh', 'echo foo; echo bar >&2')
+        self.add_check('bad.sh', 'exit 3')
+        # Not executable, not a check
+        open(os.path.join(self.envcheckdir, 'README'), 'wb').close()
+        envcheck = self.environment.EnvCheck(self.config, self.envcheckdir)
+        self.assertFalse(envcheck)
+        self.assertEqual(envcheck.results, {'good.sh': True, 'bad.sh': False})
+        self.assertEqual(envcheck.details['good.sh']['stdout'], 'foo\n')
+        self.assertEqual(envcheck.details['good.sh']['stderr'], 'bar\n')
+        self.assertEqual(envcheck.details['bad.sh']['exit'], 3)
+        self.assertTrue(envcheck.details['bad.sh']['duration'] >= 0)
+
+    def test_skip(self):
+        self.add_check('bad.sh', 'exit 1')
+        self.add_check('good.sh', 'exit 0')
+        self.config['envcheck_skip'] = 'bad.sh,'
+        envcheck = self.environment.EnvCheck(self.config, self.envcheckdir)
+        self.assertTrue(envcheck)
+        self.assertEqual(envcheck.results.keys(), ['good.sh'])
+
+    def test_concurrent(self):
+        for number in xrange(4):
+            self.add_check('sleep%d.sh' % number, 'sleep 1')
+        start = time.time()
+        envcheck = self.environment.EnvCheck(self.config, self.envcheckdir)
+        self.assertTrue(envcheck)
+        self.assertTrue(time.time() - start < 3)
+
+    def test_timeout(self):
+        self.add_check('hung.sh', 'sleep 60; sleep 60')
+        self.config['envcheck_timeout'] = '0.5'
+        start = time.time()
+        envcheck = self.environment.EnvCheck(self.config, self.envcheckdir)
+        self.assertTrue(time.time() - start < 30)
+        self.assertFalse(envcheck)
+        self.assertTrue(envcheck.details['hung.sh']['timed_out'])
+
+    def test_process_group(self):
+        # Timeout kills whole group, check must be its leader
+        self.add_check('leader.sh', 'test $(ps -o pgid= -p $$) -eq $$')
+        envcheck = self.environment.EnvCheck(self.config, self.envcheckdir)
+        self.assertTrue(envcheck, envcheck.details)
+
+    def test_exception(self):
+        self.add_check('good.sh', 'exit 0')
+        self.add_check('broken.sh', 'exit 0')
+        envcheck_class = self.environment.EnvCheck
+
+        class BrokenEnvCheck(envcheck_class):
+
+            def run_check(self, name, timeout=None):
+                if name == 'broken.sh':
+                    raise OSError("No such file")
+                return envcheck_class.run_check(self, name, timeout)
+
+        envcheck = BrokenEnvCheck(self.config, self.envcheckdir)
+        self.assertFalse(envcheck)
+        self.assertEqual(envcheck.results, {'good.sh': True,
+                                            'broken.sh': False})
+        self.assertEqual(envcheck.details['broken.sh']['error'],
+                         'OSError: No such file')
+
+    def test_bad_option(self):
+        self.add_check('good.sh', 'exit 0')
+        self.config['envcheck_timeout'] = 'forever'
+        self.assertRaises(ValueError, self.environment.EnvCheck,
+                          self.config, self.envcheckdir)
+
+
+class EnvCheckStateTest(EnvCheckTestBase):
+
+    def setUp(self):
+        super(EnvCheckStateTest, self).setUp()
+        # Separate from envcheckdir, its listing is part of the state
+        self.dockerdir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config['docker_path'] = os.path.join(self.dockerdir, 'docker')
+        self.config['docker_options'] = '-D'
+        self.statefile = os.path.join(self.dockerdir, 'state.json')
+        self.add_check('good.sh', 'exit 0')
+        self.set_docker(cids='c1 c2', iids='i1', events='')
+
+    def tearDown(self):
+        shutil.rmtree(self.dockerdir, ignore_errors=True)
+        super(EnvCheckStateTest, self).tearDown()
+
+    def set_docker(self, cids, iids, events, vids='v1'):
+        docker = open(self.config['docker_path'], 'wb')
+        docker.write('#!/bin/sh\ncase "$2" in\n'
+                     'ps) for x in %s; do echo $x; done;;\n'
+                     'images) for x in %s; do echo $x; done;;\n'
+                     'events) for x in %s; do echo $x; done;;\n'
+                     'volume) for x in %s; do echo $x; done;;\n'
+                     'esac\n' % (cids, iids, events, vids))
+        docker.close()
+        os.chmod(self.config['docker_path'], 0755)
+
+    def state(self):
+        return self.environment.EnvCheckState(self.statefile, self.config,
+                                              self.envcheckdir)
+
+    def test_unchanged(self):
+        state = self.state()
+        self.assertFalse(state.unchanged())
+        state.record()
+        self.assertTrue(self.state().unchanged())
+        self.set_docker(cids='c1 c2', iids='i1 i2', events='')
+        self.assertFalse(self.state().unchanged())
+
+    def test_volumes(self):
+        self.state().record()
+        self.set_docker(cids='c1 c2', iids='i1', events='', vids='v1 v2')
+        self.assertFalse(self.state().unchanged())
+
+    def test_config(self):
+        self.state().record()
+        self.config['envcheck_ignore_iids'] = 'i1'
+        self.assertFalse(self.state().unchanged())
+        self.state().record()
+        self.config['envcheck_skip'] = 'good.sh,'
+        self.assertFalse(self.state().unchanged())
+
+    def test_envcheckdir(self):
+        self.state().record()
+        self.add_check('new.sh', 'exit 0')
+        self.assertFalse(self.state().unchanged())
+
+    def test_events(self):
+        self.state().record()
+        self.set_docker(cids='c1 c2', iids='i1', events='create destroy')
+        self.assertFalse(self.state().unchanged())
+
+    def test_unavailable(self):
+        self.config['docker_path'] = '/not/exist/docker'
+        state = self.state()
+        self.assertEqual(state.fingerprint, None)
+        state.record()
+        self.assertFalse(os.path.isfile(self.statefile))
+        self.assertFalse(state.unchanged())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+
+"""
+Low-overhead command execution through small, pre-started helper processes
+
+Forking a large process (i.e. the autotest client) is expensive, and
+``utils.run()`` additionally starts a shell before the actual command.
+Instead, ``ExecServer`` starts this module as a separate, minimal python
+process.  It receives argument vectors over a pipe, fork/execs them
+directly (no shell), and sends back exit status and output.
+
+:Note: This module must _NOT_ depend on anything in dockertest package or
+       in autotest!
+"""
+
+import errno
+import marshal
+import os
+import os.path
+import select
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+#: Format of the length-prefix header preceding every message
+HEADER = '!I'
+
+
+def write_message(fileobj, obj):
+    """
+    Serialize obj (dict of basic types) onto fileobj with length prefix
+
+    :param fileobj: Writable file-like object
+    :param obj: Object of types supported by the marshal module
+    """
+    data = marshal.dumps(obj)
+    fileobj.write(struct.pack(HEADER, len(data)) + data)
+    fileobj.flush()
+
+
+def read_message(fileobj):
+    """
+    Return next message deserialized from fileobj, or None on EOF
+
+    :param fileobj: Readable file-like object
+    """
+    header = fileobj.read(struct.calcsize(HEADER))
+    if len(header) < struct.calcsize(HEADER):
+        return None
+    length = struct.unpack(HEADER, header)[0]
+    return marshal.loads(fileobj.read(length))
+
+
+def run_argv(argv, stdin=None, timeout=None):
+    """
+    Execute argv w/o a shell, return dictionary describing the outcome
+
+    :param argv: List of program name and arguments
+    :param stdin: Optional string to feed into standard input
+    :param timeout: Seconds to wait before killing the process, None forever
+    :return: Dictionary with keys ``exit_status``, ``stdout``, ``stderr``,
+             ``duration``, and ``timed_out``.
+    """
+    start = time.time()
+    try:
+        popen = subprocess.Popen(argv, stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, close_fds=True)
+    except OSError, detail:
+        # Same as a shell would report
+        return {'exit_status': 127, 'stdout': '', 'stderr': str(detail),
+                'duration': time.time() - start, 'timed_out': False}
+    outputs = {popen.stdout: [], popen.stderr: []}
+    readers = outputs.keys()
+    if stdin:
+        writers = [popen.stdin]
+    else:
+        popen.stdin.close()
+        writers = []
+    timed_out = False
+    while readers or writers:
+        if timeout is None:
+            remaining = None
+        else:
+            remaining = start + timeout - time.time()
+            if remaining <= 0:
+                timed_out = True
+                popen.kill()
+                break
+        readable, writable, _ = select.select(readers, writers, [],
+                                              remaining)
+        for fileobj in readable:
+            data = os.read(fileobj.fileno(), 65536)
+            if data:
+                outputs[fileobj].append(data)
+            else:
+                readers.remove(fileobj)
+        if writable:
+            try:
+                written = os.write(popen.stdin.fileno(), stdin[:65536])
+                stdin = stdin[written:]
+            except OSError, detail:
+                if detail.errno != errno.EPIPE:
+                    raise
+                stdin = ''
+            if not stdin:
+                popen.stdin.close()
+                writers = []
+    exit_status = popen.wait()
+    return {'exit_status': exit_status,
+            'stdout': ''.join(outputs[popen.stdout]),
+            'stderr': ''.join(outputs[popen.stderr]),
+            'duration': time.time() - start,
+            'timed_out': timed_out}
+
+
+def serve(infile, outfile):
+    """
+    Answer run_argv() requests read from infile onto outfile until EOF
+
+    :param infile: Readable file-like carrying request messages
+    :param outfile: Writable file-like to carry response messages
+    """
+    while True:
+        request = read_message(infile)
+        if request is None:
+            break
+        write_message(outfile, run_argv(request['argv'],
+                                        request.get('stdin'),
+                                        request.get('timeout')))
+
+
+class ExecServer(object):
+    """
+    Client-side handle to one helper process running ``serve()``
+    """
+
+    #: Absolute path to this module's source, executed as the helper
+    script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+    #: Private, pool of idle instances available to run()
+    _idle = []
+
+    #: Private, serializes access to _idle
+    _lock = threading.Lock()
+
+    #: Private, process ID which started the instances in _idle
+    _owner = None
+
+    def __init__(self):
+        """
+        Start a new helper process
+        """
+        self.popen = subprocess.Popen([sys.executable, self.script],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      close_fds=True,
+                                      preexec_fn=self._ignore_sigint)
+
+    # Private method doesn't need docstring
+    @staticmethod
+    def _ignore_sigint():  # pylint: disable=C0111
+        # Ctrl-C is handled by the parent, which closes the pipe
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    def request(self, argv, stdin=None, timeout=None):
+        """
+        Have this instance's helper execute argv, return outcome dictionary
+
+        :param argv: List of program name and arguments
+        :param stdin: Optional string to feed into standard input
+        :param timeout: Seconds to wait before killing the process
+        :return: Same as ``run_argv()``
+        :raises IOError: if the helper process died, with errno EPIPE when
+                         argv was never sent (i.e. it surely didn't run)
+        """
+        write_message(self.popen.stdin, {'argv': list(argv),
+                                         'stdin': stdin,
+                                         'timeout': timeout})
+        response = read_message(self.popen.stdout)
+        if response is None:
+            raise IOError("Exec server process %d died" % self.popen.pid)
+        return response
+
+    def close(self):
+        """
+        Stop helper process
+        """
+        try:
+            self.popen.stdin.close()
+        except IOError:
+            pass  # Helper already gone, un-sent data doesn't matter
+        self.popen.stdout.close()
+        self.popen.wait()
+
+    @classmethod
+    def run(cls, argv, stdin=None, timeout=None):
+        """
+        Execute argv through an idle (or new) helper, return outcome dictionary
+
+        Concurrent callers each get their own helper, which is returned to
+        the pool afterwards.  A pooled helper found dead before argv could
+        be sent is dropped, and argv retried once on a new helper.
+
+        :param argv: List of program name and arguments
+        :param stdin: Optional string to feed into standard input
+        :param timeout: Seconds to wait before killing the process
+        :return: Same as ``run_argv()``
+        :raises IOError: if the helper process died
+        """
+        cls._lock.acquire()
+        try:
+            # Helpers started by a parent process can't be shared after fork
+            if cls._owner != os.getpid():
+                cls._idle = []
+                cls._owner = os.getpid()
+            if cls._idle:
+                server = cls._idle.pop()
+            else:
+                server = None
+        finally:
+            cls._lock.release()
+        if server is None:
+            server = cls()
+            response = server.request(argv, stdin, timeout)
+        else:
+            try:
+                response = server.request(argv, stdin, timeout)
+            except IOError, detail:
+                server.close()
+                # Once sent, argv may have run, don't repeat it
+                if detail.errno != errno.EPIPE:
+                    raise
+                server = cls()
+                response = server.request(argv, stdin, timeout)
+        cls._lock.acquire()
+        try:
+            cls._idle.append(server)
+        finally:
+            cls._lock.release()
+        return response
+
+
+if __name__ == "__main__":
+    serve(sys.stdin, sys.stdout)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import os
+import unittest
+
+
+class ExecServerTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import execserver
+        self.execserver = execserver
+
+
+class RunArgvTest(ExecServerTestBase):
+
+    def test_output(self):
+        result = self.execserver.run_argv(['sh', '-c', 'echo foo; '
+                                           'echo bar >&2; exit 3'])
+        self.assertEqual(result['stdout'], 'foo\n')
+        self.assertEqual(result['stderr'], 'bar\n')
+        self.assertEqual(result['exit_status'], 3)
+        self.assertFalse(result['timed_out'])
+
+    def test_stdin(self):
+        data = "foobarbaz\n" * 100000
+        result = self.execserver.run_argv(['cat'], data)
+        self.assertEqual(result['stdout'], data)
+        self.assertEqual(result['exit_status'], 0)
+
+    def test_no_shell(self):
+        result = self.execserver.run_argv(['echo', '$HOME', '|', 'cat'])
+        self.assertEqual(result['stdout'], '$HOME | cat\n')
+
+    def test_not_found(self):
+        result = self.execserver.run_argv(['/not/exist/foobar'])
+        self.assertEqual(result['exit_status'], 127)
+
+    def test_timeout(self):
+        result = self.execserver.run_argv(['sleep', '60'], timeout=0.5)
+        self.assertTrue(result['timed_out'])
+        self.assertTrue(result['duration'] < 30)
+
+
+class ExecServerTest(ExecServerTestBase):
+
+    def test_run(self):
+        result = self.execserver.ExecServer.run(['echo', 'foo'])
+        self.assertEqual(result['stdout'], 'foo\n')
+        result = self.execserver.ExecServer.run(['cat'], 'bar')
+        self.assertEqual(result['stdout'], 'bar')
+        # Helper is re-used, not restarted
+        self.assertEqual(len(self.execserver.ExecServer._idle), 1)
+        self.assertEqual(self.execserver.ExecServer._owner, os.getpid())
+
+    def test_dead_helper(self):
+        self.execserver.ExecServer.run(['true'])
+        server = self.execserver.ExecServer._idle[-1]
+        server.popen.kill()
+        server.popen.wait()
+        result = self.execserver.ExecServer.run(['echo', 'foo'])
+        self.assertEqual(result['stdout'], 'foo\n')
+        self.assertFalse(server in self.execserver.ExecServer._idle)
+
+    def test_died_during_request(self):
+        server = self.execserver.ExecServer()
+        try:
+            # Helper kills itself while running argv
+            self.assertRaises(IOError, server.request,
+                              ['kill', '-9', str(server.popen.pid)])
+        finally:
+            server.close()
+
+    def test_close(self):
+        server = self.execserver.ExecServer()
+        result = server.request(['true'])
+        self.assertEqual(result['exit_status'], 0)
+        server.close()
+        self.assertEqual(server.popen.returncode, 0)
+
+if __name__ == '__main__':
+    unittest.main()
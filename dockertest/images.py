@@ -27,6 +27,7 @@ Note: As in other places, the terms 'repo' and 'image' are used
 
 import re
 from config import none_if_empty
+from names import NameReservations
 from autotest.client import utils
 from output import OutputGood
 from subtest import Subtest
@@ -49,6 +50,15 @@ class DockerImage(object):  # pylint: disable=R0902
     #: (repository_name[:version_tag])``
     repo_split_p = re.compile(r"(.+?(:\w+?)?/)?([<\w>]+/)?([^:.]+)(:[<\w>]+)?")
 
+    #: Maximum number of parsed FQINs kept by split_to_component()
+    split_cache_size = 4096
+
+    #: Private, recently used FQIN to components tuple cache
+    _split_recent = {}
+
+    #: Private, previous generation of _split_recent, dropped when it's full
+    _split_older = {}
+
     # Many arguments are simply required here
     # pylint: disable=R0913
     def __init__(self, repo, tag, long_id, created, size,
@@ -96,6 +106,22 @@ class DockerImage(object):  # pylint: disable=R0902
                 return False
         return True
 
+    def __ne__(self, other):
+        """
+        Return True if this instance differs from other, see __eq__()
+
+        :param other: An instance of this class (or subclass) for comparison.
+        """
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        """
+        Hash by long_id, equal instances always share it
+
+        :note: Don't modify long_id while instance is in a set or dict
+        """
+        return hash(self.long_id)
+
     def __str__(self):
         """
         Break down full_name components into a human-readable string
@@ -111,11 +137,14 @@ class DockerImage(object):  # pylint: disable=R0902
         """
         return "DockerImage(%s)" % str(self)
 
-    @staticmethod
-    def split_to_component(full_name):
+    @classmethod
+    def split_to_component(cls, full_name):
         """
         Split full_name FQIN string into separate component strings
 
+        Up to ``split_cache_size`` recently used full_names are cached, so
+        repeated comparisons don't re-parse them.
+
         :Note: Be careful when mixing ``repo_addr`` and ``user`` name, as
                there could be content-dependent side-effects.
 
@@ -123,17 +152,32 @@ class DockerImage(object):  # pylint: disable=R0902
         :return: Iterable of repo, tag, repo_addr, user strings
         """
         try:
-            (repo_addr, _, user,
-             repo, tag) = DockerImage.repo_split_p.match(full_name).groups()
-            if repo_addr:
-                repo_addr = repo_addr[:-1]
-            if user:
-                user = user[:-1]
-            if tag:
-                tag = tag[1:]
-        except:
-            raise DockerFullNameFormatError(full_name)
-        return repo, tag, repo_addr, user
+            return cls._split_recent[full_name]
+        except KeyError:
+            components = cls._split_older.get(full_name)
+        except TypeError:
+            components = None  # Not hashable, fails parsing below
+        if components is None:
+            try:
+                (repo_addr, _, user,
+                 repo, tag) = cls.repo_split_p.match(full_name).groups()
+                if repo_addr:
+                    repo_addr = repo_addr[:-1]
+                if user:
+                    user = user[:-1]
+                if tag:
+                    tag = tag[1:]
+            except:
+                raise DockerFullNameFormatError(full_name)
+            components = (repo, tag, repo_addr, user)
+        # Approximate LRU with plain dicts: Once half the size is reached,
+        # names not used since the previous time are dropped.  Races between
+        # threads can only cause extra parsing.
+        if len(cls._split_recent) >= cls.split_cache_size // 2:
+            cls._split_older = cls._split_recent
+            cls._split_recent = {}
+        cls._split_recent[full_name] = components
+        return components
 
     @staticmethod
     def full_name_from_component(repo, tag=None, repo_addr=None, user=None):
@@ -257,6 +301,29 @@ class DockerImage(object):  # pylint: disable=R0902
         return self.cmp_greedy(repo, tag, repo_addr, user)
 
 
+def listing_changes(before, after):
+    """
+    Compare two listings of instances having a ``long_id``, using set algebra
+
+    Works for any hashable instances with ``long_id`` attribute, such as
+    DockerImage-like or DockerContainer-like instances.
+
+    :param before: Iterable of instances listed first
+    :param after: Iterable of instances listed later
+    :return: Tuple of three sets of instances: added (``long_id`` only in
+             after), removed (``long_id`` only in before), and changed
+             (from after, unequal to any in before with same ``long_id``).
+    """
+    before = set(before)
+    after = set(after)
+    before_ids = set(item.long_id for item in before)
+    after_ids = set(item.long_id for item in after)
+    added = set(item for item in after if item.long_id not in before_ids)
+    removed = set(item for item in before if item.long_id not in after_ids)
+    changed = (after - before) - added
+    return added, removed, changed
+
+
 class DockerImagesBase(object):
     """
     Implementation defined collection of DockerImage-like instances with
@@ -302,17 +369,11 @@ class DockerImagesBase(object):
         :param prefix: Name prefix
         :param suffix: Name suffix
         :param length: Length of random string (greater than 1)
-        :return: Image name guaranteed to not be in-use.
+        :return: Image name not seen in-use, nor reserved before.
         """
         assert length > 1
-        all_images = self.list_imgs_full_name()
-        _name = "_".join([_ for _ in (prefix, '%s', suffix) if _])
-        for _ in xrange(1000):
-            name = _name % utils.generate_random_string(length)
-            if self.gen_lower_only:
-                name = name.lower()
-            if name not in all_images:
-                return name
+        return NameReservations.reserve('image', prefix, suffix, length,
+                                        self.gen_lower_only)
 
     # Not defined static on purpose
     def get_dockerimages_list(self):    # pylint: disable=R0201
@@ -514,7 +575,9 @@ class DockerImagesCLI(DockerImagesBase):
 
     def get_dockerimages_list(self):
         stdout = self._get_images_list().stdout
-        return self._parse_colums(stdout)
+        dis = self._parse_colums(stdout)
+        NameReservations.seen('image', [di.full_name for di in dis])
+        return dis
 
     def remove_image_by_id(self, image_id):
         """
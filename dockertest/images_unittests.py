@@ -132,6 +132,8 @@ class ImageTestBase(unittest.TestCase):
         self.subtest = subtest
         self.config.CONFIGDEFAULT = tempfile.mkdtemp(self.__class__.__name__)
         self.config.CONFIGCUSTOMS = tempfile.mkdtemp(self.__class__.__name__)
+        self.cachedir = tempfile.mkdtemp(self.__class__.__name__)
+        self.config.CONFIGCACHE = os.path.join(self.cachedir, '.config_cache')
         self._setup_defaults()
         self._setup_customs()
         self.fake_subtest = self._make_fake_subtest()
@@ -139,6 +141,7 @@ class ImageTestBase(unittest.TestCase):
     def tearDown(self):
         shutil.rmtree(self.config.CONFIGDEFAULT, ignore_errors=True)
         shutil.rmtree(self.config.CONFIGCUSTOMS, ignore_errors=True)
+        shutil.rmtree(self.cachedir, ignore_errors=True)
         self.assertFalse(os.path.isdir(self.config.CONFIGDEFAULT))
         self.assertFalse(os.path.isdir(self.config.CONFIGCUSTOMS))
         del self.config
@@ -324,5 +327,39 @@ class DockerImageTestBasic(ImageTestBase):
                          '/foo/bar command_pass')
 
 
+    def test_listing_changes(self):
+        DI = self.images.DockerImage
+        foo = DI('foo', 'latest', 'a' * 64, 'today', '1 GB')
+        bar = DI('bar', 'latest', 'b' * 64, 'today', '1 GB')
+        baz = DI('baz', 'latest', 'c' * 64, 'today', '1 GB')
+        retagged = DI('bar', 'new', 'b' * 64, 'today', '1 GB')
+        self.assertEqual(hash(foo), hash(DI('foo', 'latest', 'a' * 64,
+                                            'today', '1 GB')))
+        self.assertFalse(foo != DI('foo', 'latest', 'a' * 64, 'today',
+                                   '1 GB'))
+        self.assertTrue(bar != retagged)
+        added, removed, changed = self.images.listing_changes(
+            [foo, bar], [bar, retagged, baz])
+        self.assertEqual(added, set([baz]))
+        self.assertEqual(removed, set([foo]))
+        self.assertEqual(changed, set([retagged]))
+
+
+    def test_split_cache(self):
+        DI = self.images.DockerImage
+        names = ['host:5000/user/repo%d:tag' % number
+                 for number in xrange(DI.split_cache_size * 2)]
+        for name in names + names:
+            self.assertEqual(DI.split_to_component(name),
+                             ('repo%s' % name[19:-4], 'tag', 'host:5000',
+                              'user'))
+            self.assertTrue(len(DI._split_recent) +
+                            len(DI._split_older) <= DI.split_cache_size)
+        self.assertEqual(DI.split_to_component('user/repo'),
+                         ('repo', None, 'user', None))
+        self.assertRaises(self.images.DockerFullNameFormatError,
+                          DI.split_to_component, None)
+
+
 if __name__ == '__main__':
     unittest.main()
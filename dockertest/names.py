@@ -0,0 +1,154 @@
+"""
+Process-wide reservation of unique container and image names
+
+Generated names combine a random string with a per-process counter,
+so they are very unlikely to collide with any other test run's names.
+Instead of listing every container or image on each request, names are
+checked against an index of those seen by listings already made, and
+against names handed out previously.  Reserved names are never handed
+out twice, even to concurrently running subsubtests.
+
+:Note: This module must _NOT_ depend on anything in autotest!
+"""
+
+import os
+import random
+import string
+import threading
+
+#: Characters used in generated parts of names, valid for any name kind
+NAME_CHARS = string.ascii_lowercase + string.digits
+
+
+def base36(number):
+    """
+    Return non-negative integer number as string of ``NAME_CHARS`` digits
+    """
+    digits = []
+    while True:
+        number, digit = divmod(number, 36)
+        digits.append((string.digits + string.ascii_lowercase)[digit])
+        if not number:
+            break
+    return ''.join(reversed(digits))
+
+
+class NameReservations(object):
+
+    """
+    Class-level registry of names in-use or reserved, per kind of name
+
+    Kinds are arbitrary strings, e.g. ``'container'`` or ``'image'``.
+    """
+
+    #: Maximum attempts at generating an unused name
+    max_attempts = 1000
+
+    #: Private, serializes access to all class attributes below
+    _lock = threading.Lock()
+
+    #: Private, independent of (test) seeding of the random module
+    _random = random.SystemRandom()
+
+    #: Private, mapping of kind to set of names reserved by this process
+    _reserved = {}
+
+    #: Private, mapping of kind to set of names seen in listings
+    _in_use = {}
+
+    #: Private, next counter value, distinct for every reservation
+    _counter = 0
+
+    #: Private, process ID which initialized _counter
+    _owner = None
+
+    @classmethod
+    def generate(cls, prefix="", suffix="", length=4):
+        """
+        Return new (not reserved) name, ``<prefix>_<token>_<suffix>``
+
+        :param prefix: Name prefix, omitted if empty
+        :param suffix: Name suffix, omitted if empty
+        :param length: Number of random characters in token
+        """
+        cls._lock.acquire()
+        try:
+            # Forked processes must not repeat their parent's counter
+            if cls._owner != os.getpid():
+                cls._owner = os.getpid()
+                cls._counter = cls._owner * 1000
+            counter = cls._counter
+            cls._counter += 1
+        finally:
+            cls._lock.release()
+        token = ''.join([cls._random.choice(NAME_CHARS)
+                         for _ in xrange(length)]) + base36(counter)
+        return "_".join([_ for _ in (prefix, token, suffix) if _])
+
+    @classmethod
+    def seen(cls, kind, names):
+        """
+        Record names of kind found in-use, e.g. by a full listing
+
+        :param kind: Kind of names, e.g. ``'container'``
+        :param names: Iterable of names
+        """
+        cls._lock.acquire()
+        try:
+            cls._in_use.setdefault(kind, set()).update(names)
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def reserve(cls, kind, prefix="", suffix="", length=4, lower=False):
+        """
+        Return new name of kind, not in-use or reserved by anyone else
+
+        :param kind: Kind of name, e.g. ``'container'``
+        :param prefix: Name prefix
+        :param suffix: Name suffix
+        :param length: Number of random characters in name
+        :param lower: When True, make returned name all lower-case
+        :raises ValueError: if no unused name found
+        """
+        for _ in xrange(cls.max_attempts):
+            name = cls.generate(prefix, suffix, length)
+            if lower:
+                name = name.lower()
+            cls._lock.acquire()
+            try:
+                reserved = cls._reserved.setdefault(kind, set())
+                if (name not in reserved and
+                        name not in cls._in_use.get(kind, ())):
+                    reserved.add(name)
+                    return name
+            finally:
+                cls._lock.release()
+        raise ValueError("No unused %s name found with prefix '%s' and "
+                         "suffix '%s'" % (kind, prefix, suffix))
+
+    @classmethod
+    def release(cls, kind, name):
+        """
+        Forget reservation of name of kind, if any
+
+        :param kind: Kind of name, e.g. ``'container'``
+        :param name: Name previously returned by ``reserve()``
+        """
+        cls._lock.acquire()
+        try:
+            cls._reserved.get(kind, set()).discard(name)
+        finally:
+            cls._lock.release()
+
+    @classmethod
+    def clear(cls):
+        """
+        Forget all reservations and names seen
+        """
+        cls._lock.acquire()
+        try:
+            cls._reserved = {}
+            cls._in_use = {}
+        finally:
+            cls._lock.release()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+# Pylint runs from a different directory, it's fine to import this way
+# pylint: disable=W0403
+
+import os
+import threading
+import unittest
+
+
+class NamesTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import names
+        self.names = names
+        self.reservations = names.NameReservations
+        self.reservations.clear()
+
+    def tearDown(self):
+        self.reservations.clear()
+
+    def constant(self, name):
+        # Reservations always generating the same name
+        class Constant(self.reservations):
+            @classmethod
+            def generate(cls, prefix="", suffix="", length=4):
+                return name
+        return Constant
+
+
+class Base36Test(NamesTestBase):
+
+    def test_base36(self):
+        self.assertEqual(self.names.base36(0), '0')
+        self.assertEqual(self.names.base36(35), 'z')
+        self.assertEqual(self.names.base36(36), '10')
+        self.assertEqual(self.names.base36(36 ** 3 - 1), 'zzz')
+
+
+class GenerateTest(NamesTestBase):
+
+    def test_format(self):
+        name = self.reservations.generate('pre', 'suf', 6)
+        pre, token, suf = name.split('_')
+        self.assertEqual((pre, suf), ('pre', 'suf'))
+        counter = self.names.base36(self.reservations._counter - 1)
+        self.assertEqual(token[6:], counter)
+        self.assertEqual(len(token), 6 + len(counter))
+
+    def test_no_prefix_suffix(self):
+        self.assertFalse('_' in self.reservations.generate())
+
+    def test_counter_per_process(self):
+        self.reservations._owner = os.getpid() + 1
+        self.reservations.generate()
+        self.assertEqual(self.reservations._counter, os.getpid() * 1000 + 1)
+
+
+class ReserveTest(NamesTestBase):
+
+    def test_unique(self):
+        names = set([self.reservations.reserve('container', 'test', length=2)
+                     for _ in xrange(500)])
+        self.assertEqual(len(names), 500)
+
+    def test_lower(self):
+        name = self.reservations.reserve('image', 'UPPER', lower=True)
+        self.assertEqual(name, name.lower())
+
+    def test_kinds_independent(self):
+        reservations = self.constant('same')
+        self.assertEqual(reservations.reserve('image'), 'same')
+        self.assertEqual(reservations.reserve('container'), 'same')
+        self.assertRaises(ValueError, reservations.reserve, 'image')
+
+    def test_seen(self):
+        reservations = self.constant('used')
+        reservations.seen('container', ['used'])
+        self.assertRaises(ValueError, reservations.reserve, 'container')
+        self.assertEqual(reservations.reserve('image'), 'used')
+
+    def test_release(self):
+        reservations = self.constant('again')
+        reservations.reserve('container')
+        reservations.release('container', 'again')
+        self.assertEqual(reservations.reserve('container'), 'again')
+
+    def test_threads(self):
+        reserved = []
+
+        def reserve():
+            for _ in xrange(100):
+                reserved.append(self.reservations.reserve('image'))
+
+        threads = [threading.Thread(target=reserve) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(reserved)), 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
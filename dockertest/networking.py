@@ -67,6 +67,21 @@ class ContainerPort(object):
                 return False
         return True
 
+    def __ne__(self, other):
+        """
+        Return True if this instance differs from other, see __eq__()
+
+        :param other: An instance of this class (or subclass) for comparison.
+        """
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        """
+        Hash by full port mapping, equal instances always share it
+        """
+        return hash((self.container_port, self.host_port, self.host_ip,
+                     self.protocol))
+
     def __str__(self):
         """
         Break down port string components into a human-readable format
@@ -45,6 +45,9 @@ class ContainerPortTest(NetworkingTestBase):
         self.assertEqual(cp3, cp3)
         self.assertNotEqual(cp3, cp1)
         self.assertNotEqual(cp3, cp2)
+        self.assertFalse(cp1 != cp2)
+        self.assertEqual(hash(cp1), hash(cp2))
+        self.assertEqual(set([cp1, cp2, cp3]), set([cp3, cp2]))
 
     def test_str(self):
         container_port = 4321
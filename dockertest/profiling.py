@@ -0,0 +1,271 @@
+"""
+Measure where subtest run time goes, stage by stage or function by function
+
+Each ``StageTimer`` records the wall-clock time, CPU time (including
+reaped child processes), and number of docker commands executed over
+a single subtest or subsubtest stage (e.g. ``initialize`` or
+``cleanup``).  Results are appended to a job-wide tab-separated file,
+so ``slowest_stages()`` can summarize them once all subtests finished.
+Profilers from ``new_profiler()`` record function-level detail about
+a whole subtest, according to it's ``profile`` option.
+
+:Note: This module must _NOT_ depend on anything in autotest!
+"""
+
+import cProfile
+import fcntl
+import os
+import signal
+import sys
+import thread
+import threading
+import time
+
+#: Name of the stage times file, within the job's results directory
+STAGE_TIMES_FILE = 'stage_times'
+
+#: Private, per-thread count of docker commands started
+_commands = threading.local()
+
+
+def count_command():
+    """
+    Count one docker command started by the calling thread
+    """
+    _commands.value = command_count() + 1
+
+
+def command_count():
+    """
+    Return number of docker commands started by the calling thread so far
+    """
+    return getattr(_commands, 'value', 0)
+
+
+def cpu_seconds():
+    """
+    Return user + system CPU seconds used by this process and reaped children
+    """
+    return sum(os.times()[0:4])
+
+
+class StageTimer(object):
+
+    """
+    Times a single stage of a subtest or subsubtest, from creation to stop()
+
+    :note: CPU time is process-wide, it includes any stages running at the
+           same time on other threads.
+    """
+
+    #: Format of each line in the stage times file
+    line_format = "%s\t%s\t%s\t%.3f\t%.3f\t%d\n"
+
+    def __init__(self, name, stage):
+        """
+        Start timing stage of name
+
+        :param name: Subtest or subsubtest name, must be valid in keyval keys
+        :param stage: Stage (method) name
+        """
+        self.name = name
+        self.stage = stage
+        self.seconds = None
+        self.cpu_seconds = None
+        self.commands = None
+        self._start = (time.time(), cpu_seconds(), command_count())
+
+    def stop(self):
+        """
+        Finish timing, setting seconds, cpu_seconds, and commands attributes
+        """
+        self.seconds = time.time() - self._start[0]
+        self.cpu_seconds = cpu_seconds() - self._start[1]
+        self.commands = command_count() - self._start[2]
+
+    def keyvals(self):
+        """
+        Return dictionary of ``<name>.<stage>.<measure>`` to measurement
+        """
+        prefix = "%s.%s" % (self.name, self.stage)
+        return {prefix + '.seconds': "%.3f" % self.seconds,
+                prefix + '.cpu_seconds': "%.3f" % self.cpu_seconds,
+                prefix + '.docker_commands': self.commands}
+
+    def append_to(self, filename, test_name):
+        """
+        Append stopped stage's line onto stage times filename
+
+        :param filename: Path to stage times file, created if missing
+        :param test_name: Name of subtest holding this stage
+        """
+        line = self.line_format % (test_name, self.name, self.stage,
+                                   self.seconds, self.cpu_seconds,
+                                   self.commands)
+        stage_file = open(filename, 'ab')
+        try:
+            # Forked/parallel jobs may share the same file
+            fcntl.flock(stage_file, fcntl.LOCK_EX)
+            stage_file.write(line)
+        finally:
+            stage_file.close()
+
+
+def slowest_stages(filename, count=10):
+    """
+    Return up to count stage records from filename, slowest first
+
+    :param filename: Path to stage times file
+    :param count: Maximum number of records to return
+    :return: List of tuples (seconds, cpu_seconds, commands, test_name,
+             name, stage)
+    """
+    records = []
+    try:
+        stage_file = open(filename, 'rb')
+    except IOError:
+        return records
+    for line in stage_file:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) != 6:
+            continue  # Partial line from an interrupted write
+        test_name, name, stage, seconds, cpu, commands = fields
+        records.append((float(seconds), float(cpu), int(commands),
+                        test_name, name, stage))
+    stage_file.close()
+    records.sort(reverse=True)
+    return records[:count]
+
+
+class NullProfiler(object):
+
+    """
+    Profiler interface which does nothing, used for ``profile = none``
+    """
+
+    def start(self):
+        """
+        Begin profiling calling thread (and others, if supported)
+        """
+        pass
+
+    def stop(self):
+        """
+        Finish profiling
+        """
+        pass
+
+    def save(self, basename):
+        """
+        Write results into file(s) named by basename plus an extension
+
+        :param basename: Path and file name, without extension
+        :return: List of file names written
+        """
+        del basename  # Not used
+        return []
+
+
+class CProfiler(NullProfiler):
+
+    """
+    Deterministic profiler for the calling thread, using cProfile
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, basename):
+        filename = basename + '.pstats'
+        self.profile.dump_stats(filename)
+        return [filename]
+
+
+class StackSampler(NullProfiler):
+
+    """
+    Statistical profiler, periodically recording stacks of all threads
+
+    Sampling happens from a ``SIGPROF`` handler, every ``interval`` seconds
+    of CPU time used by the process.  It must be started from the main
+    thread.  Results are saved in the collapsed-stack format read by
+    flamegraph tools (one ``frame;frame;frame count`` line per stack).
+    """
+
+    #: CPU seconds between samples
+    interval = 0.005
+
+    def __init__(self):
+        #: Mapping of collapsed stack string to number of times sampled
+        self.stacks = {}
+        self._old_handler = None
+
+    @staticmethod
+    def collapse(frame):
+        """
+        Return collapsed-stack string for frame, outer-most caller first
+
+        :param frame: Python frame object
+        """
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            labels.append("%s (%s:%d)" % (code.co_name, code.co_filename,
+                                          code.co_firstlineno))
+            frame = frame.f_back
+        labels.reverse()
+        return ';'.join(labels)
+
+    # Private method doesn't need docstring
+    def _sample(self, signum, frame):  # pylint: disable=C0111
+        del signum  # Not used
+        frames = sys._current_frames()  # pylint: disable=W0212
+        # Don't record this handler as the main thread's inner-most frame
+        frames[thread.get_ident()] = frame
+        for thread_frame in frames.values():
+            stack = self.collapse(thread_frame)
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def start(self):
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        # Don't interrupt system calls with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler)
+
+    def save(self, basename):
+        filename = basename + '.collapsed'
+        collapsed = open(filename, 'wb')
+        for stack, count in sorted(self.stacks.items()):
+            collapsed.write("%s %d\n" % (stack, count))
+        collapsed.close()
+        return [filename]
+
+
+#: Mapping of ``profile`` option value to profiler class
+PROFILERS = {'none': NullProfiler,
+             'cprofile': CProfiler,
+             'sample': StackSampler}
+
+
+def new_profiler(name):
+    """
+    Return new profiler instance for name (value of ``profile`` option)
+
+    :param name: One of the keys in ``PROFILERS``, case-insensitive
+    :raises ValueError: if name is not a known profiler
+    """
+    try:
+        return PROFILERS[str(name).strip().lower()]()
+    except KeyError:
+        raise ValueError("Unknown profile option value %s, expected one of "
+                         "%s" % (name, ", ".join(sorted(PROFILERS.keys()))))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+import os
+import pstats
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+
+class ProfilingTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import profiling
+        self.profiling = profiling
+        self.tmpdir = tempfile.mkdtemp(self.__class__.__name__)
+        self.filename = os.path.join(self.tmpdir,
+                                     profiling.STAGE_TIMES_FILE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class CommandCountTest(ProfilingTestBase):
+
+    def test_per_thread(self):
+        start = self.profiling.command_count()
+        self.profiling.count_command()
+        others = []
+        thread = threading.Thread(
+            target=lambda: others.append(self.profiling.command_count()))
+        thread.start()
+        thread.join()
+        self.assertEqual(others, [0])
+        self.assertEqual(self.profiling.command_count(), start + 1)
+
+
+class StageTimerTest(ProfilingTestBase):
+
+    def test_keyvals(self):
+        timer = self.profiling.StageTimer('foo', 'run_once')
+        self.profiling.count_command()
+        self.profiling.count_command()
+        timer.stop()
+        keyvals = timer.keyvals()
+        self.assertEqual(sorted(keyvals.keys()),
+                         ['foo.run_once.cpu_seconds',
+                          'foo.run_once.docker_commands',
+                          'foo.run_once.seconds'])
+        self.assertEqual(keyvals['foo.run_once.docker_commands'], 2)
+        self.assertTrue(float(keyvals['foo.run_once.seconds']) >= 0)
+
+    def test_slowest_stages(self):
+        for name, seconds in (('a', 1.0), ('b', 3.0), ('c', 2.0)):
+            timer = self.profiling.StageTimer(name, 'cleanup')
+            timer.stop()
+            timer.seconds = seconds
+            timer.append_to(self.filename, 'bar')
+        open(self.filename, 'ab').write('bar\td\tcleanup\t9')
+        stages = self.profiling.slowest_stages(self.filename, 2)
+        self.assertEqual([(stage[0], stage[3], stage[4])
+                          for stage in stages],
+                         [(3.0, 'bar', 'b'), (2.0, 'bar', 'c')])
+
+    def test_missing_file(self):
+        self.assertEqual(self.profiling.slowest_stages(self.filename), [])
+
+class ProfilerTest(ProfilingTestBase):
+
+    @staticmethod
+    def busy_function():
+        end = time.time() + 0.3
+        total = 0
+        while time.time() < end:
+            total += sum(xrange(1000))
+        return total
+
+    def profile(self, name):
+        profiler = self.profiling.new_profiler(name)
+        profiler.start()
+        try:
+            self.busy_function()
+        finally:
+            profiler.stop()
+        return profiler.save(os.path.join(self.tmpdir, 'profile'))
+
+    def test_none(self):
+        self.assertEqual(self.profile(' None '), [])
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, self.profiling.new_profiler, 'foo')
+
+    def test_cprofile(self):
+        filenames = self.profile('cprofile')
+        self.assertEqual(filenames, [os.path.join(self.tmpdir,
+                                                  'profile.pstats')])
+        stats = pstats.Stats(filenames[0])
+        self.assertTrue([func for func in stats.stats
+                         if func[2] == 'busy_function'])
+
+    def test_sample(self):
+        filenames = self.profile('sample')
+        self.assertEqual(filenames, [os.path.join(self.tmpdir,
+                                                  'profile.collapsed')])
+        lines = open(filenames[0], 'rb').readlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertTrue(int(line.rsplit(' ', 1)[1]) > 0)
+        self.assertTrue([line for line in lines
+                         if 'test_sample' in line and
+                         'busy_function' in line])
+        self.assertEqual(signal.getsignal(signal.SIGPROF), signal.SIG_DFL)
+
+if __name__ == '__main__':
+    unittest.main()
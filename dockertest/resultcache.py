@@ -0,0 +1,139 @@
+"""
+Remember which subtests passed under exactly which conditions
+
+A subtest's fingerprint is a digest over everything expected to affect
+it's outcome (e.g. docker versions, configuration, and source code).
+When the control file runs in incremental mode, subtests whose current
+fingerprint matches the one recorded by their last passing run are
+skipped.
+
+:Note: This module must _NOT_ depend on anything in autotest!
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import os.path
+
+#: Default result cache file name, in the directory holding the control file
+CACHE_FILE = '.subtest_results.json'
+
+
+def tree_digest(path):
+    """
+    Return hex digest of all file names and contents beneath path
+
+    Compiled python files are ignored.
+
+    :param path: Directory (or single file) to digest
+    """
+    digest = hashlib.sha1()
+    if os.path.isfile(path):
+        digest.update(open(path, 'rb').read())
+        return digest.hexdigest()
+    for dirpath, dirnames, filenames in os.walk(path):
+        # os.walk() order depends on filesystem, make it stable
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.pyc') or filename.endswith('.pyo'):
+                continue
+            fullpath = os.path.join(dirpath, filename)
+            digest.update(os.path.relpath(fullpath, path) + '\0')
+            digest.update(open(fullpath, 'rb').read() + '\0')
+    return digest.hexdigest()
+
+
+def fingerprint(*parts):
+    """
+    Return hex digest of parts, each a string or (nested) JSON-able object
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True)).hexdigest()
+
+
+def config_sections(all_configs, section):
+    """
+    Return dictionary of section and its subsections' options, as dicts
+
+    Dict-like sections (e.g. ``ConfigView``) are copied into plain
+    dictionaries, so the result can be passed to ``fingerprint()``.
+
+    :param all_configs: Mapping of section name to dict-like options
+    :param section: Subtest section name, ``DEFAULTS`` used if missing
+    """
+    sections = dict([(name, dict(value))
+                     for name, value in all_configs.items()
+                     if name == section or name.startswith(section + '/')])
+    sections.setdefault(section, dict(all_configs['DEFAULTS']))
+    return sections
+
+
+class ResultCache(object):
+
+    """
+    Fingerprints of the last passing run per subtest, in a JSON file
+
+    Updates lock the file, so concurrent processes may share it.
+    """
+
+    def __init__(self, filename):
+        """
+        Initialize cache from filename, if it exists
+
+        :param filename: Path to JSON cache file
+        """
+        self.filename = filename
+        #: Mapping of subtest name to fingerprint of it's last passing run
+        self.passed = {}
+        self.load()
+
+    def load(self):
+        """
+        (Re)read cache file, keeping current data if it can't be read
+        """
+        try:
+            cache_file = open(self.filename, 'rb')
+        except IOError:
+            return
+        try:
+            fcntl.flock(cache_file, fcntl.LOCK_SH)
+            self.passed = json.load(cache_file)
+        except ValueError:
+            pass  # Corrupt or empty, start over
+        finally:
+            cache_file.close()
+
+    def lookup(self, name, current):
+        """
+        Return True if subtest name last passed with current fingerprint
+
+        :param name: Subtest name
+        :param current: Fingerprint string, or None if unknown
+        """
+        return current is not None and self.passed.get(name) == current
+
+    def record(self, name, current, passed):
+        """
+        Store current fingerprint of subtest name if passed, else forget it
+
+        :param name: Subtest name
+        :param current: Fingerprint string
+        :param passed: True if subtest passed
+        """
+        cache_file = os.fdopen(os.open(self.filename,
+                                       os.O_RDWR | os.O_CREAT, 0644), 'r+b')
+        try:
+            fcntl.flock(cache_file, fcntl.LOCK_EX)
+            try:
+                self.passed = json.load(cache_file)
+            except ValueError:
+                self.passed = {}
+            if passed:
+                self.passed[name] = current
+            else:
+                self.passed.pop(name, None)
+            cache_file.seek(0)
+            cache_file.truncate()
+            json.dump(self.passed, cache_file, indent=1, sort_keys=True)
+        finally:
+            cache_file.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+from collections import MutableMapping
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class FakeConfigView(MutableMapping):
+
+    """Dict-like, but not a dict, like ConfigView"""
+
+    def __init__(self, options):
+        self.options = options
+        super(FakeConfigView, self).__init__()
+
+    def __getitem__(self, key):
+        return self.options[key]
+
+    def __setitem__(self, key, value):
+        self.options[key] = value
+
+    def __delitem__(self, key):
+        del self.options[key]
+
+    def __iter__(self):
+        return iter(self.options)
+
+    def __len__(self):
+        return len(self.options)
+
+
+class ResultCacheTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import resultcache
+        self.resultcache = resultcache
+        self.tmpdir = tempfile.mkdtemp(self.__class__.__name__)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class DigestTest(ResultCacheTestBase):
+
+    def write(self, relpath, content):
+        fullpath = os.path.join(self.tmpdir, relpath)
+        if not os.path.isdir(os.path.dirname(fullpath)):
+            os.makedirs(os.path.dirname(fullpath))
+        open(fullpath, 'wb').write(content)
+
+    def test_tree_digest(self):
+        self.write('foo/bar.py', 'bar')
+        self.write('foo/baz/baz.ini', 'baz')
+        first = self.resultcache.tree_digest(self.tmpdir)
+        self.write('foo/bar.pyc', 'ignored')
+        self.assertEqual(self.resultcache.tree_digest(self.tmpdir), first)
+        self.write('foo/baz/baz.ini', 'changed')
+        self.assertNotEqual(self.resultcache.tree_digest(self.tmpdir), first)
+
+    def test_tree_digest_rename(self):
+        self.write('foo', 'content')
+        first = self.resultcache.tree_digest(self.tmpdir)
+        os.rename(os.path.join(self.tmpdir, 'foo'),
+                  os.path.join(self.tmpdir, 'bar'))
+        self.assertNotEqual(self.resultcache.tree_digest(self.tmpdir), first)
+
+    def test_fingerprint(self):
+        first = self.resultcache.fingerprint(['1.0', '1.0'], {'b': 1, 'a': 2})
+        self.assertEqual(first, self.resultcache.fingerprint(
+            ['1.0', '1.0'], {'a': 2, 'b': 1}))
+        self.assertNotEqual(first, self.resultcache.fingerprint(
+            ['1.0', '1.1'], {'a': 2, 'b': 1}))
+
+    def test_config_sections(self):
+        all_configs = {'DEFAULTS': FakeConfigView({'a': 1}),
+                       'docker_cli/foo': FakeConfigView({'b': 2}),
+                       'docker_cli/foo/sub': FakeConfigView({'c': 3}),
+                       'docker_cli/foobar': FakeConfigView({'d': 4})}
+        sections = self.resultcache.config_sections(all_configs,
+                                                    'docker_cli/foo')
+        self.assertEqual(sections, {'docker_cli/foo': {'b': 2},
+                                    'docker_cli/foo/sub': {'c': 3}})
+        # As the control file does with incremental=yes
+        first = self.resultcache.fingerprint(['1.0', '1.0'], sections)
+        all_configs['docker_cli/foo/sub']['c'] = 4
+        self.assertNotEqual(first, self.resultcache.fingerprint(
+            ['1.0', '1.0'], self.resultcache.config_sections(
+                all_configs, 'docker_cli/foo')))
+        sections = self.resultcache.config_sections(all_configs,
+                                                    'docker_cli/new')
+        self.assertEqual(sections, {'docker_cli/new': {'a': 1}})
+        self.resultcache.fingerprint(['1.0', '1.0'], sections)
+
+
+class ResultCacheTest(ResultCacheTestBase):
+
+    def test_record(self):
+        filename = os.path.join(self.tmpdir, self.resultcache.CACHE_FILE)
+        cache = self.resultcache.ResultCache(filename)
+        self.assertFalse(cache.lookup('foo', None))
+        self.assertFalse(cache.lookup('foo', 'abc'))
+        cache.record('foo', 'abc', True)
+        cache.record('bar', 'def', True)
+        cache = self.resultcache.ResultCache(filename)
+        self.assertTrue(cache.lookup('foo', 'abc'))
+        self.assertFalse(cache.lookup('foo', 'def'))
+        self.assertFalse(cache.lookup('foo', None))
+        cache.record('foo', 'abc', False)
+        cache = self.resultcache.ResultCache(filename)
+        self.assertFalse(cache.lookup('foo', 'abc'))
+        self.assertTrue(cache.lookup('bar', 'def'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+"""
+Order subtests by their history of run times and failures
+
+The control file records every subtest's duration and outcome in a
+``SubtestHistory`` file.  Later runs use it to start the longest
+subtests first when running in parallel (minimizing total time), or
+the most failure-prone first when running serially (failing fast).
+Runs split across several hosts (shards) are merged back together by
+the ``merge_shards.py`` script.
+
+:Note: This module must _NOT_ depend on anything in autotest!
+"""
+
+import fcntl
+import json
+import os
+import shutil
+
+#: Default history file name, in the directory holding the control file
+HISTORY_FILE = '.subtest_history.json'
+
+
+def parse_shard(text):
+    """
+    Return zero-based index and count from ``i/n`` text, i from 1 to n
+
+    :raises ValueError: if text is not valid
+    """
+    index, count = [int(number) for number in text.split('/')]
+    if count < 1 or index < 1 or index > count:
+        raise ValueError("Shard %s must be i/n with 1 <= i <= n" % text)
+    return index - 1, count
+
+
+def claim_next(filename):
+    """
+    Return next zero-based index from counter file, and increment it
+
+    Processes sharing filename each claim a different index, so they
+    work through one queue together without dividing it up front.
+
+    :param filename: Path to counter file, an empty or missing one starts at 0
+    """
+    counter_file = os.fdopen(os.open(filename, os.O_RDWR | os.O_CREAT, 0644),
+                             'r+b')
+    try:
+        fcntl.flock(counter_file, fcntl.LOCK_EX)
+        try:
+            index = int(counter_file.read() or 0)
+        except ValueError:
+            index = 0
+        counter_file.seek(0)
+        counter_file.truncate()
+        counter_file.write(str(index + 1))
+    finally:
+        counter_file.close()
+    return index
+
+
+def test_results(status_filename):
+    """
+    Return list of (status, subdir, testname) for each subtest in status file
+
+    :param status_filename: Path to autotest job ``status`` file
+    """
+    results = []
+    for line in open(status_filename, 'rb'):
+        # Subtests END lines are indented once beneath the job
+        if not line.startswith('\tEND '):
+            continue
+        fields = line[1:].rstrip('\n').split('\t')
+        if len(fields) < 3:
+            continue
+        results.append((fields[0][len('END '):], fields[1], fields[2]))
+    return results
+
+
+def read_keyval(keyval_filename):
+    """
+    Return list of (key, value) from autotest keyval file, if it exists
+
+    :param keyval_filename: Path to keyval file
+    """
+    if not os.path.isfile(keyval_filename):
+        return []
+    keyvals = []
+    for line in open(keyval_filename, 'rb'):
+        line = line.strip()
+        if line and not line.startswith('#') and line.count('='):
+            keyvals.append(tuple(line.split('=', 1)))
+    return keyvals
+
+
+def merge_shards(output_dir, shard_dirs):
+    """
+    Combine results from all shard_dirs into output_dir, return all results
+
+    :param output_dir: Path to directory to create, must not exist
+    :param shard_dirs: List of autotest job results directories
+    :return: List of (status, subdir, testname, shard_dir) for all subtests
+    """
+    os.makedirs(output_dir)
+    status = open(os.path.join(output_dir, 'status'), 'wb')
+    keyval = open(os.path.join(output_dir, 'keyval'), 'wb')
+    keyval.write('shard_count=%d\n' % len(shard_dirs))
+    merged = []
+    for number, shard_dir in enumerate(shard_dirs):
+        status_filename = os.path.join(shard_dir, 'status')
+        status.write(open(status_filename, 'rb').read())
+        for key, value in read_keyval(os.path.join(shard_dir, 'keyval')):
+            keyval.write('shard%d.%s=%s\n' % (number + 1, key, value))
+        for result, subdir, testname in test_results(status_filename):
+            source = os.path.join(shard_dir, subdir)
+            destination = os.path.join(output_dir, subdir)
+            if os.path.isdir(source) and not os.path.exists(destination):
+                shutil.copytree(source, destination, symlinks=True)
+            merged.append((result, subdir, testname, shard_dir))
+    status.close()
+    keyval.close()
+    return merged
+
+
+class SubtestHistory(object):
+
+    """
+    Recent durations and pass/fail counts per subtest, in a JSON file
+
+    Updates lock the file, so concurrent processes may share it.
+    """
+
+    #: Number of most recent durations kept per subtest
+    max_durations = 10
+
+    def __init__(self, filename):
+        """
+        Initialize history from filename, if it exists
+
+        :param filename: Path to JSON history file
+        """
+        self.filename = filename
+        #: Mapping of subtest name to dictionary with ``durations`` list
+        #: plus ``runs`` and ``failures`` counts.
+        self.subtests = {}
+        self.load()
+
+    def load(self):
+        """
+        (Re)read history file, keeping current data if it can't be read
+        """
+        try:
+            history_file = open(self.filename, 'rb')
+        except IOError:
+            return
+        try:
+            fcntl.flock(history_file, fcntl.LOCK_SH)
+            self.subtests = json.load(history_file)
+        except ValueError:
+            pass  # Corrupt or empty, start over
+        finally:
+            history_file.close()
+
+    def record(self, name, seconds, passed):
+        """
+        Add one run of subtest name to the history file
+
+        :param name: Subtest name
+        :param seconds: Duration of run
+        :param passed: True if subtest passed
+        """
+        history_file = os.fdopen(os.open(self.filename,
+                                         os.O_RDWR | os.O_CREAT, 0644),
+                                 'r+b')
+        try:
+            fcntl.flock(history_file, fcntl.LOCK_EX)
+            try:
+                self.subtests = json.load(history_file)
+            except ValueError:
+                self.subtests = {}
+            entry = self.subtests.setdefault(name, {'durations': [],
+                                                    'runs': 0,
+                                                    'failures': 0})
+            entry['durations'] = (entry['durations'] +
+                                  [seconds])[-self.max_durations:]
+            entry['runs'] += 1
+            if not passed:
+                entry['failures'] += 1
+            history_file.seek(0)
+            history_file.truncate()
+            json.dump(self.subtests, history_file, indent=1, sort_keys=True)
+        finally:
+            history_file.close()
+
+    def duration(self, name, default=None):
+        """
+        Return mean recent duration of subtest name, or default if unknown
+        """
+        durations = self.subtests.get(name, {}).get('durations')
+        if not durations:
+            return default
+        return sum(durations) / len(durations)
+
+    def mean_duration(self, default=0.0):
+        """
+        Return mean duration of all known subtests, or default if none
+        """
+        durations = [duration for duration in
+                     [self.duration(name) for name in self.subtests]
+                     if duration is not None]
+        if not durations:
+            return default
+        return sum(durations) / len(durations)
+
+    def failure_rate(self, name):
+        """
+        Return fraction of recorded runs of subtest name which failed
+        """
+        entry = self.subtests.get(name, {})
+        if not entry.get('runs'):
+            return 0.0
+        return float(entry['failures']) / entry['runs']
+
+    def longest_first(self, names):
+        """
+        Return names ordered by decreasing duration, unknown ones as average
+
+        :param names: List of subtest names
+        """
+        default = self.mean_duration()
+        # sorted() is stable, ties keep their original order
+        return sorted(names, key=lambda name: self.duration(name, default),
+                      reverse=True)
+
+    def failures_first(self, names):
+        """
+        Return names ordered by decreasing failure rate
+
+        :param names: List of subtest names
+        """
+        return sorted(names, key=self.failure_rate, reverse=True)
+
+    def shard(self, names, index, count):
+        """
+        Return names belonging to zero-based shard index of count shards
+
+        Greedy longest-processing-time-first: each subtest, longest first
+        (ties by name), goes onto the shard with the least total duration
+        so far (ties to the lowest index).  Every host using the same
+        history file contents and names computes the same partitioning,
+        regardless of names order.
+
+        :param names: List of subtest names
+        :param index: Zero-based index of shard to return
+        :param count: Total number of shards
+        :return: List of names, longest first
+        """
+        # Without any history, count subtests instead
+        default = self.mean_duration(1.0)
+        shards = [[] for _ in xrange(count)]
+        totals = [0.0] * count
+        for name in sorted(set(names),
+                           key=lambda name: (-self.duration(name, default),
+                                             name)):
+            smallest = totals.index(min(totals))
+            shards[smallest].append(name)
+            totals[smallest] += self.duration(name, default)
+        return shards[index]
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+
+class SubtestHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        import scheduling
+        self.scheduling = scheduling
+        self.tmpdir = tempfile.mkdtemp(self.__class__.__name__)
+        self.filename = os.path.join(self.tmpdir, scheduling.HISTORY_FILE)
+        self.history = scheduling.SubtestHistory(self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_missing(self):
+        self.assertEqual(self.history.subtests, {})
+        self.assertEqual(self.history.duration('foo'), None)
+        self.assertEqual(self.history.mean_duration(), 0.0)
+        self.assertEqual(self.history.failure_rate('foo'), 0.0)
+
+    def test_record(self):
+        self.history.record('foo', 1.0, True)
+        self.history.record('foo', 3.0, False)
+        self.history.record('bar', 10.0, True)
+        history = self.scheduling.SubtestHistory(self.filename)
+        self.assertEqual(history.duration('foo'), 2.0)
+        self.assertEqual(history.failure_rate('foo'), 0.5)
+        self.assertEqual(history.failure_rate('bar'), 0.0)
+        self.assertEqual(history.mean_duration(), 6.0)
+
+    def test_max_durations(self):
+        self.history.max_durations = 2
+        for seconds in (100.0, 1.0, 2.0):
+            self.history.record('foo', seconds, True)
+        self.assertEqual(self.history.duration('foo'), 1.5)
+        self.assertEqual(self.history.subtests['foo']['runs'], 3)
+
+    def test_corrupt(self):
+        open(self.filename, 'wb').write('{foo')
+        self.history.load()
+        self.history.record('foo', 1.0, True)
+        self.assertEqual(self.history.duration('foo'), 1.0)
+
+    def test_ordering(self):
+        self.history.record('short', 1.0, False)
+        self.history.record('long', 9.0, True)
+        self.history.record('long', 9.0, False)
+        # Unknown gets average duration, 5.0
+        self.assertEqual(self.history.longest_first(['short', 'new', 'long']),
+                         ['long', 'new', 'short'])
+        self.assertEqual(self.history.failures_first(['new', 'long',
+                                                      'short']),
+                         ['short', 'long', 'new'])
+
+    def test_shard(self):
+        names = ['e', 'c', 'a', 'new', 'd', 'b']
+        shards = [self.history.shard(names, index, 3) for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), sorted(names))
+        # Without history, all ties, split by name
+        self.assertEqual(shards, [['a', 'd'], ['b', 'e'], ['c', 'new']])
+        self.assertEqual(shards, [self.history.shard(list(reversed(names)),
+                                                     index, 3)
+                                  for index in range(3)])
+
+    def test_shard_balanced(self):
+        for name, seconds in (('a', 1.0), ('b', 1.0), ('c', 1.0),
+                              ('d', 1.0), ('e', 2.0), ('f', 6.0)):
+            self.history.record(name, seconds, True)
+        names = ['a', 'b', 'c', 'd', 'e', 'f']
+        shards = [self.history.shard(names, index, 2) for index in range(2)]
+        self.assertEqual(shards, [['f'], ['e', 'a', 'b', 'c', 'd']])
+        totals = [sum([self.history.duration(name) for name in shard])
+                  for shard in shards]
+        self.assertEqual(totals, [6.0, 6.0])
+        # Same history file contents, same partitioning
+        other = self.scheduling.SubtestHistory(self.filename)
+        self.assertEqual(shards, [other.shard(list(reversed(names)),
+                                              index, 2)
+                                  for index in range(2)])
+
+    def test_claim_next(self):
+        counter = os.path.join(self.tmpdir, 'counter')
+        claimed = []
+
+        def claim():
+            for _ in xrange(50):
+                claimed.append(self.scheduling.claim_next(counter))
+
+        threads = [threading.Thread(target=claim) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), range(200))
+        self.assertEqual(self.scheduling.claim_next(counter), 200)
+
+    def test_parse_shard(self):
+        self.assertEqual(self.scheduling.parse_shard('1/1'), (0, 1))
+        self.assertEqual(self.scheduling.parse_shard('3/4'), (2, 4))
+        for text in ('0/2', '3/2', '1', 'a/b', '1/0'):
+            self.assertRaises(ValueError, self.scheduling.parse_shard, text)
+
+
+class MergeShardsTest(unittest.TestCase):
+
+    def setUp(self):
+        import scheduling
+        self.scheduling = scheduling
+        self.tmpdir = tempfile.mkdtemp(self.__class__.__name__)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def make_shard(self, name, results, keyvals):
+        shard_dir = os.path.join(self.tmpdir, name)
+        os.makedirs(shard_dir)
+        status = open(os.path.join(shard_dir, 'status'), 'wb')
+        status.write('START\t----\t----\ttimestamp=1\n')
+        for result, subdir in results:
+            status.write('\tSTART\t%s\t%s\ttimestamp=1\n' % (subdir, subdir))
+            status.write('\tEND %s\t%s\t%s\ttimestamp=2\n'
+                         % (result, subdir, subdir))
+            os.makedirs(os.path.join(shard_dir, subdir))
+            open(os.path.join(shard_dir, subdir, 'debug'), 'wb').write(name)
+        status.write('END GOOD\t----\t----\ttimestamp=3\n')
+        status.close()
+        keyval = open(os.path.join(shard_dir, 'keyval'), 'wb')
+        for key, value in keyvals:
+            keyval.write('%s=%s\n' % (key, value))
+        keyval.close()
+        return shard_dir
+
+    def test_read_keyval(self):
+        filename = os.path.join(self.tmpdir, 'keyval')
+        self.assertEqual(self.scheduling.read_keyval(filename), [])
+        open(filename, 'wb').write('# comment\nfoo=bar=baz\n\nnothing\n')
+        self.assertEqual(self.scheduling.read_keyval(filename),
+                         [('foo', 'bar=baz')])
+
+    def test_merge(self):
+        one = self.make_shard('one', [('GOOD', 'docker/a'),
+                                      ('FAIL', 'docker/b')],
+                              [('hostname', 'host1')])
+        two = self.make_shard('two', [('GOOD', 'docker/c')],
+                              [('hostname', 'host2')])
+        output_dir = os.path.join(self.tmpdir, 'merged')
+        merged = self.scheduling.merge_shards(output_dir, [one, two])
+        self.assertEqual(merged, [('GOOD', 'docker/a', 'docker/a', one),
+                                  ('FAIL', 'docker/b', 'docker/b', one),
+                                  ('GOOD', 'docker/c', 'docker/c', two)])
+        self.assertEqual(
+            self.scheduling.read_keyval(os.path.join(output_dir, 'keyval')),
+            [('shard_count', '2'), ('shard1.hostname', 'host1'),
+             ('shard2.hostname', 'host2')])
+        self.assertEqual(self.scheduling.test_results(
+            os.path.join(output_dir, 'status')),
+            [(result, subdir, testname)
+             for result, subdir, testname, _ in merged])
+        self.assertEqual(open(os.path.join(output_dir, 'docker/c',
+                                           'debug'), 'rb').read(), 'two')
+
+    def test_output_exists(self):
+        one = self.make_shard('one', [('GOOD', 'docker/a')], [])
+        self.assertRaises(OSError, self.scheduling.merge_shards, one, [one])
+
+if __name__ == '__main__':
+    unittest.main()
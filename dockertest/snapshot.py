@@ -0,0 +1,177 @@
+"""
+Capture docker daemon state before and after a subtest, to find it's leaks
+
+``take()`` records containers, images, volumes, docker-related mounts,
+storage pool usage, and the daemon's open file descriptors, running all
+docker commands at the same time.  ``diff()`` compares two snapshots,
+using set differences of IDs, to find exactly what appeared in between.
+"""
+
+# Pylint runs from a different directory, it's fine to import this way
+# pylint: disable=W0403
+
+import os
+import re
+import threading
+import time
+import docker_daemon
+from environment import docker_output
+
+#: Matches ``docker info`` storage usage lines, e.g. ``Data Space Used: 1 GB``
+POOL_LINE_RE = re.compile(r'^\s*(?P<name>[\w ]*Space (?:Used|Total))\s*:\s*'
+                          r'(?P<amount>[\d.]+)\s*(?P<unit>[kKMGT]?i?B)\s*$')
+
+#: Multiplier for each unit used by ``docker info``
+POOL_UNITS = {'B': 1, 'kB': 1000, 'KB': 1000, 'MB': 1000 ** 2,
+              'GB': 1000 ** 3, 'TB': 1000 ** 4, 'KiB': 1024,
+              'MiB': 1024 ** 2, 'GiB': 1024 ** 3, 'TiB': 1024 ** 4}
+
+#: Snapshot attributes holding frozensets of IDs/names, compared by diff()
+ID_SETS = ('containers', 'images', 'volumes', 'mounts')
+
+
+class Snapshot(object):
+
+    """
+    Daemon state at one point in time, see ``take()``
+    """
+
+    def __init__(self, containers=(), images=(), volumes=(), mounts=(),
+                 pool=None, daemon_fds=None):
+        """
+        Initialize snapshot from it's parts
+
+        :param containers: Iterable of long container IDs
+        :param images: Iterable of long image IDs
+        :param volumes: Iterable of volume names
+        :param mounts: Iterable of mount points beneath docker's directory
+        :param pool: Dict of storage usage name to bytes
+        :param daemon_fds: Number of open daemon file descriptors, or None
+        """
+        self.time = time.time()
+        self.containers = frozenset(containers)
+        self.images = frozenset(images)
+        self.volumes = frozenset(volumes)
+        self.mounts = frozenset(mounts)
+        if pool is None:
+            pool = {}
+        self.pool = pool
+        self.daemon_fds = daemon_fds
+
+    def __repr__(self):
+        return ("<Snapshot of %d containers, %d images, %d volumes, "
+                "%d mounts>" % (len(self.containers), len(self.images),
+                                len(self.volumes), len(self.mounts)))
+
+
+def parse_pool(info_lines):
+    """
+    Return dict of storage usage name to bytes from ``docker info`` lines
+
+    Names are lower-case with underscores, e.g. ``data_space_used``.
+    """
+    pool = {}
+    for line in info_lines:
+        match = POOL_LINE_RE.match(line)
+        if match is None or match.group('unit') not in POOL_UNITS:
+            continue
+        name = '_'.join(match.group('name').lower().split())
+        pool[name] = int(float(match.group('amount')) *
+                         POOL_UNITS[match.group('unit')])
+    return pool
+
+
+def docker_mounts(mounts_filename='/proc/mounts'):
+    """
+    Return list of mount points with 'docker' in their path
+
+    :param mounts_filename: Path to file in ``/proc/mounts`` format
+    """
+    mount_points = []
+    try:
+        mounts_file = open(mounts_filename, 'rb')
+    except IOError:
+        return mount_points
+    for line in mounts_file:
+        fields = line.split()
+        if len(fields) > 1 and 'docker' in fields[1]:
+            mount_points.append(fields[1])
+    mounts_file.close()
+    return mount_points
+
+
+def daemon_fd_count(pidfile=docker_daemon.PIDFILE):
+    """
+    Return number of file descriptors open in docker daemon, or None
+
+    :param pidfile: Path to file holding docker daemon's process ID
+    """
+    daemon_pid = docker_daemon.pid(pidfile)
+    if daemon_pid is None:
+        return None
+    try:
+        return len(os.listdir('/proc/%d/fd' % daemon_pid))
+    except OSError:
+        return None
+
+
+def take(config):
+    """
+    Return new Snapshot of docker daemon state
+
+    :param config: Dict-like with ``docker_path``, ``docker_options``,
+                   and ``docker_pidfile`` options.
+    """
+    listings = [('ps', '--all', '--no-trunc', '--quiet'),
+                ('images', '--all', '--no-trunc', '--quiet'),
+                ('volume', 'ls', '--quiet'),
+                ('info',)]
+    outputs = [[]] * len(listings)
+
+    def list_lines(index):  # private, no docstring pylint: disable=C0111
+        # Failed listing is empty, list item assignment is atomic
+        outputs[index] = docker_output(config, *listings[index]) or []
+
+    # Every listing runs at the same time
+    threads = [threading.Thread(target=list_lines, args=(index,))
+               for index in xrange(len(listings))]
+    for thread in threads:
+        thread.start()
+    mounts = docker_mounts()
+    daemon_fds = daemon_fd_count(config.get('docker_pidfile',
+                                            docker_daemon.PIDFILE))
+    for thread in threads:
+        thread.join()
+    containers, images, volumes, info = outputs
+    return Snapshot(containers, images, volumes, mounts, parse_pool(info),
+                    daemon_fds)
+
+
+def diff(before, after):
+    """
+    Return dict describing what appeared from before Snapshot to after
+
+    Keys of ID_SETS map to sorted lists of IDs (or names) added.  The
+    ``pool`` key maps to a dict of storage usage name to bytes grown, and
+    ``daemon_fds`` to the number of additional open descriptors.  Only
+    non-empty/non-zero items are included, an empty dict means no leaks.
+
+    :param before: Snapshot taken first
+    :param after: Snapshot taken later
+    """
+    leaks = {}
+    for name in ID_SETS:
+        added = getattr(after, name) - getattr(before, name)
+        if added:
+            leaks[name] = sorted(added)
+    growth = {}
+    for name, amount in after.pool.items():
+        grown = amount - before.pool.get(name, amount)
+        if grown > 0 and name.endswith('_used'):
+            growth[name] = grown
+    if growth:
+        leaks['pool'] = growth
+    if after.daemon_fds is not None and before.daemon_fds is not None:
+        if after.daemon_fds > before.daemon_fds:
+            leaks['daemon_fds'] = after.daemon_fds - before.daemon_fds
+    return leaks
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Pylint runs from a different directory, it's fine to import this way
+# pylint: disable=W0403
+
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class SnapshotTestBase(unittest.TestCase):
+
+    def setUp(self):
+        import snapshot
+        self.snapshot = snapshot
+
+
+class ParseTest(SnapshotTestBase):
+
+    def test_parse_pool(self):
+        lines = ["Containers: 2", "Storage Driver: devicemapper",
+                 " Data Space Used: 1.5 GB", " Data Space Total: 102.1 GB",
+                 " Metadata Space Used: 512 kB", "Bogus Space Used: 3 XB"]
+        self.assertEqual(self.snapshot.parse_pool(lines),
+                         {'data_space_used': 1500000000,
+                          'data_space_total': 102100000000,
+                          'metadata_space_used': 512000})
+
+    def test_docker_mounts(self):
+        osfd, filename = tempfile.mkstemp()
+        os.write(osfd, "proc /proc proc rw 0 0\n"
+                       "/dev/dm-3 /var/lib/docker/devicemapper/mnt/abc "
+                       "ext4 rw 0 0\n")
+        os.close(osfd)
+        try:
+            self.assertEqual(self.snapshot.docker_mounts(filename),
+                             ['/var/lib/docker/devicemapper/mnt/abc'])
+        finally:
+            os.unlink(filename)
+
+
+class DiffTest(SnapshotTestBase):
+
+    def test_no_leaks(self):
+        before = self.snapshot.Snapshot(['c1'], ['i1'], pool={'x_used': 5},
+                                        daemon_fds=10)
+        after = self.snapshot.Snapshot([], ['i1'], pool={'x_used': 4},
+                                       daemon_fds=None)
+        self.assertEqual(self.snapshot.diff(before, after), {})
+
+    def test_leaks(self):
+        before = self.snapshot.Snapshot(['c1'], ['i1'], ['v1'], ['/m1'],
+                                        {'x_used': 5, 'x_total': 10}, 10)
+        after = self.snapshot.Snapshot(['c1', 'c3', 'c2'], ['i1'],
+                                       ['v1', 'v2'], ['/m1', '/m2'],
+                                       {'x_used': 8, 'x_total': 20}, 12)
+        self.assertEqual(self.snapshot.diff(before, after),
+                         {'containers': ['c2', 'c3'], 'volumes': ['v2'],
+                          'mounts': ['/m2'], 'pool': {'x_used': 3},
+                          'daemon_fds': 2})
+
+
+class TakeTest(SnapshotTestBase):
+
+    def setUp(self):
+        super(TakeTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp(self.__class__.__name__)
+        docker_path = os.path.join(self.tmpdir, 'docker')
+        docker = open(docker_path, 'wb')
+        docker.write('#!/bin/sh\ncase "$2" in\nps) echo c1; echo c2;;\n'
+                     'images) echo i1;;\nvolume) exit 1;;\n'
+                     'info) echo " Data Space Used: 2 MB";;\nesac\n')
+        docker.close()
+        os.chmod(docker_path, 0755)
+        self.config = {'docker_path': docker_path, 'docker_options': '-D',
+                       'docker_pidfile': os.path.join(self.tmpdir, 'pid')}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_take(self):
+        snap = self.snapshot.take(self.config)
+        self.assertEqual(snap.containers, frozenset(['c1', 'c2']))
+        self.assertEqual(snap.images, frozenset(['i1']))
+        self.assertEqual(snap.volumes, frozenset())
+        self.assertEqual(snap.pool, {'data_space_used': 2000000})
+        self.assertEqual(snap.daemon_fds, None)
+
+if __name__ == '__main__':
+    unittest.main()
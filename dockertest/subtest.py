@@ -17,7 +17,9 @@ import tempfile
 import os.path
 import imp
 import sys
+import threading
 import traceback
+import Queue
 from autotest.client.shared import error
 from autotest.client.shared import base_job
 from autotest.client.shared.error import AutotestError
@@ -25,11 +27,59 @@ from autotest.client.shared.version import get_version
 from autotest.client import job, test
 import version
 import config
+import snapshot
+from profiling import StageTimer, STAGE_TIMES_FILE, new_profiler
 from xceptions import DockerTestFail
 from xceptions import DockerTestNAError
 from xceptions import DockerTestError
 
 
+def run_concurrently(function, items, concurrency):
+    """
+    Call function on each item, using up to concurrency worker threads
+
+    Items are handed out in order, no new calls are started once any call
+    raised.  With concurrency of one or less, calls happen in order, on the
+    calling thread.
+
+    :param function: Callable accepting a single item as it's argument
+    :param items: Iterable of items to pass to function
+    :param concurrency: Maximum number of calls to run at the same time
+    :return: List of ``sys.exc_info()`` tuples from calls which raised
+    """
+    failures = []
+    if concurrency <= 1:
+        for item in items:
+            try:
+                function(item)
+            except Exception:
+                failures.append(sys.exc_info())
+                break
+        return failures
+    work = Queue.Queue()
+    for item in items:
+        work.put(item)
+
+    def worker():  # private, no docstring pylint: disable=C0111
+        while not failures:
+            try:
+                item = work.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                function(item)
+            except Exception:
+                failures.append(sys.exc_info())
+
+    threads = [threading.Thread(target=worker)
+               for _ in xrange(min(concurrency, work.qsize()))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return failures
+
+
 class Subtest(test.test):
 
     """
@@ -61,6 +111,18 @@ class Subtest(test.test):
     #: private method used by log*() methods internally, do not use.
     _re = None
 
+    #: Daemon ``snapshot.Snapshot`` taken before initialize(), when the
+    #: ``leak_snapshot`` option is true, otherwise None.
+    leak_snapshot = None
+
+    #: Stage methods called by autotest, timed by ``time_stage()``
+    timed_stages = ('setup', 'initialize', 'run_once',
+                    'postprocess_iteration', 'postprocess', 'cleanup')
+
+    #: Private, serializes keyval and stage times file writes from
+    #: concurrently running subsubtests
+    _write_lock = threading.RLock()
+
     def __init__(self, *args, **dargs):
         r"""
         Initialize new subtest, passes all arguments through to parent class
@@ -100,6 +162,55 @@ class Subtest(test.test):
         self.iterations = self.config.get('iterations', self.iterations)
         # subclasses can do whatever they like with this
         self.stuff = {}
+        self._reap_after_cleanup()
+        for stage in self.timed_stages:
+            setattr(self, stage, self._timed(getattr(self, stage)))
+        if self.config.get('leak_snapshot', False):
+            self._snapshot_around()
+
+    # Private method doesn't need docstring
+    def _timed(self, method):  # pylint: disable=C0111
+        # autotest passes arguments by inspecting signature, accept none
+        def timed():  # private, no docstring pylint: disable=C0111
+            return self.time_stage(self.__class__.__name__,
+                                   method.__name__, method)
+        return timed
+
+    # Private method doesn't need docstring
+    def _reap_after_cleanup(self):  # pylint: disable=C0111
+        # Subclass cleanup() kills/waits for it's own processes after
+        # calling super(), only what remains afterwards leaked.
+        cleanup = self.cleanup
+
+        def reaping_cleanup():  # private, no docstring pylint: disable=C0111
+            try:
+                return cleanup()
+            finally:
+                self.reap_async_commands()
+                self.record_command_cache()
+                self.flush_latency_history()
+
+        reaping_cleanup.__name__ = cleanup.__name__
+        self.cleanup = reaping_cleanup
+
+    # Private method doesn't need docstring
+    def _snapshot_around(self):  # pylint: disable=C0111
+        # Outermost, so snapshots aren't timed and include whole stages
+        initialize, cleanup = self.initialize, self.cleanup
+
+        def snapshot_initialize():  # private, no docstring pylint: disable=C0111
+            self.leak_snapshot = snapshot.take(self.config)
+            return initialize()
+
+        def snapshot_cleanup():  # private, no docstring pylint: disable=C0111
+            try:
+                return cleanup()
+            finally:
+                if self.leak_snapshot is not None:
+                    self.report_leaks(snapshot.take(self.config))
+
+        self.initialize = snapshot_initialize
+        self.cleanup = snapshot_cleanup
 
     # Private workaround due to job/test instance private attributes/methods :(
     def _log(self, level, message, *args):  # pylint: disable=C0111
@@ -111,8 +222,19 @@ class Subtest(test.test):
 
     def execute(self, *args, **dargs):
         """**Do not override**, needed to pull data from super class"""
-        super(Subtest, self).execute(iterations=self.iterations,
-                                     *args, **dargs)
+        try:
+            profiler = new_profiler(self.config.get('profile', 'none'))
+        except ValueError, detail:
+            raise DockerTestError(str(detail))
+        profiler.start()
+        try:
+            super(Subtest, self).execute(iterations=self.iterations,
+                                         *args, **dargs)
+        finally:
+            profiler.stop()
+            for filename in profiler.save(os.path.join(self.resultsdir,
+                                                       'profile')):
+                self.loginfo("Wrote profile %s", filename)
 
     # These methods can optionally be overridden by subclasses
 
@@ -160,6 +282,100 @@ class Subtest(test.test):
 
     # Some convenience methods for tests to use
 
+    def write_test_keyval(self, attr_dict):
+        """
+        Thread-safe version of ``test.test.write_test_keyval()``
+
+        :param attr_dict: Dict-like of keyval names to values
+        """
+        self._write_lock.acquire()
+        try:
+            super(Subtest, self).write_test_keyval(attr_dict)
+        finally:
+            self._write_lock.release()
+
+    def time_stage(self, name, stage, method):
+        """
+        Call method, recording it's wall-clock time, CPU time, and docker
+        command count as ``<name>.<stage>.*`` keyvals and into the job's
+        stage times file.
+
+        :param name: Subtest or subsubtest name
+        :param stage: Name of stage method
+        :param method: Callable accepting no arguments
+        :return: Whatever method returns
+        """
+        timer = StageTimer(name, stage)
+        try:
+            return method()
+        finally:
+            timer.stop()
+            # Concurrent subsubtests' stages finish at the same time
+            self._write_lock.acquire()
+            try:
+                self.write_test_keyval(timer.keyvals())
+                timer.append_to(os.path.join(self.job.resultdir,
+                                             STAGE_TIMES_FILE),
+                                self.__class__.__name__)
+            finally:
+                self._write_lock.release()
+
+    def report_leaks(self, after):
+        """
+        Log and record keyvals for daemon state leaked since initialize()
+
+        Records ``leaked.<kind>`` keyvals counting containers, images,
+        volumes, mounts, and daemon file descriptors, plus
+        ``leaked.pool.<name>`` bytes of storage growth.
+
+        :param after: ``snapshot.Snapshot`` taken after cleanup()
+        """
+        leaks = snapshot.diff(self.leak_snapshot, after)
+        keyvals = {}
+        for name in snapshot.ID_SETS:
+            keyvals['leaked.%s' % name] = len(leaks.get(name, []))
+            for item in leaks.get(name, []):
+                self.logwarning("Leaked %s: %s", name[:-1], item)
+        keyvals['leaked.daemon_fds'] = leaks.get('daemon_fds', 0)
+        for name, grown in leaks.get('pool', {}).items():
+            keyvals['leaked.pool.%s' % name] = grown
+            self.logwarning("Storage %s grew by %d bytes", name, grown)
+        self.write_test_keyval(keyvals)
+
+    def reap_async_commands(self):
+        """
+        Kill & reap docker client processes this subtest left running
+
+        Records the number killed in the ``leaked_async_processes`` keyval.
+        """
+        # dockercmd imports this module, import here to avoid a cycle
+        from dockercmd import AsyncReaper
+        leaked = AsyncReaper.kill_all(self)
+        if leaked:
+            self.logwarning("Killed %d leftover docker client process(es)",
+                            leaked)
+        self.write_test_keyval({'leaked_async_processes': leaked})
+
+    def record_command_cache(self):
+        """
+        Record read-only docker command cache hits & misses as keyvals
+
+        Counts start from zero again afterwards, so they cover just one
+        subtest.
+        """
+        # dockercmd imports this module, import here to avoid a cycle
+        from dockercmd import DockerCmdCache
+        self.write_test_keyval(DockerCmdCache.stats(reset=True))
+
+    @staticmethod
+    def flush_latency_history():
+        """
+        Write buffered docker command run times to history file(s)
+        """
+        # dockercmd imports this module, import here to avoid a cycle
+        from dockercmd import LatencyHistory
+        LatencyHistory.flush_all()
+
     @staticmethod
     def failif(condition, reason):
         """
@@ -250,6 +466,12 @@ class SubSubtest(object):
     #: re-assign it to any other type as needed.
     sub_stuff = None
 
+    #: Names of resources (e.g. ``daemon-restart`` or ``image:<name>``) this
+    #: subsubtest must not share with any other subsubtest while running
+    #: under ``SubSubtestCallerParallel``.  Extended by the optional
+    #: ``exclusive_resources`` (CSV) config. option.
+    exclusive_resources = ()
+
     def __init__(self, parent_subtest):
         """
         Initialize sub-subtest
@@ -265,14 +487,14 @@ class SubSubtest(object):
                                        self.__class__.__name__))
         # Allow child to inherit and override parent config
         all_configs = config.Config()
-        # make_subsubtest_config will modify this
-        parent_config = self.parent_subtest.config.copy()
         # subsubtest config is optional, overrides parent.
         if config_section not in all_configs:
-            self.config = parent_config
+            # Copy-on-write, parent config is never modified, and later
+            # changes to it are not seen.
+            self.config = self.parent_subtest.config.snapshot()
         else:
             self.make_subsubtest_config(all_configs,
-                                        parent_config,
+                                        self.parent_subtest.config,
                                         all_configs[config_section])
         # FIXME: Honor SubSubtest ``enable`` conf. option
         # Not automatically logged along with parent subtest
@@ -287,25 +509,21 @@ class SubSubtest(object):
                                subsubtest_config):
         """
         Form subsubtest configuration by inheriting parent subtest config
+
+        Subsubtest options equal to the global default inherit the parent's
+        value instead.  The result is a copy-on-write view over a snapshot
+        of parent_config (a ``config.ConfigView``), so parent_config is
+        never modified, and changes made to it afterwards are not seen.
         """
-        self.config = parent_config  # a copy
-        # global defaults mixed in, even if overriden in parent :(
+        defaults = all_configs['DEFAULTS']
+        overrides = {}
         for key, val in subsubtest_config.items():
-            if key in all_configs['DEFAULTS']:
-                def_val = all_configs['DEFAULTS'][key]
-                par_val = parent_config[key]
-                if val == def_val:
-                    if par_val != def_val:
-                        # Parent overrides default, subsubtest inherited default
-                        self.config[key] = par_val
-                    else:
-                        # Parent uses default, subsubtest did not override
-                        self.config[key] = def_val
-                else:
-                    self.config[key] = val
-            else:
-                self.config[key] = val
-            self.logdebug("Config.: %s = %s", key, self.config[key])
+            # global defaults mixed in, even if overriden in parent :(
+            if key in defaults and val == defaults[key]:
+                continue
+            overrides[key] = val
+            self.logdebug("Config.: %s = %s", key, val)
+        self.config = config.ConfigView(overrides, parent_config.snapshot())
         return self.config
 
     def initialize(self):
@@ -486,7 +704,7 @@ class SubSubtestCaller(Subtest):
                 self.try_all_stages(name, subsubtest)
             finally:
                 try:
-                    subsubtest.cleanup()
+                    self.time_stage(name, 'cleanup', subsubtest.cleanup)
                 except Exception, detail:
                     self.logtraceback(name,
                                       sys.exc_info(),
@@ -533,13 +751,29 @@ class SubSubtestCaller(Subtest):
         Call ``method``, recording execution info. on exception.
         """
         try:
-            method()
+            self.time_stage(method.im_self.__class__.__name__,
+                            method.__name__, method)
         except Exception:
             # Log problem, don't add to run_subsubtests
             self.exception_info["error_source"] = method.func_name
             self.exception_info["exc_info"] = sys.exc_info()
             raise
 
+    def fan_out(self, function, items):
+        """
+        Call function on each item across up to ``subsubtest_concurrency``
+        threads, return once all calls finish.  Re-raise first exception
+        which escaped any call.
+
+        :param function: Callable accepting a single item as it's argument
+        :param items: Iterable of items to pass to function
+        """
+        concurrency = int(self.config.get('subsubtest_concurrency', 1))
+        failures = run_concurrently(function, items, concurrency)
+        if failures:
+            exc_info = failures[0]
+            raise exc_info[0], exc_info[1], exc_info[2]
+
     def import_if_not_loaded(self, name, pkg_path):
         """
         Import module only if module is not loaded.
@@ -598,7 +832,9 @@ class SubSubtestCallerSimultaneous(SubSubtestCaller):
     option.  Child subsubtest configuration section is formed by appending the
     child's subclass name onto the parent's ``config_section`` value.  Parent
     configuration is passed to subsubtest, with the subsubtest's section
-    overriding values with the same option name.
+    overriding values with the same option name.  Each method is called on
+    up to ``subsubtest_concurrency`` config. option subsubtests at the same
+    time, all calls finish before the next method begins.
     """
 
     #: Dictionary of subsubtests names to instances which successfully
@@ -616,60 +852,175 @@ class SubSubtestCallerSimultaneous(SubSubtestCaller):
 
     def initialize(self):
         super(SubSubtestCallerSimultaneous, self).initialize()
+        # Importing and loading config isn't thread-safe
         for name in self.subsubtest_names:
             subsubtest = self.new_subsubtest(name)
             if subsubtest is not None:
                 # Guarantee it's cleanup() runs
                 self.start_subsubtests[name] = subsubtest
-                try:
-                    subsubtest.initialize()
-                    # Allow run_once() on this subsubtest
-                    self.run_subsubtests[name] = subsubtest
-                except AutotestError, detail:
-                    # Log problem, don't add to run_subsubtests
-                    self.logtraceback(name, sys.exc_info(), "initialize",
-                                      detail)
+        self.fan_out(self.initialize_one,
+                     [(name, self.start_subsubtests[name])
+                      for name in self.subsubtest_names
+                      if name in self.start_subsubtests])
 
     def run_once(self):
         # DO NOT CALL superclass run_once() this variation works
         # completely differently!
-        for name, subsubtest in self.run_subsubtests.items():
-            try:
-                subsubtest.run_once()
-                # Allow postprocess()
-                self.post_subsubtests[name] = subsubtest
-            except AutotestError, detail:
-                # Log problem, don't add to post_subsubtests
-                self.logtraceback(name, sys.exc_info(), "run_once", detail)
+        self.fan_out(self.run_once_one, self.run_subsubtests.items())
 
     def postprocess(self):
         # DO NOT CALL superclass run_once() this variation works
         # completely differently!
         start_subsubtests = set(self.start_subsubtests.keys())
-        final_subsubtests = set()
-        for name, subsubtest in self.post_subsubtests.items():
-            try:
-                subsubtest.postprocess()
-                # Will form "passed" set
-                final_subsubtests.add(name)
-            except AutotestError, detail:
-                # Forms "failed" set by exclusion from final_subsubtests
-                self.logtraceback(name, sys.exc_info(), "postprocess",
-                                  detail)
-        if not final_subsubtests == start_subsubtests:
+        # Will form "passed" set
+        self.final_subsubtests = set()
+        self.fan_out(self.postprocess_one, self.post_subsubtests.items())
+        if not self.final_subsubtests == start_subsubtests:
             raise DockerTestFail('Sub-subtest failures: %s'
-                                 % str(start_subsubtests - final_subsubtests))
+                                 % str(start_subsubtests -
+                                       self.final_subsubtests))
 
     def cleanup(self):
-        super(SubSubtestCallerSimultaneous, self).cleanup()
         cleanup_failures = set()  # just for logging purposes
-        for name, subsubtest in self.start_subsubtests.items():
-            try:
-                subsubtest.cleanup()
-            except AutotestError, detail:
-                cleanup_failures.add(name)
-                self.logtraceback(name, sys.exc_info(), "cleanup",
-                                  detail)
+        self.fan_out(lambda name_subsubtest:
+                     self.cleanup_one(name_subsubtest, cleanup_failures),
+                     self.start_subsubtests.items())
+        # Subsubtests may still wait on their processes, reap them last
+        super(SubSubtestCallerSimultaneous, self).cleanup()
         if len(cleanup_failures) > 0:
             raise DockerTestError("Sub-subtest cleanup failures: %s"
                                   % cleanup_failures)
+
+    # Private methods don't need docstring, single dict/set updates are atomic
+    def initialize_one(self, name_subsubtest):  # pylint: disable=C0111
+        name, subsubtest = name_subsubtest
+        try:
+            self.time_stage(name, 'initialize', subsubtest.initialize)
+            # Allow run_once() on this subsubtest
+            self.run_subsubtests[name] = subsubtest
+        except AutotestError, detail:
+            # Log problem, don't add to run_subsubtests
+            self.logtraceback(name, sys.exc_info(), "initialize",
+                              detail)
+
+    def run_once_one(self, name_subsubtest):  # pylint: disable=C0111
+        name, subsubtest = name_subsubtest
+        try:
+            self.time_stage(name, 'run_once', subsubtest.run_once)
+            # Allow postprocess()
+            self.post_subsubtests[name] = subsubtest
+        except AutotestError, detail:
+            # Log problem, don't add to post_subsubtests
+            self.logtraceback(name, sys.exc_info(), "run_once", detail)
+
+    def postprocess_one(self, name_subsubtest):  # pylint: disable=C0111
+        name, subsubtest = name_subsubtest
+        try:
+            self.time_stage(name, 'postprocess', subsubtest.postprocess)
+            self.final_subsubtests.add(name)
+        except AutotestError, detail:
+            # Forms "failed" set by exclusion from final_subsubtests
+            self.logtraceback(name, sys.exc_info(), "postprocess",
+                              detail)
+
+    def cleanup_one(self, name_subsubtest, failures):  # pylint: disable=C0111
+        name, subsubtest = name_subsubtest
+        try:
+            self.time_stage(name, 'cleanup', subsubtest.cleanup)
+        except AutotestError, detail:
+            failures.add(name)
+            self.logtraceback(name, sys.exc_info(), "cleanup",
+                              detail)
+
+
+class SubSubtestCallerParallel(SubSubtestCaller):
+
+    """
+    Variation on SubSubtestCaller that runs subsubtests on a worker pool.
+
+    Like ``SubSubtestCaller``, each subsubtest executes all its stages
+    followed by ``cleanup``, however up to ``subsubtest_concurrency`` config.
+    option subsubtests do so at the same time.  Subsubtests sharing any
+    name from their ``exclusive_resources`` (class attribute and CSV config.
+    option) never run at the same time.  Subsubtests are loaded in
+    ``subsubtests`` order, before any of them run.
+    """
+
+    def __init__(self, *args, **dargs):
+        # Must exist before super-class assigns exception_info
+        self._local = threading.local()
+        #: Private, resource name to lock mapping, guarded by _resources_lock
+        self._resource_locks = {}
+        self._resources_lock = threading.Lock()
+        super(SubSubtestCallerParallel, self).__init__(*args, **dargs)
+
+    # Private methods don't need docstring
+    def _get_exception_info(self):  # pylint: disable=C0111
+        if not hasattr(self._local, 'exception_info'):
+            self._local.exception_info = {}
+        return self._local.exception_info
+
+    def _set_exception_info(self, value):  # pylint: disable=C0111
+        self._local.exception_info = value
+
+    #: Same as ``SubSubtestCaller.exception_info`` but private to each thread
+    exception_info = property(_get_exception_info, _set_exception_info)
+
+    def resource_locks(self, subsubtest):
+        """
+        Return list of locks to hold while running subsubtest, in sorted order
+
+        :param subsubtest: Instance of subsubtest or subclass, or None
+        """
+        if subsubtest is None:
+            return []
+        names = set(subsubtest.exclusive_resources)
+        csv = subsubtest.config.get('exclusive_resources')
+        if csv:
+            names |= set([name.strip() for name in csv.split(',')
+                          if name.strip()])
+        self._resources_lock.acquire()
+        try:
+            # Sorted acquisition order prevents deadlocks
+            return [self._resource_locks.setdefault(name, threading.Lock())
+                    for name in sorted(names)]
+        finally:
+            self._resources_lock.release()
+
+    def run_exclusive(self, name_subsubtest):
+        """
+        Call ``run_all_stages()`` while holding subsubtest's resource locks
+
+        :param name_subsubtest: Tuple of subsubtest name and instance or None
+        """
+        name, subsubtest = name_subsubtest
+        locks = self.resource_locks(subsubtest)
+        for lock in locks:
+            lock.acquire()
+        try:
+            # Single dict/set updates in run_all_stages() are atomic
+            self.run_all_stages(name, subsubtest)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def run_once(self):
+        """
+        Load all subsubtests (once each, even if named repeatedly), then run
+        them through ``run_exclusive()`` on up to ``subsubtest_concurrency``
+        threads.  Exceptions other than autotest-specific ones stop further
+        subsubtests from starting, and the first is re-raised once running
+        ones finish.
+        """
+        # DO NOT CALL SubSubtestCaller.run_once(), it runs them in order
+        super(SubSubtestCaller, self).run_once()
+        # Instances are tracked by name, each may only run once
+        names = []
+        for name in self.subsubtest_names:
+            if name in names:
+                self.logwarning("Ignoring duplicate subsubtest %s", name)
+            else:
+                names.append(name)
+        # Importing and loading config isn't thread-safe
+        subsubtests = [(name, self.new_subsubtest(name)) for name in names]
+        self.fan_out(self.run_exclusive, subsubtests)
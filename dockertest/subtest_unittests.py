@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+# Pylint runs from a different directory, it's fine to import this way
+# pylint: disable=W0403
+# There is magic requiring attributes defined outside the __init__
+# pylint: disable=W0201
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+
+
+# DO NOT allow this function to get loose in the wild!
+def mock(mod_path):
+    """
+    Recursivly inject tree of mocked modules from entire mod_path
+    """
+    name_list = mod_path.split('.')
+    child_name = name_list.pop()
+    child_mod = sys.modules.get(mod_path, types.ModuleType(child_name))
+    if len(name_list) == 0:  # child_name is left-most basic module
+        if child_name not in sys.modules:
+            sys.modules[child_name] = child_mod
+        return sys.modules[child_name]
+    else:
+        # New or existing child becomes parent
+        recurse_path = ".".join(name_list)
+        parent_mod = mock(recurse_path)
+        if not hasattr(sys.modules[recurse_path], child_name):
+            setattr(parent_mod, child_name, child_mod)
+            # full-name also points at child module
+            sys.modules[mod_path] = child_mod
+        return sys.modules[mod_path]
+
+
+# Mock module and class in one stroke
+setattr(mock('autotest.client.test'), 'test', object)
+# Mock module and exception class in one stroke
+setattr(mock('autotest.client.shared.error'), 'CmdError', Exception)
+setattr(mock('autotest.client.shared.error'), 'TestFail', Exception)
+setattr(mock('autotest.client.shared.error'), 'TestError', Exception)
+setattr(mock('autotest.client.shared.error'), 'TestNAError', Exception)
+setattr(mock('autotest.client.shared.error'), 'AutotestError', Exception)
+setattr(mock('autotest.client.shared.version'), 'get_version',
+                                               lambda :version.AUTOTESTVERSION)
+# Need all three for Subtest class
+mock('autotest.client.shared.base_job')
+mock('autotest.client.shared.job')
+mock('autotest.client.job')
+
+import version
+
+
+class RunConcurrently(unittest.TestCase):
+
+    def setUp(self):
+        import subtest
+        self.subtest = subtest
+        self.called = []
+
+    def record(self, item):
+        self.called.append(item)
+        if item == 'bad':
+            raise ValueError(item)
+
+    def test_serial_order(self):
+        failures = self.subtest.run_concurrently(self.record, [3, 1, 2], 1)
+        self.assertEqual(failures, [])
+        self.assertEqual(self.called, [3, 1, 2])
+
+    def test_serial_stops(self):
+        failures = self.subtest.run_concurrently(self.record,
+                                                 [1, 'bad', 2], 1)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0], ValueError)
+        self.assertEqual(self.called, [1, 'bad'])
+
+    def test_parallel_all(self):
+        failures = self.subtest.run_concurrently(self.record, range(20), 4)
+        self.assertEqual(failures, [])
+        self.assertEqual(sorted(self.called), range(20))
+
+    def test_parallel_bound(self):
+        lock = threading.Lock()
+        running = [0, 0]  # current, maximum
+
+        def busy(_):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running)
+            lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+
+        self.subtest.run_concurrently(busy, range(12), 3)
+        self.assertEqual(running[0], 0)
+        self.assertTrue(1 < running[1] <= 3)
+
+    def test_parallel_failure(self):
+        failures = self.subtest.run_concurrently(self.record, ['bad'], 4)
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0], ValueError)
+
+
+class SubSubtestCallerParallel(unittest.TestCase):
+
+    def setUp(self):
+        import subtest
+        cls = subtest.SubSubtestCallerParallel
+        # Skip Subtest.__init__, it needs a real autotest job
+        self.caller = cls.__new__(cls)
+        self.caller._local = threading.local()
+        self.caller._resource_locks = {}
+        self.caller._resources_lock = threading.Lock()
+        self.subsubtest = types.ModuleType('fake_subsubtest')
+        self.subsubtest.exclusive_resources = ('image:foo',)
+        self.subsubtest.config = {'exclusive_resources':
+                                  'daemon-restart, image:foo,'}
+
+    def test_resource_locks(self):
+        locks = self.caller.resource_locks(self.subsubtest)
+        self.assertEqual(len(locks), 2)
+        self.assertEqual(locks, [self.caller._resource_locks['daemon-restart'],
+                                 self.caller._resource_locks['image:foo']])
+        self.assertEqual(locks, self.caller.resource_locks(self.subsubtest))
+        self.assertEqual(self.caller.resource_locks(None), [])
+
+    def test_duplicate_names(self):
+        loaded = []
+        warnings = []
+        self.caller.subsubtest_names = ['foo', 'bar', 'foo']
+        self.caller.loginfo = lambda *args: None
+        self.caller.logwarning = lambda *args: warnings.append(args)
+        self.caller.new_subsubtest = lambda name: loaded.append(name)
+        self.caller.fan_out = lambda func, items: None
+        self.caller.run_once()
+        self.assertEqual(loaded, ['foo', 'bar'])
+        self.assertEqual(len(warnings), 1)
+
+    def test_exception_info(self):
+        self.caller.exception_info['foo'] = 'bar'
+        others = []
+        thread = threading.Thread(
+            target=lambda: others.append(dict(self.caller.exception_info)))
+        thread.start()
+        thread.join()
+        self.assertEqual(others, [{}])
+        self.assertEqual(self.caller.exception_info, {'foo': 'bar'})
+
+
+class MakeSubsubtestConfig(unittest.TestCase):
+
+    def test_inherit(self):
+        import subtest
+        cls = subtest.SubSubtest
+        # Skip SubSubtest.__init__, it needs a real parent subtest
+        subsubtest = cls.__new__(cls)
+        subsubtest.logdebug = lambda *args: None
+        all_configs = {'DEFAULTS': {'foo': 1, 'bar': 2, 'baz': 3}}
+        import config
+        parent_options = {'foo': 1, 'bar': 20, 'baz': 30, 'parent': True}
+        parent_config = config.ConfigView(parent_options)
+        subsubtest_config = {'foo': 10, 'bar': 2, 'baz': 3, 'child': True}
+        result = subsubtest.make_subsubtest_config(all_configs,
+                                                   parent_config,
+                                                   subsubtest_config)
+        self.assertTrue(result is subsubtest.config)
+        self.assertEqual(dict(result), {'foo': 10, 'bar': 20, 'baz': 30,
+                                        'parent': True, 'child': True})
+        result['bar'] = 200
+        del result['parent']
+        self.assertEqual(dict(parent_config), {'foo': 1, 'bar': 20,
+                                               'baz': 30, 'parent': True})
+        self.assertEqual(parent_options, {'foo': 1, 'bar': 20, 'baz': 30,
+                                          'parent': True})
+        # Snapshot, later parent changes don't leak into subsubtest
+        parent_config['baz'] = 300
+        parent_config['new'] = True
+        self.assertEqual(dict(result), {'foo': 10, 'bar': 200, 'baz': 30,
+                                        'child': True})
+
+
+class ReportLeaks(unittest.TestCase):
+
+    def test_report_leaks(self):
+        import subtest
+        import snapshot
+        cls = subtest.Subtest
+        # Skip Subtest.__init__, it needs a real autotest job
+        test = cls.__new__(cls)
+        keyvals = {}
+        warnings = []
+        test.write_test_keyval = keyvals.update
+        test.logwarning = lambda *args: warnings.append(args)
+        test.leak_snapshot = snapshot.Snapshot(['c1'], pool={'x_used': 1})
+        test.report_leaks(snapshot.Snapshot(['c1', 'c2'], ['i1'],
+                                            pool={'x_used': 3}))
+        self.assertEqual(keyvals, {'leaked.containers': 1,
+                                   'leaked.images': 1,
+                                   'leaked.volumes': 0,
+                                   'leaked.mounts': 0,
+                                   'leaked.daemon_fds': 0,
+                                   'leaked.pool.x_used': 2})
+        self.assertEqual(len(warnings), 3)
+
+
+class ReapAfterCleanup(unittest.TestCase):
+
+    def test_order(self):
+        import subtest
+        calls = []
+
+        class Leaky(subtest.Subtest):
+
+            def cleanup(self):
+                super(Leaky, self).cleanup()
+                calls.append('subclass')
+
+        # Skip Subtest.__init__, it needs a real autotest job
+        test = Leaky.__new__(Leaky)
+        test.loginfo = lambda *args: calls.append('base')
+        for name in ('reap_async_commands', 'record_command_cache',
+                     'flush_latency_history'):
+            setattr(test, name, lambda name=name: calls.append(name))
+        test._reap_after_cleanup()
+        self.assertEqual(test.cleanup.__name__, 'cleanup')
+        test.cleanup()
+        self.assertEqual(calls, ['base', 'subclass', 'reap_async_commands',
+                                 'record_command_cache',
+                                 'flush_latency_history'])
+
+
+class WriteLock(unittest.TestCase):
+
+    def test_concurrent_stages(self):
+        import subtest
+        writing = []
+        overlaps = []
+
+        class Recorder(object):
+
+            def write_test_keyval(self, attr_dict):
+                if writing:
+                    overlaps.append(attr_dict)
+                writing.append(attr_dict)
+                time.sleep(0.01)
+                writing.pop()
+
+        class Timed(subtest.Subtest, Recorder):
+            pass
+
+        class FakeJob(object):   # pylint: disable=R0903
+            resultdir = tempfile.mkdtemp(self.__class__.__name__)
+
+        # Skip Subtest.__init__, it needs a real autotest job
+        test = Timed.__new__(Timed)
+        test.job = FakeJob()
+        try:
+            failures = subtest.run_concurrently(
+                lambda name: test.time_stage(name, 'run_once', lambda: None),
+                ['sub%d' % number for number in xrange(8)], 8)
+            stage_times = open(os.path.join(test.job.resultdir,
+                                            subtest.STAGE_TIMES_FILE),
+                               'rb').readlines()
+        finally:
+            shutil.rmtree(test.job.resultdir, ignore_errors=True)
+        self.assertEqual(failures, [])
+        self.assertEqual(overlaps, [])
+        self.assertEqual(len(stage_times), 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
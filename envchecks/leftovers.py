@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+Check for leftover images, image layers, containers, and volumes
+
+Every listing is taken once, at the same time.  IDs (or names) are
+matched against the ignore CSV options by prefix through a sorted index,
+and every unexpected item is reported, not just the first.
+
+:Note: This module must _NOT_ depend on anything in dockertest package or
+       in autotest!
+"""
+
+import bisect
+import os
+import shlex
+import subprocess
+import sys
+
+
+class PrefixIndex(object):
+
+    """
+    Sorted set of prefixes, matching any string starting with one of them
+    """
+
+    def __init__(self, prefixes):
+        """
+        Initialize index from iterable of prefixes (blank ones ignored)
+        """
+        self.prefixes = []
+        for prefix in sorted(set(prefix.strip() for prefix in prefixes)):
+            if not prefix:
+                continue
+            # Covered by a shorter prefix, it would hide that one from bisect
+            if self.prefixes and prefix.startswith(self.prefixes[-1]):
+                continue
+            self.prefixes.append(prefix)
+
+    def __contains__(self, value):
+        # With no prefix of another, only the closest one <= value can match
+        index = bisect.bisect_right(self.prefixes, value) - 1
+        return index >= 0 and value.startswith(self.prefixes[index])
+
+
+def docker_popen(*args):
+    """
+    Return started docker client process with args, stdout piped
+    """
+    argv = ([os.environ['docker_path']] +
+            shlex.split(os.environ.get('docker_options', '')) + list(args))
+    # Client debug output (docker_options -D) goes to stderr
+    return subprocess.Popen(argv, stdout=subprocess.PIPE,
+                            stderr=open(os.devnull, 'wb'), close_fds=True)
+
+
+def listing(popen):
+    """
+    Return list of non-blank output lines from popen, or None if it failed
+    """
+    stdout = popen.communicate()[0]
+    if popen.returncode != 0:
+        return None
+    return [line.strip() for line in stdout.splitlines() if line.strip()]
+
+
+def ignore_index(option):
+    """
+    Return PrefixIndex from CSV configuration option (environment variable)
+    """
+    return PrefixIndex(os.environ.get(option, '').split(','))
+
+
+def leftovers():
+    """
+    Return list of messages describing each unexpected item found
+
+    :raises OSError: if docker images or docker ps can't be listed
+    """
+    # All listings run at the same time
+    images = docker_popen('images', '--all', '--no-trunc')
+    containers = docker_popen('ps', '--all', '--no-trunc', '--quiet')
+    volumes = docker_popen('volume', 'ls', '--quiet')
+    messages = []
+    lines = listing(images)
+    if lines is None:
+        raise OSError("Unable to list images")
+    ignore = ignore_index('envcheck_ignore_iids')
+    for line in lines[1:]:  # Skip header
+        fields = line.split()
+        if len(fields) < 3 or fields[2] in ignore:
+            continue
+        if fields[0] == '<none>' and fields[1] == '<none>':
+            messages.append("Found unexpected image layer: %s" % fields[2])
+        else:
+            messages.append("Found unexpected image: %s %s %s"
+                            % (fields[0], fields[1], fields[2]))
+    lines = listing(containers)
+    if lines is None:
+        raise OSError("Unable to list containers")
+    ignore = ignore_index('envcheck_ignore_cids')
+    for cid in lines:
+        if cid not in ignore:
+            messages.append("Found unexpected container: %s" % cid)
+    # Not supported by older docker versions
+    lines = listing(volumes) or []
+    ignore = ignore_index('envcheck_ignore_volumes')
+    for volume in lines:
+        if volume not in ignore:
+            messages.append("Found unexpected volume: %s" % volume)
+    return messages
+
+
+if __name__ == "__main__":
+    if not os.environ.get('docker_path'):
+        sys.exit(5)
+    try:
+        MESSAGES = leftovers()
+    except OSError, detail:
+        sys.stderr.write("%s\n" % detail)
+        sys.exit(4)
+    for message in MESSAGES:
+        sys.stderr.write("%s\n" % message)
+    if MESSAGES:
+        sys.exit(3)
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+r"""
+**Standalone** Merge results of a suite run sharded across several hosts.
+
+Each host runs the control file with ``--args shard=i/n``, producing it's own
+autotest results directory.  This combines their ``status`` files, job
+``keyval`` files, and per-subtest result directories into one directory,
+then prints a summary of all subtest results.
+
+:Note: This module must _NOT_ depend on anything in autotest!
+"""
+
+import os.path
+import sys
+from dockertest.scheduling import merge_shards
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print ("Usage: %s OUTPUT_DIR SHARD_RESULTS_DIR [SHARD_RESULTS_DIR...]"
+               "\n\nWhere OUTPUT_DIR must not exist, and each "
+               "SHARD_RESULTS_DIR is an\nautotest job results directory "
+               "(e.g. results/default) from one shard."
+               % os.path.basename(sys.argv[0]))
+        sys.exit(1)
+    all_results = merge_shards(sys.argv[1], sys.argv[2:])
+    for test_result in all_results:
+        print "%-8s %s (%s)" % (test_result[0], test_result[2], test_result[3])
+    failed = [test_result for test_result in all_results
+              if test_result[0] != 'GOOD']
+    print "%d subtests, %d not GOOD" % (len(all_results), len(failed))
+    if failed:
+        sys.exit(2)
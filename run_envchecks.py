@@ -5,6 +5,8 @@ r"""
 
 The [DEFAULTS] section from first loadable ini-file passed in as a parameter
 will be passed through as the environment variables to each executable.
+When ``envcheck_reuse`` is true and the docker daemon's state is unchanged
+since the last clean run, executables are skipped (see ``EnvCheckState``).
 
 :Note: This module must _NOT_ depend on anything in autotest!
 """
@@ -13,7 +15,7 @@ import sys
 import os.path
 # Avoid using dockertest.config, that's only for subtests to use
 from ConfigParser import SafeConfigParser
-from dockertest.environment import EnvCheck
+from dockertest.environment import EnvCheck, EnvCheckState
 
 #: Absolute path to directory containing this module
 MYDIR = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))
@@ -22,6 +24,9 @@ ENVCHECKSUBDIR = 'envchecks'
 
 ENVCHECKDIR = os.path.join(MYDIR, ENVCHECKSUBDIR)
 
+#: Daemon state of last clean run, see EnvCheckState
+STATEFILE = os.path.join(MYDIR, '.envcheck_state.json')
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print ("Usage: %s CONFIG_FILE [CONFIG_FILE...]\n\nWhere CONFIG_FILE(s) "
@@ -32,7 +37,17 @@ if __name__ == "__main__":
     scp = SafeConfigParser()
     # Stops at first successful load
     scp.read(sys.argv[1:])
-    good = EnvCheck(dict(scp.items('DEFAULTS')), ENVCHECKDIR)
+    config = dict(scp.items('DEFAULTS'))
+    state = None
+    if config.get('envcheck_reuse', 'no').strip().lower() in ('yes', 'true',
+                                                              'on', '1'):
+        state = EnvCheckState(STATEFILE, config, ENVCHECKDIR)
+        if state.unchanged():
+            print "Docker daemon state unchanged since last clean check"
+            sys.exit(0)
+    good = EnvCheck(config, ENVCHECKDIR)
     if not good:
         print good
         sys.exit(2)
+    if state is not None:
+        state.record()
@@ -9,10 +9,10 @@ Sub-subtest module used by dockerimport test
 # Okay to be less-strict for these cautions/warnings in subtests
 # pylint: disable=C0103,C0111,R0904,C0103
 
-import os, logging
-from autotest.client import utils
+import os, subprocess
 from dockertest import output
 from dockertest.subtest import SubSubtest
+from dockertest.xceptions import DockerTestError
 from dockertest.dockercmd import DockerCmd, NoFailDockerCmd
 from dockertest.images import DockerImages, DockerImage
 
@@ -36,7 +36,7 @@ class empty(SubSubtest):
         tar_command = "%s %s" % (tar_command, tar_options)
         subargs = ['-', self.sub_stuff['image_name_tag']]
         docker_command = DockerCmd(self.parent_subtest, 'import', subargs)
-        self.run_tar(tar_command, str(docker_command))
+        self.run_tar(tar_command, docker_command)
 
     def postprocess(self):
         super(empty, self).postprocess()
@@ -68,9 +68,18 @@ class empty(SubSubtest):
                 self.logwarning("Cleanup command failed: %s" % cmdresult)
 
     def run_tar(self, tar_command, dkr_command):
-        command = "%s | %s" % (tar_command, dkr_command)
+        # Tar output is handed to docker directly, no shell pipeline
+        tar = subprocess.Popen(tar_command, shell=True,
+                               stdout=subprocess.PIPE, close_fds=True)
+        try:
+            cmdresult = dkr_command.execute(tar.stdout)
+        finally:
+            tar.stdout.close()
+            tar.wait()
+        if tar.returncode != 0:
+            raise DockerTestError("Command '%s' exited %d"
+                                  % (tar_command, tar.returncode))
         # Free, instance-specific namespace
-        cmdresult = utils.run(command, ignore_status=True, verbose=False)
         self.sub_stuff['cmdresult'] = cmdresult
         self.loginfo("Command result: %s", cmdresult.stdout.strip())
         self.sub_stuff['result_id'] = cmdresult.stdout.strip()
@@ -33,7 +33,7 @@ SIGNAL_MAP = {1: 'HUP', 2: 'INT', 3: 'QUIT', 4: 'ILL', 5: 'TRAP', 6: 'ABRT',
 
 # Okay to be less-strict for these cautions/warnings in subtests
 # pylint: disable=C0103,C0111,R0904,C0103
-class kill(subtest.SubSubtestCaller):
+class kill(subtest.SubSubtestCallerParallel):
 
     """ Subtest caller """
     config_section = 'docker_cli/kill'
@@ -422,6 +422,9 @@ class stress(kill_base):
     5) analyze results
     """
 
+    # Floods the daemon with kills, two floods at once may exceed timeouts
+    exclusive_resources = ('kill-stress',)
+
     def _populate_kill_cmds(self, extra_subargs):
         sequence = self._create_kill_sequence()
         signals_set = set()
@@ -519,6 +522,9 @@ class parallel_stress(kill_base):
     6) analyze results
     """
 
+    # Same flood as stress, plus a fixed file on the host
+    exclusive_resources = ('kill-stress', 'file:/var/tmp/docker_kill_stress')
+
     def _populate_kill_cmds(self, extra_subargs):
         signals = [int(sig) for sig in self.config['kill_signals'].split()]
         signals = range(*signals)
@@ -26,7 +26,7 @@ from dockertest.dockercmd import NoFailDockerCmd
 
 # Okay to be less-strict for these cautions/warnings in subtests
 # pylint: disable=C0103,C0111,R0904,C0103
-class restart(subtest.SubSubtestCaller):
+class restart(subtest.SubSubtestCallerParallel):
 
     """ Subtest caller """
     config_section = 'docker_cli/restart'
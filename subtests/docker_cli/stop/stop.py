@@ -21,7 +21,7 @@ from dockertest.subtest import SubSubtest
 
 # Okay to be less-strict for these cautions/warnings in subtests
 # pylint: disable=C0103,C0111,R0904,C0103
-class stop(subtest.SubSubtestCaller):
+class stop(subtest.SubSubtestCallerParallel):
 
     """ Subtest caller """
     config_section = 'docker_cli/stop'
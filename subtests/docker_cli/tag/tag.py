@@ -27,12 +27,17 @@ from dockertest import xceptions
 # pylint: disable=C0103,C0111,R0904,C0103
 
 
-class tag(subtest.SubSubtestCaller):
+class tag(subtest.SubSubtestCallerParallel):
     config_section = 'docker_cli/tag'
 
 
 class tag_base(SubSubtest):
 
+    @property
+    def exclusive_resources(self):
+        # All tag the same image, cleanup removes tags by it's image ID
+        return ('image:%s' % DockerImage.full_name_from_defaults(self.config),)
+
     def check_image_exists(self, full_name):
         di = DockerImages(self.parent_subtest)
         return di.list_imgs_with_full_name(full_name)
@@ -28,7 +28,7 @@ from dockertest.xceptions import (DockerTestFail, DockerOutputError,
 
 # Okay to be less-strict for these cautions/warnings in subtests
 # pylint: disable=C0103,C0111,R0904,C0103
-class wait(subtest.SubSubtestCaller):
+class wait(subtest.SubSubtestCallerParallel):
 
     """ Subtest caller """
     config_section = 'docker_cli/wait'